@@ -1,115 +1,214 @@
-from models.bundle_details import BundleDetail, BundleWithProducts, AddProductToBundle
+import logging
+from models.bundle_details import AddProductToBundle, AddProductsToBundle
 from models.catalogs import Catalog
-from utils.mongodb import get_collection
+from utils.services import services
+from utils.catalog_cache import catalog_cache
+from utils.catalog_type_registry import catalog_type_registry, BUNDLE_TYPE, PRODUCT_TYPE
 from fastapi import HTTPException
 from bson import ObjectId
-from pipelines import (
-    get_bundle_with_catalog_type_pipeline,
-    get_bundle_products_pipeline,
-    get_bundle_validation_pipeline,
-    get_product_validation_pipeline,
-    get_bundle_detail_with_product_pipeline,
-    check_existing_product_in_bundle_pipeline
-)
-
-bundle_details_coll = get_collection("bundle_details")
-catalogs_coll = get_collection("catalogs")
-catalog_types_coll = get_collection("catalogtypes")
-
-async def get_bundle_with_products(bundle_id: str) -> BundleWithProducts:
+from pipelines import get_bundle_detail_with_product_pipeline
+
+logger = logging.getLogger(__name__)
+
+bundle_details_coll = services.collection("bundle_details")
+catalogs_coll = services.collection("catalogs")
+
+COMPOSITION_MAX_RETRIES = 5
+
+def refresh_bundle_composition(bundle_id: str) -> None:
+    """
+    Materializar en el documento del bundle sus componentes (bundle_items).
+    El valor de los componentes lo calcula bundle_pricing con los descuentos.
+    composition_rev evita que dos recálculos concurrentes se pisen: si otro
+    escribió antes, se repite.
+    """
+    for _ in range(COMPOSITION_MAX_RETRIES):
+        bundle = catalogs_coll.find_one({"_id": ObjectId(bundle_id)}, {"composition_rev": 1})
+        if bundle is None:
+            return
+        rev = bundle.get("composition_rev")
+
+        details = list(bundle_details_coll.find({"id_bundle": bundle_id}))
+        product_ids = [ObjectId(d["id_producto"]) for d in details if ObjectId.is_valid(d["id_producto"])]
+        products = {
+            str(p["_id"]): p
+            for p in catalogs_coll.find(
+                {"_id": {"$in": product_ids}},
+                {"name": 1, "description": 1, "cost": 1, "active": 1}
+            )
+        }
+
+        items = []
+        for detail in details:
+            product = products.get(detail["id_producto"])
+            if product is None:
+                continue
+            items.append({
+                "bundle_detail_id": str(detail["_id"]),
+                "id_producto": detail["id_producto"],
+                "quantity": detail["quantity"],
+                "product_name": product["name"],
+                "product_description": product["description"],
+                "product_cost": product["cost"],
+                "product_active": product.get("active", True)
+            })
+        result = catalogs_coll.update_one(
+            {"_id": ObjectId(bundle_id), "composition_rev": rev},
+            {
+                "$set": {"bundle_items": items},
+                "$inc": {"composition_rev": 1}
+            }
+        )
+        if result.matched_count:
+            return
+    logger.warning(f"Bundle {bundle_id} composition not refreshed after {COMPOSITION_MAX_RETRIES} attempts")
+
+def refresh_bundles_containing(product_id: str) -> None:
+    """Recalcular los bundles que incluyen el producto (tras cambiar su nombre o precio)"""
+    for bundle_id in bundle_details_coll.distinct("id_bundle", {"id_producto": product_id}):
+        refresh_bundle_composition(bundle_id)
+
+def refresh_all_bundle_compositions() -> None:
+    for bundle_id in bundle_details_coll.distinct("id_bundle"):
+        refresh_bundle_composition(bundle_id)
+
+def backfill_bundle_compositions() -> int:
+    """
+    Materializar la composición de los bundles creados antes de bundle_items.
+    Se ejecuta al arrancar (antes de construir el snapshot) para que las
+    lecturas nunca tengan que escribir.
+    """
+    type_ids = catalog_type_registry.ids_for(BUNDLE_TYPE)
+    if not type_ids:
+        return 0
+
+    missing = [
+        str(doc["_id"])
+        for doc in catalogs_coll.find(
+            {"id_catalog_type": {"$in": type_ids}, "bundle_items": {"$exists": False}},
+            {"_id": 1}
+        )
+    ]
+    for bundle_id in missing:
+        refresh_bundle_composition(bundle_id)
+    if missing:
+        # Una sola invalidación para todos los bundles recalculados
+        catalog_cache.invalidate()
+        logger.info(f"Backfilled composition of {len(missing)} bundles")
+    return len(missing)
+
+async def get_bundle_with_products(bundle_id: str) -> dict:
     """Obtener información completa del bundle con todos sus productos"""
     try:
-        # Verificar que el bundle existe y es de tipo "bundle" usando pipeline
-        pipeline = get_bundle_with_catalog_type_pipeline(bundle_id)
-        bundle_result = list(catalogs_coll.aggregate(pipeline))
+        # Bundle y composición salen del snapshot del catálogo, sin consultas
+        snapshot = catalog_cache.get()
+        bundle = snapshot.get_product(bundle_id)
 
-        if not bundle_result:
+        if bundle is None or bundle["catalog_type_description"].lower() != BUNDLE_TYPE:
             raise HTTPException(status_code=404, detail="Bundle no encontrado o no es de tipo bundle")
 
-        bundle = bundle_result[0]
-
-        # Obtener los productos del bundle usando pipeline optimizada
-        products_pipeline = get_bundle_products_pipeline(bundle_id)
-        products = list(bundle_details_coll.aggregate(products_pipeline))
-
-        # Crear respuesta completa
-        bundle_response = BundleWithProducts(
-            id=str(bundle["_id"]),
-            id_catalog_type=str(bundle["id_catalog_type"]),
-            name=bundle["name"],
-            description=bundle["description"],
-            cost=bundle["cost"],
-            discount=bundle.get("discount", 0),
-            active=bundle.get("active", True),
-            products=products
-        )
-
-        return bundle_response
+        # Sin composición materializada (la completa backfill_bundle_compositions
+        # al arrancar) se responde vacía: un GET no escribe en la base de datos
+        # Dict plano: el modelo se valida una sola vez en la caché de respuestas
+        return {
+            "id": bundle["id"],
+            "id_catalog_type": bundle["id_catalog_type"],
+            "name": bundle["name"],
+            "description": bundle["description"],
+            "cost": bundle["cost"],
+            "discount": bundle["discount"],
+            "active": bundle["active"],
+            "pricing": snapshot.pricing.get(bundle_id),
+            "products": snapshot.get_bundle_lines(bundle_id)
+        }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bundle with products: {str(e)}")
 
+async def get_bundles_pricing() -> dict:
+    """Valor de los componentes, ahorro y descuento efectivo de todos los bundles"""
+    try:
+        snapshot = catalog_cache.get()
+        bundles = [
+            {
+                "id": bundle_id,
+                "name": snapshot.products[bundle_id]["name"],
+                "active": snapshot.products[bundle_id]["active"],
+                **pricing
+            }
+            for bundle_id, pricing in snapshot.pricing.items()
+        ]
+        return {"bundles": bundles, "total": len(bundles)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing bundle pricing: {str(e)}")
+
+def _find_active_products(product_ids: list[str]) -> dict[str, dict]:
+    """
+    Productos activos de tipo 'products' con una sola consulta $in; los ids
+    de tipo salen del registro en memoria, sin $lookup a catalogtypes.
+    """
+    type_ids = catalog_type_registry.ids_for(PRODUCT_TYPE)
+    object_ids = [ObjectId(product_id) for product_id in product_ids if ObjectId.is_valid(product_id)]
+    if not type_ids or not object_ids:
+        return {}
+
+    return {
+        str(doc["_id"]): doc
+        for doc in catalogs_coll.find(
+            {"_id": {"$in": object_ids}, "active": True, "id_catalog_type": {"$in": type_ids}},
+            {"name": 1, "cost": 1}
+        )
+    }
+
+def _validate_bundle(bundle_id: str) -> dict:
+    """Bundle existente, activo y de tipo bundle: una sonda por _id"""
+    bundle = None
+    type_ids = catalog_type_registry.ids_for(BUNDLE_TYPE)
+    if type_ids and ObjectId.is_valid(bundle_id):
+        bundle = catalogs_coll.find_one(
+            {"_id": ObjectId(bundle_id), "active": True, "id_catalog_type": {"$in": type_ids}},
+            {"name": 1}
+        )
+    if bundle is None:
+        raise HTTPException(status_code=404, detail="Bundle no encontrado, inactivo o no es de tipo bundle")
+    return bundle
+
 async def add_product_to_bundle(bundle_id: str, product_data: AddProductToBundle) -> dict:
     """Agregar un producto al bundle"""
+    from pymongo import ReturnDocument
+
     try:
         # Verificar que no se esté agregando el mismo bundle como producto (evitar recursión)
         if product_data.id_producto == bundle_id:
             raise HTTPException(status_code=400, detail="Cannot add bundle to itself")
 
-        # Validar bundle (existe, activo y es de tipo bundle) en una sola pipeline
-        bundle_pipeline = get_bundle_validation_pipeline(bundle_id)
-        bundle_result = list(catalogs_coll.aggregate(bundle_pipeline))
-
-        if not bundle_result:
-            raise HTTPException(status_code=404, detail="Bundle no encontrado, inactivo o no es de tipo bundle")
+        _validate_bundle(bundle_id)
 
-        bundle = bundle_result[0]
-
-        # Validar producto (existe, activo y es de tipo producto) en una sola pipeline
-        product_pipeline = get_product_validation_pipeline(product_data.id_producto)
-        product_result = list(catalogs_coll.aggregate(product_pipeline))
-
-        if not product_result:
+        product = _find_active_products([product_data.id_producto]).get(product_data.id_producto)
+        if product is None:
             raise HTTPException(status_code=404, detail="Producto no encontrado, inactivo o no es de tipo producto")
 
-        product = product_result[0]
-
-        # Verificar si el producto ya existe en el bundle usando pipeline
-        existing_pipeline = check_existing_product_in_bundle_pipeline(bundle_id, product_data.id_producto)
-        existing_result = list(bundle_details_coll.aggregate(existing_pipeline))
+        # $inc con upsert sobre el índice único (id_bundle, id_producto): crea la
+        # línea o suma la cantidad de forma atómica, sin leer antes
+        detail = bundle_details_coll.find_one_and_update(
+            {"id_bundle": bundle_id, "id_producto": product_data.id_producto},
+            {"$inc": {"quantity": product_data.quantity}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
 
-        if existing_result:
-            # Actualizar cantidad si ya existe
-            existing_detail = existing_result[0]
-            new_quantity = existing_detail["quantity"] + product_data.quantity
-            bundle_details_coll.update_one(
-                {"_id": ObjectId(existing_detail["bundle_detail_id"])},
-                {"$set": {"quantity": new_quantity}}
-            )
-            detail_id = existing_detail["bundle_detail_id"]
-            final_quantity = new_quantity
-        else:
-            # Crear nuevo detalle del bundle
-            bundle_detail = BundleDetail(
-                id_bundle=bundle_id,
-                id_producto=product_data.id_producto,
-                quantity=product_data.quantity
-            )
-            
-            bundle_detail_dict = bundle_detail.model_dump(exclude={"id"})
-            inserted = bundle_details_coll.insert_one(bundle_detail_dict)
-            detail_id = str(inserted.inserted_id)
-            final_quantity = product_data.quantity
+        refresh_bundle_composition(bundle_id)
+        catalog_cache.invalidate()
 
         # Retornar información del producto agregado
         return {
             "message": "Product added to bundle successfully",
-            "bundle_detail_id": detail_id,
+            "bundle_detail_id": str(detail["_id"]),
             "bundle_id": bundle_id,
             "product_id": product_data.id_producto,
             "product_name": product["name"],
-            "quantity": final_quantity,
+            "quantity": detail["quantity"],
             "product_cost": product["cost"]
         }
 
@@ -118,6 +217,84 @@ async def add_product_to_bundle(bundle_id: str, product_data: AddProductToBundle
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding product to bundle: {str(e)}")
 
+async def add_products_to_bundle(bundle_id: str, products_data: AddProductsToBundle) -> dict:
+    """Agregar varios productos al bundle en una sola operación"""
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    try:
+        # Las líneas repetidas en la petición se suman
+        quantities: dict[str, int] = {}
+        for item in products_data.items:
+            quantities[item.id_producto] = quantities.get(item.id_producto, 0) + item.quantity
+
+        if bundle_id in quantities:
+            raise HTTPException(status_code=400, detail="Cannot add bundle to itself")
+
+        _validate_bundle(bundle_id)
+
+        products = _find_active_products(list(quantities))
+        missing = [product_id for product_id in quantities if product_id not in products]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Productos no encontrados, inactivos o no son de tipo producto: {', '.join(missing)}"
+            )
+
+        operations = [
+            UpdateOne(
+                {"id_bundle": bundle_id, "id_producto": product_id},
+                {"$inc": {"quantity": quantity}},
+                upsert=True
+            )
+            for product_id, quantity in quantities.items()
+        ]
+        try:
+            result = bundle_details_coll.bulk_write(operations, ordered=False)
+            inserted, updated = result.upserted_count, result.modified_count
+        except BulkWriteError as e:
+            # Dos upserts simultáneos de la misma línea: el perdedor choca con el
+            # índice único y se reintenta, ya como actualización
+            failed = [error["index"] for error in e.details["writeErrors"] if error["code"] == 11000]
+            if len(failed) != len(e.details["writeErrors"]):
+                raise
+            retry = bundle_details_coll.bulk_write([operations[i] for i in failed], ordered=False)
+            inserted = e.details["nUpserted"] + retry.upserted_count
+            updated = e.details["nModified"] + retry.modified_count
+
+        refresh_bundle_composition(bundle_id)
+        catalog_cache.invalidate()
+
+        final = {
+            doc["id_producto"]: doc["quantity"]
+            for doc in bundle_details_coll.find(
+                {"id_bundle": bundle_id, "id_producto": {"$in": list(quantities)}},
+                {"id_producto": 1, "quantity": 1}
+            )
+        }
+
+        return {
+            "message": "Products added to bundle successfully",
+            "bundle_id": bundle_id,
+            "inserted": inserted,
+            "updated": updated,
+            "products": [
+                {
+                    "product_id": product_id,
+                    "product_name": products[product_id]["name"],
+                    "added_quantity": quantity,
+                    "quantity": final.get(product_id, quantity),
+                    "product_cost": products[product_id]["cost"]
+                }
+                for product_id, quantity in quantities.items()
+            ]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding products to bundle: {str(e)}")
+
 async def remove_product_from_bundle(bundle_id: str, bundle_detail_id: str) -> dict:
     """Remover un producto del bundle"""
     try:
@@ -136,6 +313,9 @@ async def remove_product_from_bundle(bundle_id: str, bundle_detail_id: str) -> d
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Product not found in bundle")
 
+        refresh_bundle_composition(bundle_id)
+        catalog_cache.invalidate()
+
         return {
             "message": "Product removed from bundle successfully",
             "bundle_id": bundle_detail["id_bundle"],
@@ -1,70 +1,103 @@
+import os
+import csv
+import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from pydantic import ValidationError
 from models.catalogs import Catalog
 from models.catalogtypes import CatalogType
-from utils.mongodb import get_collection
+from utils.services import services
+from utils.mongodb import is_duplicate_key_error
+from utils.catalog_cache import catalog_cache
+from utils.catalog_type_registry import catalog_type_registry
+from utils.indexes import NAME_COLLATION
+from utils.event_hub import event_hub, sse_stream, parse_last_event_id
+from utils.task_queue import task_queue
+from controllers.catalogtypes import adjust_product_count, reconcile_product_counters
+from controllers.bundle_details import refresh_bundles_containing, refresh_all_bundle_compositions
 from fastapi import HTTPException
 from bson import ObjectId
 from pipelines.catalog_pipelines import (
-    validate_catalog_type_pipeline,
     get_catalog_with_type_pipeline,
     get_catalogs_by_type_pipeline,
-    get_all_catalogs_with_types_pipeline
+    search_catalogs_pipeline
 )
 
-coll = get_collection("catalogs")
-catalog_types_coll = get_collection("catalogtypes")
+logger = logging.getLogger(__name__)
 
-async def create_catalog(catalog: Catalog) -> Catalog:
-    try:
+coll = services.collection("catalogs")
+
+CATALOG_TOPIC = "catalog"
+
+# Con el change stream activo (requiere replica set) los eventos llegan desde
+# MongoDB a todos los workers y los controladores no los publican
+CATALOG_CHANGE_STREAM = os.getenv("CATALOG_CHANGE_STREAM", "0") == "1"
+
+def publish_catalog_event(event_type: str, data: dict) -> None:
+    if not CATALOG_CHANGE_STREAM:
+        event_hub.publish(CATALOG_TOPIC, event_type, data)
+
+def refresh_bundles_and_cache(product_id: str = None) -> None:
+    """
+    Tarea en segundo plano: recalcular la composición embebida de los bundles
+    (los que contienen `product_id`, o todos) y publicar el nuevo snapshot.
+    """
+    if product_id is None:
+        refresh_all_bundle_compositions()
+    else:
+        refresh_bundles_containing(product_id)
+    catalog_cache.invalidate()
 
-        # Validar que el catalog_type existe y está activo usando pipeline
-        catalog_type_pipeline = validate_catalog_type_pipeline(catalog.id_catalog_type)
-        catalog_type_result = list(catalog_types_coll.aggregate(catalog_type_pipeline))
+def _name_taken(name: str, exclude_id: str = None) -> bool:
+    """
+    Nombre ya usado (sin distinguir mayúsculas). El índice único
+    catalogs_name_unique_ci es la garantía atómica; esta consulta cubre el caso
+    en que el índice no existe (aún no creado o bloqueado por duplicados).
+    """
+    query = {"name": name}
+    if exclude_id is not None:
+        query["_id"] = {"$ne": ObjectId(exclude_id)}
+    return coll.find_one(query, {"_id": 1}, collation=NAME_COLLATION) is not None
 
-        if not catalog_type_result:
+async def create_catalog(catalog: Catalog) -> Catalog:
+    try:
+        # Validar que el catalog_type existe y está activo (registro en memoria)
+        catalog_type = catalog_type_registry.get(catalog.id_catalog_type)
+        if not catalog_type or not catalog_type["active"]:
             raise HTTPException(status_code=400, detail="Catalog type not found or inactive")
 
         catalog.name = catalog.name.strip()
         catalog.description = catalog.description.strip()
 
-        # Verificar si ya existe un catálogo con el mismo nombre
-        existing_catalog = coll.find_one({"name": {"$regex": f"^{catalog.name}$", "$options": "i"}})
-        if existing_catalog:
+        if _name_taken(catalog.name):
             raise HTTPException(status_code=400, detail="Catalog with this name already exists")
 
+        # El índice único catalogs_name_unique_ci rechaza además las altas
+        # simultáneas con el mismo nombre (sin distinguir mayúsculas)
         catalog_dict = catalog.model_dump(exclude={"id"})
         inserted = coll.insert_one(catalog_dict)
         catalog.id = str(inserted.inserted_id)
+        adjust_product_count(catalog.id_catalog_type, 1)
+        catalog_cache.invalidate()
+        publish_catalog_event("created", catalog.model_dump())
         return catalog
     except HTTPException:
         raise
     except Exception as e:
+        if is_duplicate_key_error(e):
+            raise HTTPException(status_code=400, detail="Catalog with this name already exists")
         raise HTTPException(status_code=500, detail=f"Error creating catalog: {str(e)}")
 
-async def get_catalogs() -> list[Catalog]:
-    try:
-        catalogs = []
-        for doc in coll.find():
-            # Mapear _id a id para el modelo Pydantic
-            doc['id'] = str(doc['_id'])
-            del doc['_id']
-            catalog = Catalog(**doc)
-            catalogs.append(catalog)
-        return catalogs
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching catalogs: {str(e)}")
-
 async def get_catalogs(skip: int = 0, limit: int = 10) -> dict:
     try:
-        # Usar pipeline optimizada para obtener catálogos con información del tipo
-        pipeline = get_all_catalogs_with_types_pipeline(skip, limit)
-        catalogs = list(coll.aggregate(pipeline))
-
-        # Contar total de documentos para paginación
-        total_count = coll.count_documents({"active": True})
+        # Servido desde el snapshot en memoria, sin consultar MongoDB
+        snapshot = catalog_cache.get()
 
         return {
-            "catalogs": catalogs,
-            "total": total_count,
+            "catalogs": snapshot.listing[skip:skip + limit],
+            "total": snapshot.active_count,
             "skip": skip,
             "limit": limit
         }
@@ -73,70 +106,71 @@ async def get_catalogs(skip: int = 0, limit: int = 10) -> dict:
 
 async def get_catalog_by_id(catalog_id: str) -> dict:
     try:
-        # Usar pipeline para obtener catálogo con información del tipo
-        pipeline = get_catalog_with_type_pipeline(catalog_id)
-        catalog_result = list(coll.aggregate(pipeline))
-        
-        if not catalog_result:
+        catalog = catalog_cache.get().get_product(catalog_id)
+
+        if catalog is None:
             raise HTTPException(status_code=404, detail="Catalog not found")
-            
-        return catalog_result[0]
+
+        return catalog
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching catalog: {str(e)}")
 
-async def get_catalogs_by_type(catalog_type_description: str, skip: int = 0, limit: int = 10) -> dict:
+async def search_catalogs(query: str, skip: int = 0, limit: int = 10, fuzzy: bool = False) -> dict:
     try:
-        # Usar pipeline optimizada para obtener catálogos por tipo
-        pipeline = get_catalogs_by_type_pipeline(catalog_type_description, skip, limit)
-        catalogs = list(coll.aggregate(pipeline))
-        
-        # Contar total para paginación
-        count_pipeline = [
-            {"$addFields": {"id_catalog_type_obj": {"$toObjectId": "$id_catalog_type"}}},
-            {"$lookup": {
-                "from": "catalogtypes",
-                "localField": "id_catalog_type_obj", 
-                "foreignField": "_id",
-                "as": "catalog_type"
-            }},
-            {"$unwind": "$catalog_type"},
-            {"$match": {
-                "catalog_type.description": {"$regex": f"^{catalog_type_description}$", "$options": "i"},
-                "active": True
-            }},
-            {"$count": "total"}
-        ]
-        
-        count_result = list(coll.aggregate(count_pipeline))
-        total_count = count_result[0]["total"] if count_result else 0
-        
+        query = query.strip()
+
+        if fuzzy:
+            # Índice invertido sobre el snapshot: tolera errores de escritura
+            results = catalog_cache.get().search_index.search(query)
+            catalogs = results[skip:skip + limit]
+        else:
+            # Índice de texto de MongoDB con relevancia (textScore)
+            catalogs = list(coll.aggregate(search_catalogs_pipeline(query, skip, limit)))
+
         return {
             "catalogs": catalogs,
-            "total": total_count,
+            "query": query,
+            "fuzzy": fuzzy,
             "skip": skip,
-            "limit": limit,
-            "catalog_type": catalog_type_description
+            "limit": limit
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching catalogs by type: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching catalogs: {str(e)}")
+
+def fetch_catalog(catalog_id: str) -> dict:
+    """Leer el catálogo directamente de MongoDB (respuesta de las escrituras)"""
+    pipeline = get_catalog_with_type_pipeline(catalog_id)
+    catalog_result = list(coll.aggregate(pipeline))
+
+    if not catalog_result:
+        raise HTTPException(status_code=404, detail="Catalog not found")
+
+    return catalog_result[0]
 
-async def get_catalogs_by_type(catalog_type_id: str) -> list[Catalog]:
+async def get_catalogs_by_type(catalog_type: str, skip: int = 0, limit: int = 10) -> dict:
+    """Catálogos activos de un tipo, indicado por su id o por su descripción"""
     try:
-        # Validar que el catalog_type existe
-        catalog_type = catalog_types_coll.find_one({"_id": ObjectId(catalog_type_id)})
-        if not catalog_type:
+        if ObjectId.is_valid(catalog_type):
+            type_ids = [catalog_type] if catalog_type_registry.get(catalog_type) else []
+        else:
+            type_ids = catalog_type_registry.ids_for(catalog_type)
+
+        if not type_ids:
             raise HTTPException(status_code=404, detail="Catalog type not found")
 
-        catalogs = []
-        for doc in coll.find({"id_catalog_type": catalog_type_id}):
-            # Mapear _id a id para el modelo Pydantic
-            doc['id'] = str(doc['_id'])
-            del doc['_id']
-            catalog = Catalog(**doc)
-            catalogs.append(catalog)
-        return catalogs
+        pipeline = get_catalogs_by_type_pipeline(type_ids, skip, limit)
+        result = list(coll.aggregate(pipeline))[0]
+        total_count = result["total"][0]["total"] if result["total"] else 0
+
+        return {
+            "catalogs": result["catalogs"],
+            "total": total_count,
+            "skip": skip,
+            "limit": limit,
+            "catalog_type": catalog_type
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -145,32 +179,39 @@ async def get_catalogs_by_type(catalog_type_id: str) -> list[Catalog]:
 async def update_catalog(catalog_id: str, catalog: Catalog) -> Catalog:
     try:
         # Validar que el catalog_type existe
-        catalog_type = catalog_types_coll.find_one({"_id": ObjectId(catalog.id_catalog_type)})
-        if not catalog_type:
+        if not catalog_type_registry.get(catalog.id_catalog_type):
             raise HTTPException(status_code=400, detail="Catalog type not found")
 
         catalog.name = catalog.name.strip()
         catalog.description = catalog.description.strip()
 
-        # Verificar si ya existe otro catálogo con el mismo nombre
-        existing_catalog = coll.find_one({
-            "name": {"$regex": f"^{catalog.name}$", "$options": "i"},
-            "_id": {"$ne": ObjectId(catalog_id)}
-        })
-        if existing_catalog:
+        if ObjectId.is_valid(catalog_id) and _name_taken(catalog.name, exclude_id=catalog_id):
             raise HTTPException(status_code=400, detail="Catalog with this name already exists")
 
-        result = coll.update_one(
+        # find_one_and_update devuelve el documento previo para saber si cambió el tipo
+        previous = coll.find_one_and_update(
             {"_id": ObjectId(catalog_id)},
-            {"$set": catalog.model_dump(exclude={"id"})}
+            {"$set": catalog.model_dump(exclude={"id"})},
+            projection={"id_catalog_type": 1}
         )
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Catalog not found")
 
-        return await get_catalog_by_id(catalog_id)
+        if previous.get("id_catalog_type") != catalog.id_catalog_type:
+            adjust_product_count(previous["id_catalog_type"], -1)
+            adjust_product_count(catalog.id_catalog_type, 1)
+
+        # Nombre o precio embebidos en los bundles que contienen este producto
+        task_queue.enqueue(refresh_bundles_and_cache, catalog_id)
+        catalog_cache.invalidate()
+        updated = fetch_catalog(catalog_id)
+        publish_catalog_event("updated", updated)
+        return updated
     except HTTPException:
         raise
     except Exception as e:
+        if is_duplicate_key_error(e):
+            raise HTTPException(status_code=400, detail="Catalog with this name already exists")
         raise HTTPException(status_code=500, detail=f"Error updating catalog: {str(e)}")
 
 async def deactivate_catalog(catalog_id: str) -> Catalog:
@@ -182,9 +223,287 @@ async def deactivate_catalog(catalog_id: str) -> Catalog:
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Catalog not found")
 
-        return await get_catalog_by_id(catalog_id)
+        task_queue.enqueue(refresh_bundles_and_cache, catalog_id)
+        catalog_cache.invalidate()
+        deactivated = fetch_catalog(catalog_id)
+        publish_catalog_event("deactivated", deactivated)
+        return deactivated
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deactivating catalog: {str(e)}")
 
+
+# ============================================================================
+# FEED DE CAMBIOS (SSE)
+# ============================================================================
+
+def catalog_event_stream(last_event_id: str = None):
+    """Flujo SSE de cambios del menú, reanudable con Last-Event-ID"""
+    return sse_stream(event_hub, CATALOG_TOPIC, parse_last_event_id(last_event_id))
+
+def _change_to_event(change: dict) -> tuple[str, dict] | None:
+    """Traducir un evento del change stream al formato del feed"""
+    operation = change["operationType"]
+    catalog_id = str(change["documentKey"]["_id"])
+
+    if operation == "delete":
+        return "deleted", {"id": catalog_id}
+    if operation not in ("insert", "update", "replace"):
+        return None
+
+    doc = change.get("fullDocument")
+    if doc is None:
+        return None
+    data = {
+        "id": catalog_id,
+        "id_catalog_type": doc.get("id_catalog_type"),
+        "name": doc.get("name"),
+        "description": doc.get("description"),
+        "cost": doc.get("cost"),
+        "discount": doc.get("discount", 0),
+        "active": doc.get("active", True)
+    }
+
+    if operation == "insert":
+        return "created", data
+    updated_fields = change.get("updateDescription", {}).get("updatedFields", {})
+    if updated_fields.get("active") is False and set(updated_fields) == {"active"}:
+        return "deactivated", data
+    return "updated", data
+
+async def run_catalog_change_stream() -> None:
+    """Leer el change stream de catalogs y publicar en el hub (CATALOG_CHANGE_STREAM=1)"""
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+
+    def watch():
+        resume_token = None
+        while not stop.is_set():
+            try:
+                with coll.watch(
+                    full_document="updateLookup",
+                    resume_after=resume_token,
+                    max_await_time_ms=1000
+                ) as stream:
+                    while not stop.is_set():
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        event = _change_to_event(change) if change else None
+                        if event:
+                            event_hub.publish_threadsafe(loop, CATALOG_TOPIC, *event, forward=False)
+            except Exception as e:
+                logger.error(f"Catalog change stream failed: {e}")
+                stop.wait(5)
+
+    try:
+        await asyncio.to_thread(watch)
+    finally:
+        stop.set()
+
+
+
+# ============================================================================
+# IMPORTACIÓN MASIVA
+# ============================================================================
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_REPORTED_ERRORS = 500
+
+async def _iter_lines(chunks):
+    """Partir el cuerpo de la petición en líneas a medida que llega"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+class _LineFeed:
+    """Líneas pendientes para un csv.reader que se alimenta a medida que llegan"""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        # El salto se conserva para los campos entre comillas de varias líneas
+        return self.lines.popleft() + "\n"
+
+async def _iter_rows(chunks, fmt: str):
+    """Filas (número de línea, dict) de un CSV con encabezado o de un NDJSON"""
+    header = None
+    line_number = 0
+    # Un único reader para todo el archivo: un registro CSV puede ocupar
+    # varias líneas si un campo entre comillas contiene saltos
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    record_start = None
+    quotes = 0
+    async for line in _iter_lines(chunks):
+        line_number += 1
+        if line_number == 1:
+            line = line.lstrip("\ufeff")
+        if record_start is None and not line.strip():
+            continue
+
+        if fmt == "ndjson":
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e.msg}")
+                continue
+            if not isinstance(row, dict):
+                yield line_number, ValueError("Each line must be a JSON object")
+                continue
+            yield line_number, row
+            continue
+
+        feed.lines.append(line)
+        if record_start is None:
+            record_start = line_number
+        # Con comillas impares el campo sigue abierto en la línea siguiente
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+
+        row_number, record_start, quotes = record_start, None, 0
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            yield row_number, ValueError(f"Invalid CSV: {e}")
+            continue
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        # Las celdas vacías se omiten para que apliquen los valores por defecto
+        yield row_number, {key: value for key, value in zip(header, values) if value != ""}
+
+    if record_start is not None:
+        yield record_start, ValueError("Invalid CSV: unterminated quoted field")
+
+def _row_to_catalog(row: dict) -> Catalog:
+    """Validar una fila con el modelo Catalog resolviendo el tipo desde el registro"""
+    row = dict(row)
+    type_description = row.pop("catalog_type", None)
+    row.pop("id", None)
+
+    if not row.get("id_catalog_type"):
+        if not type_description:
+            raise ValueError("id_catalog_type or catalog_type is required")
+        type_ids = catalog_type_registry.ids_for(str(type_description))
+        if not type_ids:
+            raise ValueError(f"Catalog type '{type_description}' not found")
+        row["id_catalog_type"] = type_ids[0]
+
+    catalog_type = catalog_type_registry.get(str(row["id_catalog_type"]))
+    if not catalog_type or not catalog_type["active"]:
+        raise ValueError("Catalog type not found or inactive")
+
+    catalog = Catalog(**row)
+    catalog.name = catalog.name.strip()
+    catalog.description = catalog.description.strip()
+    return catalog
+
+def _write_import_batch(batch: list[tuple[int, Catalog]], report: dict) -> None:
+    """Upsert por nombre (misma collation que el índice único) con un solo bulk_write"""
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    operations = [
+        UpdateOne(
+            {"name": catalog.name},
+            {"$set": catalog.model_dump(exclude={"id"})},
+            upsert=True,
+            collation=NAME_COLLATION
+        )
+        for _, catalog in batch
+    ]
+
+    try:
+        result = coll.bulk_write(operations, ordered=False)
+        report["inserted"] += result.upserted_count
+        report["updated"] += result.matched_count
+    except BulkWriteError as e:
+        details = e.details
+        report["inserted"] += details.get("nUpserted", 0)
+        report["updated"] += details.get("nMatched", 0)
+        for error in details.get("writeErrors", []):
+            row_number = batch[error["index"]][0]
+            message = "Duplicate catalog name" if error.get("code") == 11000 else error.get("errmsg", "Write error")
+            _add_import_error(report, row_number, message)
+
+def _add_import_error(report: dict, row_number: int, message: str) -> None:
+    report["failed"] += 1
+    if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": row_number, "error": message})
+
+async def import_catalogs(chunks, fmt: str = "csv") -> dict:
+    """
+    Importar catálogos desde un CSV (con encabezado) o NDJSON recibido en streaming.
+    Cada fila se valida con el modelo Catalog y se hace upsert por nombre en lotes.
+    """
+    report = {"processed": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    batch: list[tuple[int, Catalog]] = []
+    batch_names: set[str] = set()
+
+    try:
+        async for row_number, row in _iter_rows(chunks, fmt):
+            report["processed"] += 1
+
+            if isinstance(row, Exception):
+                _add_import_error(report, row_number, str(row))
+                continue
+
+            try:
+                catalog = _row_to_catalog(row)
+            except ValidationError as e:
+                errors = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+                _add_import_error(report, row_number, errors)
+                continue
+            except (ValueError, TypeError) as e:
+                _add_import_error(report, row_number, str(e))
+                continue
+
+            # Dos filas con el mismo nombre en un lote chocarían entre sí en el upsert
+            name_key = catalog.name.lower()
+            if name_key in batch_names:
+                _add_import_error(report, row_number, "Duplicate catalog name in upload")
+                continue
+
+            batch.append((row_number, catalog))
+            batch_names.add(name_key)
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _write_import_batch(batch, report)
+                batch, batch_names = [], set()
+
+        if batch:
+            _write_import_batch(batch, report)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="The upload must be UTF-8 encoded")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing catalogs: {str(e)}")
+    finally:
+        if report["inserted"] or report["updated"]:
+            # Los upserts pueden mover productos entre tipos: se recalculan los contadores.
+            # Un fallo aquí no debe tapar el error de la importación; el job
+            # periódico los corrige después
+            try:
+                await reconcile_product_counters()
+            except Exception as e:
+                logger.error(f"Product counter reconciliation after import failed: {e}")
+            if report["updated"]:
+                task_queue.enqueue(refresh_bundles_and_cache)
+            catalog_cache.invalidate()
+            publish_catalog_event("imported", {"inserted": report["inserted"], "updated": report["updated"]})
+
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    return report
@@ -1,14 +1,24 @@
 from models.catalogtypes import CatalogType
-from utils.mongodb import get_collection
+from utils.services import services
+from utils.catalog_cache import catalog_cache
+from utils.cache_versions import version_stamps
 from fastapi import HTTPException
 from bson import ObjectId
+import os
+import asyncio
+import logging
 
 from pipelines.catalog_type_pipelines import (
     get_catalog_type_pipeline
-    , validate_type_is_assigned_pipeline
+    , count_products_by_type_pipeline
 )
 
-coll = get_collection("catalogtypes")
+coll = services.collection("catalogtypes")
+catalogs_coll = services.collection("catalogs")
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("CATALOG_COUNTER_RECONCILE_SECONDS", "3600"))
 
 async def create_catalog_type(catalog_type: CatalogType) -> CatalogType:
     try:
@@ -19,8 +29,11 @@ async def create_catalog_type(catalog_type: CatalogType) -> CatalogType:
             raise HTTPException(status_code=400, detail="Catalog type already exists")
 
         catalog_type_dict = catalog_type.model_dump(exclude={"id"})
+        catalog_type_dict["number_of_products"] = 0
         inserted = coll.insert_one(catalog_type_dict)
         catalog_type.id = str(inserted.inserted_id)
+        version_stamps.bump("catalogtypes")
+        catalog_cache.invalidate()
         return catalog_type
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating catalog type: {str(e)}")
@@ -35,14 +48,13 @@ async def get_catalog_types() -> list:
 
 async def get_catalog_type_by_id(catalog_type_id: str) -> CatalogType:
     try:
-        doc = coll.find_one({"_id": ObjectId(catalog_type_id)})
+        doc = next(coll.aggregate(get_catalog_type_pipeline(catalog_type_id)), None)
         if not doc:
             raise HTTPException(status_code=404, detail="Catalog type not found")
 
-        # Mapear _id a id para el modelo Pydantic
-        doc['id'] = str(doc['_id'])
-        del doc['_id']
         return CatalogType(**doc)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching catalog type: {str(e)}")
 
@@ -62,6 +74,8 @@ async def update_catalog_type(catalog_type_id: str, catalog_type: CatalogType) -
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Catalog type not found")
 
+        version_stamps.bump("catalogtypes")
+        catalog_cache.invalidate()
         return await get_catalog_type_by_id(catalog_type_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating catalog type: {str(e)}")
@@ -69,21 +83,77 @@ async def update_catalog_type(catalog_type_id: str, catalog_type: CatalogType) -
 
 async def deactivate_catalog_type(catalog_type_id: str) -> dict:
     try:
-        pipeline = validate_type_is_assigned_pipeline(catalog_type_id)
-        assigned = list(coll.aggregate(pipeline))
+        catalog_type = coll.find_one({"_id": ObjectId(catalog_type_id)}, {"number_of_products": 1})
 
-        if assigned is None:
+        if catalog_type is None:
             raise HTTPException(status_code=404, detail="Catalog type not found")
 
-        if assigned[0]["number_of_products"] > 0:
+        # El contador puede ir por detrás de una escritura concurrente; antes de
+        # borrar se confirma con una sonda al índice de catalogs
+        assigned = catalog_type.get("number_of_products", 0) > 0 or \
+            catalogs_coll.find_one({"id_catalog_type": catalog_type_id}, {"_id": 1}) is not None
+
+        if assigned:
             coll.update_one(
                 {"_id": ObjectId(catalog_type_id)},
                 {"$set": {"active": False}}
             )
+            version_stamps.bump("catalogtypes")
+            catalog_cache.invalidate()
             return {"message": "Catalog type is assigned to products and has been deactivated"}
         else:
             coll.delete_one({"_id": ObjectId(catalog_type_id)})
+            version_stamps.bump("catalogtypes")
+            catalog_cache.invalidate()
             return {"message": "Catalog type deleted successfully"}
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deactivating catalog type: {str(e)}")
+
+# ============================================================================
+# CONTADORES DE PRODUCTOS
+# ============================================================================
+
+def adjust_product_count(catalog_type_id: str, delta: int) -> None:
+    """Actualizar number_of_products cuando un catálogo entra o sale de un tipo"""
+    coll.update_one(
+        {"_id": ObjectId(catalog_type_id)},
+        {"$inc": {"number_of_products": delta}}
+    )
+
+async def reconcile_product_counters(catalog_type_ids: list[str] = None) -> dict:
+    """Recalcular los contadores desde catalogs y corregir los que no coincidan"""
+    try:
+        counts = {
+            doc["_id"]: doc["number_of_products"]
+            for doc in catalogs_coll.aggregate(count_products_by_type_pipeline(catalog_type_ids))
+        }
+
+        query = {} if catalog_type_ids is None else {"_id": {"$in": [ObjectId(i) for i in catalog_type_ids]}}
+        checked = 0
+        corrected = 0
+        for doc in coll.find(query, {"number_of_products": 1}):
+            checked += 1
+            expected = counts.get(str(doc["_id"]), 0)
+            if doc.get("number_of_products") != expected:
+                coll.update_one({"_id": doc["_id"]}, {"$set": {"number_of_products": expected}})
+                corrected += 1
+
+        if corrected:
+            logger.info(f"Reconciled product counters: {corrected} of {checked} catalog types corrected")
+            version_stamps.bump("catalogtypes")
+
+        return {"checked": checked, "corrected": corrected}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error deactivating catalog type: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error reconciling catalog type counters: {str(e)}")
+
+async def run_product_counter_reconciliation() -> None:
+    """Job periódico que corrige desviaciones de los contadores"""
+    while True:
+        try:
+            await reconcile_product_counters()
+        except Exception as e:
+            logger.error(f"Product counter reconciliation failed: {e}")
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
@@ -1,3 +1,7 @@
+import os
+import time
+import logging
+import threading
 from models.order_details import OrderDetail, CreateOrderDetail, UpdateOrderDetail
 from pipelines.order_detail_pipelines import (
     get_order_details_pipeline,
@@ -7,146 +11,97 @@ from pipelines.order_detail_pipelines import (
     check_order_detail_exists_pipeline,
     get_order_details_owner_pipeline
 )
-from utils.mongodb import get_collection
+from utils.services import services
+from utils.order_pricing import compute_order_totals, DEFAULT_TAX_RATE
+from utils.outbox import run_in_transaction, write_event, ORDER_DETAIL_CREATED, ORDER_DETAIL_UPDATED, ORDER_DETAIL_DELETED
 from bson import ObjectId
 from datetime import datetime
 
 # Conexión a las colecciones
-order_details_collection = get_collection("order_details")
-orders_collection = get_collection("orders")
-catalogs_collection = get_collection("catalogs")
-settings_collection = get_collection("app_settings")
+order_details_collection = services.collection("order_details")
+orders_collection = services.collection("orders")
+catalogs_collection = services.collection("catalogs")
+settings_collection = services.collection("app_settings")
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_CACHE_SECONDS = float(os.getenv("SETTINGS_CACHE_SECONDS", "60"))
+
+_tax_lock = threading.Lock()
+_tax_rate: float | None = None
+_tax_loaded_at = 0.0
 
 # ============================================================================
 # ORDER DETAILS - FUNCIONES HELPER
 # ============================================================================
 
-async def recalculate_order_totals(order_id: str) -> dict:
-    """Recalcular y actualizar los totales de una orden basado en sus detalles activos"""
-    try:
-        print(f"DEBUG: Recalculando totales para orden: {order_id}")
-
-        # Obtener todos los detalles activos de la orden con información del producto
-        pipeline = [
-            {"$match": {"id_order": order_id, "active": True}},
-            {
-                "$lookup": {
-                    "from": "catalogs",
-                    "let": {"product_id": {"$toObjectId": "$id_producto"}},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$product_id"]}}}
-                    ],
-                    "as": "product_info"
-                }
-            },
-            {
-                "$addFields": {
-                    "product": {"$arrayElemAt": ["$product_info", 0]},
-                    "product_price": {"$arrayElemAt": ["$product_info.cost", 0]},
-                    "line_subtotal": {
-                        "$cond": {
-                            "if": {"$gt": [{"$size": "$product_info"}, 0]},
-                            "then": {
-                                "$multiply": [
-                                    "$quantity",
-                                    {"$arrayElemAt": ["$product_info.cost", 0]}
-                                ]
-                            },
-                            "else": 0
-                        }
-                    }
-                }
+def get_tax_rate() -> float:
+    """Tasa de impuesto de app_settings, releída como mucho cada SETTINGS_CACHE_SECONDS"""
+    global _tax_rate, _tax_loaded_at
+    with _tax_lock:
+        if _tax_rate is None or time.monotonic() - _tax_loaded_at > SETTINGS_CACHE_SECONDS:
+            tax_result = settings_collection.find_one({"key": "general_tax"})
+            _tax_rate = tax_result["value"] if tax_result and "value" in tax_result else DEFAULT_TAX_RATE
+            _tax_loaded_at = time.monotonic()
+        return _tax_rate
+
+def _apply_order_totals(order_id: str, session=None) -> dict | None:
+    """
+    Recalcular y guardar los totales de la orden dentro de `session` (para que
+    vea los cambios de la transacción en curso). None si la orden no existe.
+    """
+    # Subtotal de los detalles activos con el precio actual de cada producto
+    pipeline = [
+        {"$match": {"id_order": order_id, "active": True}},
+        {
+            "$lookup": {
+                "from": "catalogs",
+                "let": {"product_id": {"$toObjectId": "$id_producto"}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$product_id"]}}},
+                    {"$project": {"cost": 1}}
+                ],
+                "as": "product_info"
             }
-        ]
-
-        # Debug: ver los detalles antes del group
-        debug_result = list(order_details_collection.aggregate(pipeline))
-        print(f"DEBUG: Detalles encontrados: {len(debug_result)}")
-        for detail in debug_result:
-            print(f"DEBUG: Detalle - quantity: {detail.get('quantity')}, product_info: {detail.get('product_info')}, line_subtotal: {detail.get('line_subtotal')}")
-
-        # Ahora hacer el group
-        pipeline.append({
+        },
+        {
             "$group": {
                 "_id": None,
-                "subtotal": {"$sum": "$line_subtotal"},
+                "subtotal": {
+                    "$sum": {
+                        "$multiply": [
+                            "$quantity",
+                            {"$ifNull": [{"$arrayElemAt": ["$product_info.cost", 0]}, 0]}
+                        ]
+                    }
+                },
                 "total_items": {"$sum": "$quantity"}
             }
-        })
+        }
+    ]
 
-        result = list(order_details_collection.aggregate(pipeline))
-        print(f"DEBUG: Resultado del pipeline: {result}")
+    result = next(order_details_collection.aggregate(pipeline, session=session), None)
+    totals = compute_order_totals(result["subtotal"] if result else 0.0, get_tax_rate())
 
-        if result and result[0]["subtotal"] > 0:
-            subtotal = result[0]["subtotal"]
+    update_result = orders_collection.update_one(
+        {"_id": ObjectId(order_id)},
+        {"$set": {**totals, "date_updated": datetime.utcnow()}},
+        session=session
+    )
 
-            # Calcular impuestos (15% por ejemplo - esto puede ser configurable)
-            tax_result = settings_collection.find_one({"key": "general_tax"})
-            if tax_result and "value" in tax_result:
-                tax_rate = tax_result["value"]
-            else:
-                print("DEBUG: No se encontró tasa de impuesto, usando valor por defecto de 0.15")
-                tax_rate = 0.01
-
-            taxes = subtotal * tax_rate
-
-            # Por ahora no hay descuentos automáticos
-            discount = 0.0
-            total = subtotal + taxes - discount
-
-            print(f"DEBUG: Calculando - subtotal: {subtotal}, taxes: {taxes}, total: {total}")
-
-            # Actualizar la orden con los nuevos totales
-            update_result = orders_collection.update_one(
-                {"_id": ObjectId(order_id)},
-                {
-                    "$set": {
-                        "subtotal": round(subtotal, 2),
-                        "taxes": round(taxes, 2),
-                        "discount": discount,
-                        "total": round(total, 2),
-                        "date_updated": datetime.utcnow()
-                    }
-                }
-            )
+    return totals if update_result.matched_count > 0 else None
 
-            print(f"DEBUG: Update result - modified_count: {update_result.modified_count}")
-
-            if update_result.modified_count > 0:
-                return {
-                    "success": True,
-                    "subtotal": round(subtotal, 2),
-                    "taxes": round(taxes, 2),
-                    "discount": discount,
-                    "total": round(total, 2)
-                }
-        else:
-            print("DEBUG: No hay productos o subtotal es 0, reseteando a cero")
-            # La orden no tiene productos, resetear a cero
-            orders_collection.update_one(
-                {"_id": ObjectId(order_id)},
-                {
-                    "$set": {
-                        "subtotal": 0.0,
-                        "taxes": 0.0,
-                        "discount": 0.0,
-                        "total": 0.0,
-                        "date_updated": datetime.utcnow()
-                    }
-                }
-            )
-            return {
-                "success": True,
-                "subtotal": 0.0,
-                "taxes": 0.0,
-                "discount": 0.0,
-                "total": 0.0
-            }
+async def recalculate_order_totals(order_id: str) -> dict:
+    """Recalcular y actualizar los totales de una orden basado en sus detalles activos"""
+    try:
+        totals = _apply_order_totals(order_id)
+        if totals is not None:
+            return {"success": True, **totals}
 
         return {"success": False, "message": "Error al actualizar totales"}
 
     except Exception as e:
-        print(f"DEBUG: Error en recalculate_order_totals: {str(e)}")
+        logger.error(f"Error recalculating totals for order {order_id}: {str(e)}")
         return {"success": False, "message": f"Error al recalcular totales: {str(e)}"}
 
 # ============================================================================
@@ -192,21 +147,27 @@ async def create_order_detail(order_id: str, detail_data: CreateOrderDetail, req
         detail_dict["date_updated"] = datetime.utcnow()
         detail_dict["active"] = True
 
-        result = order_details_collection.insert_one(detail_dict)
-        
-        if result.inserted_id:
+        def write(session):
+            result = order_details_collection.insert_one(detail_dict, session=session)
             # Recalcular totales de la orden después de agregar el producto
-            totals_result = await recalculate_order_totals(order_id)
-            
+            totals = _apply_order_totals(order_id, session)
+            write_event(session, ORDER_DETAIL_CREATED, order_id, {
+                "id_user": order_info["id_user"],
+                "id": str(result.inserted_id),
+                "id_producto": detail_data.id_producto,
+                "quantity": detail_dict.get("quantity"),
+                "order_totals": totals
+            })
+            return result, totals
+
+        # Detalle, totales y evento se confirman juntos
+        result, totals = run_in_transaction(write)
+
+        if result.inserted_id:
             response_data = {"id": str(result.inserted_id)}
-            if totals_result["success"]:
-                response_data["order_totals"] = {
-                    "subtotal": totals_result["subtotal"],
-                    "taxes": totals_result["taxes"],
-                    "discount": totals_result["discount"],
-                    "total": totals_result["total"]
-                }
-            
+            if totals is not None:
+                response_data["order_totals"] = totals
+
             return {
                 "success": True,
                 "message": "Producto agregado a la orden exitosamente",
@@ -300,8 +261,6 @@ async def get_order_details_owner(detail_id: str) -> str:
 async def update_order_detail(order_id: str, detail_id: str, update_data: UpdateOrderDetail, requesting_user_id: str = None, is_admin: bool = False) -> dict:
     """Actualizar un detalle de orden específico con validación de pertenencia"""
     try:
-        print(f"DEBUG: Iniciando update_order_detail - order_id: {order_id}, detail_id: {detail_id}")
-        
         # Validar ObjectIds
         if not ObjectId.is_valid(detail_id):
             return {"success": False, "message": "ID de detalle inválido", "data": None}
@@ -319,37 +278,48 @@ async def update_order_detail(order_id: str, detail_id: str, update_data: Update
         if not detail_info:
             return {"success": False, "message": "Detalle no encontrado o no pertenece a esta orden", "data": None}
 
+        # La orden asociada da el propietario: permisos y destinatario del evento
+        order_info = orders_collection.find_one({"_id": ObjectId(order_id)}, {"id_user": 1})
+
         # Si no es admin, verificar que la orden pertenece al usuario
         if not is_admin and requesting_user_id:
-            # Obtener la orden asociada al detalle para verificar permisos
-            order_info = orders_collection.find_one({"_id": ObjectId(order_id)})
             if not order_info or order_info["id_user"] != requesting_user_id:
                 return {"success": False, "message": "No tienes permiso para modificar este detalle", "data": None}
 
+        if not order_info:
+            return {"success": False, "message": "Orden no encontrada", "data": None}
+        detail_owner = order_info["id_user"]
+
         # Actualizar detalle
         update_dict = update_data.model_dump()
         update_dict["date_updated"] = datetime.utcnow()
 
-        result = order_details_collection.update_one(
-            {"_id": ObjectId(detail_id)},
-            {"$set": update_dict}
-        )
+        def write(session):
+            result = order_details_collection.update_one(
+                {"_id": ObjectId(detail_id)},
+                {"$set": update_dict},
+                session=session
+            )
+            if result.modified_count == 0:
+                return result, None
 
-        if result.modified_count > 0:
-            print(f"DEBUG: Detalle actualizado exitosamente, iniciando recálculo de totales")
             # Recalcular totales de la orden después de actualizar el producto
-            totals_result = await recalculate_order_totals(order_id)
-            print(f"DEBUG: Resultado del recálculo: {totals_result}")
-            
+            totals = _apply_order_totals(order_id, session)
+            write_event(session, ORDER_DETAIL_UPDATED, order_id, {
+                "id_user": detail_owner,
+                "id": detail_id,
+                "changes": update_data.model_dump(),
+                "order_totals": totals
+            })
+            return result, totals
+
+        result, totals = run_in_transaction(write)
+
+        if result.modified_count > 0:
             response_data = {"modified_count": result.modified_count}
-            if totals_result["success"]:
-                response_data["order_totals"] = {
-                    "subtotal": totals_result["subtotal"],
-                    "taxes": totals_result["taxes"],
-                    "discount": totals_result["discount"],
-                    "total": totals_result["total"]
-                }
-            
+            if totals is not None:
+                response_data["order_totals"] = totals
+
             return {
                 "success": True,
                 "message": "Detalle de orden actualizado exitosamente",
@@ -385,31 +355,44 @@ async def delete_order_detail(order_id: str, detail_id: str, requesting_user_id:
         if not detail_info:
             return {"success": False, "message": "Detalle no encontrado o no pertenece a esta orden", "data": None}
 
+        # La orden asociada da el propietario: permisos y destinatario del evento
+        order_info = orders_collection.find_one({"_id": ObjectId(order_id)}, {"id_user": 1})
+
         # Si no es admin, verificar que la orden pertenece al usuario
         if not is_admin and requesting_user_id:
-            # Obtener la orden asociada al detalle para verificar permisos
-            order_info = orders_collection.find_one({"_id": ObjectId(order_id)})
             if not order_info or order_info["id_user"] != requesting_user_id:
                 return {"success": False, "message": "No tienes permiso para modificar este detalle", "data": None}
 
+        if not order_info:
+            return {"success": False, "message": "Orden no encontrada", "data": None}
+        detail_owner = order_info["id_user"]
+
         # Desactivar detalle (soft delete)
-        result = order_details_collection.update_one(
-            {"_id": ObjectId(detail_id)},
-            {"$set": {"active": False, "date_updated": datetime.utcnow()}}
-        )
+        def write(session):
+            result = order_details_collection.update_one(
+                {"_id": ObjectId(detail_id), "active": True},
+                {"$set": {"active": False, "date_updated": datetime.utcnow()}},
+                session=session
+            )
+            if result.modified_count == 0:
+                return result, None
 
-        if result.modified_count > 0:
             # Recalcular totales de la orden después de eliminar el producto
-            totals_result = await recalculate_order_totals(order_id)
+            totals = _apply_order_totals(order_id, session)
+            write_event(session, ORDER_DETAIL_DELETED, order_id, {
+                "id_user": detail_owner,
+                "id": detail_id,
+                "id_producto": detail_info["id_producto"],
+                "order_totals": totals
+            })
+            return result, totals
+
+        result, totals = run_in_transaction(write)
 
+        if result.modified_count > 0:
             response_data = {"modified_count": result.modified_count}
-            if totals_result["success"]:
-                response_data["order_totals"] = {
-                    "subtotal": totals_result["subtotal"],
-                    "taxes": totals_result["taxes"],
-                    "discount": totals_result["discount"],
-                    "total": totals_result["total"]
-                }
+            if totals is not None:
+                response_data["order_totals"] = totals
 
             return {
                 "success": True,
@@ -1,9 +1,66 @@
 from models.order_statuses import OrderStatus
-from utils.mongodb import get_collection
+from utils.services import services
+from utils.cache_versions import version_stamps
 from fastapi import HTTPException
 from bson import ObjectId
+from pipelines.order_status_pipelines import get_order_statuses_pipeline
+from utils.order_state_machine import DEFAULT_TRANSITIONS, InvalidTransitionGraph, TransitionTable, compile_transitions
 
-coll = get_collection("order_statuses")
+coll = services.collection("order_statuses")
+orders_coll = services.collection("orders")
+
+ORDER_STATUSES_VERSION = "order_statuses"
+
+# ============================================================================
+# GRAFO DE TRANSICIONES
+# ============================================================================
+
+_transition_table: TransitionTable | None = None
+
+def get_transition_table() -> TransitionTable:
+    """Tabla de transiciones compilada; se recompila al cambiar order_statuses"""
+    global _transition_table
+    table = _transition_table
+    if table is None:
+        table = compile_transitions(list(coll.aggregate(get_order_statuses_pipeline())))
+        _transition_table = table
+    return table
+
+def _reset_transition_table(version: int) -> None:
+    global _transition_table
+    _transition_table = None
+
+version_stamps.on_change(ORDER_STATUSES_VERSION, _reset_transition_table)
+
+def _normalize_transitions(order_status: OrderStatus) -> None:
+    if order_status.next_statuses is not None:
+        order_status.next_statuses = sorted({s.strip().lower() for s in order_status.next_statuses})
+
+def _require_transitions(order_status: OrderStatus) -> None:
+    """Un estado nuevo debe declarar sus salidas (lista vacía si es final) para no atascar órdenes"""
+    if order_status.next_statuses is None and order_status.description not in DEFAULT_TRANSITIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Order status '{order_status.description}' must declare next_statuses (empty list if final)"
+        )
+
+def _validate_transitions(docs: list[dict]) -> None:
+    """Rechazar cambios que dejarían el grafo con destinos inexistentes"""
+    try:
+        compile_transitions(docs, strict=True)
+    except InvalidTransitionGraph as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _other_statuses(excluded_id: str = None) -> list[dict]:
+    return [doc for doc in coll.aggregate(get_order_statuses_pipeline()) if doc["id"] != excluded_id]
+
+async def get_order_status_transitions() -> dict:
+    """Grafo de transiciones vigente (incluye los valores por defecto) y estados sin salidas declaradas"""
+    try:
+        table = get_transition_table()
+        return {"transitions": table.as_dict(), "undeclared": sorted(table.undeclared)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching order status transitions: {str(e)}")
 
 async def create_order_status(order_status: OrderStatus) -> dict:
     """Crear un nuevo order status"""
@@ -17,9 +74,14 @@ async def create_order_status(order_status: OrderStatus) -> dict:
         if existing:
             raise HTTPException(status_code=400, detail="Order status with this description already exists")
 
-        # Crear el order status
+        _normalize_transitions(order_status)
+        _require_transitions(order_status)
         order_status_dict = order_status.model_dump(exclude={"id"})
+        _validate_transitions(_other_statuses() + [{**order_status_dict, "id": None}])
+
+        # Crear el order status
         inserted = coll.insert_one(order_status_dict)
+        version_stamps.bump(ORDER_STATUSES_VERSION)
 
         # Retornar el order status creado con su ID
         order_status_dict["id"] = str(inserted.inserted_id)
@@ -33,15 +95,9 @@ async def create_order_status(order_status: OrderStatus) -> dict:
 async def get_order_statuses() -> dict:
     """Obtener todos los order statuses"""
     try:
-        # Obtener todos los order statuses directamente
-        order_statuses_cursor = coll.find({})
-        order_statuses = []
-        
-        for status in order_statuses_cursor:
-            status["id"] = str(status["_id"])
-            del status["_id"]
-            order_statuses.append(status)
-        
+        # El id ya viene convertido desde la pipeline
+        order_statuses = list(coll.aggregate(get_order_statuses_pipeline()))
+
         return {
             "order_statuses": order_statuses,
             "total": len(order_statuses)
@@ -57,16 +113,11 @@ async def get_order_status_by_id(order_status_id: str) -> dict:
         if not ObjectId.is_valid(order_status_id):
             raise HTTPException(status_code=400, detail="Invalid order status ID")
         
-        # Buscar el order status directamente
-        order_status = coll.find_one({"_id": ObjectId(order_status_id)})
-        
+        order_status = next(coll.aggregate(get_order_statuses_pipeline(order_status_id)), None)
+
         if not order_status:
             raise HTTPException(status_code=404, detail="Order status not found")
-        
-        # Convertir ObjectId a string para la respuesta
-        order_status["id"] = str(order_status["_id"])
-        del order_status["_id"]
-        
+
         return order_status
         
     except HTTPException:
@@ -99,8 +150,12 @@ async def update_order_status(order_status_id: str, order_status: OrderStatus) -
         if duplicate:
             raise HTTPException(status_code=400, detail="Order status with this description already exists")
 
-        # Actualizar el order status
+        _normalize_transitions(order_status)
+        _require_transitions(order_status)
         order_status_dict = order_status.model_dump(exclude={"id"})
+        _validate_transitions(_other_statuses(order_status_id) + [{**order_status_dict, "id": order_status_id}])
+
+        # Actualizar el order status
         result = coll.update_one(
             {"_id": ObjectId(order_status_id)},
             {"$set": order_status_dict}
@@ -109,6 +164,16 @@ async def update_order_status(order_status_id: str, order_status: OrderStatus) -
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Order status not found")
 
+        # Las órdenes guardan la descripción de su estado (cola de cocina,
+        # listados): un renombre se propaga a las que ya están en él
+        if existing["description"] != order_status.description:
+            orders_coll.update_many(
+                {"id_status": order_status_id},
+                {"$set": {"status": order_status.description}}
+            )
+
+        version_stamps.bump(ORDER_STATUSES_VERSION)
+
         # Retornar el order status actualizado
         order_status_dict["id"] = order_status_id
         return order_status_dict
@@ -126,20 +191,21 @@ async def delete_order_status(order_status_id: str) -> dict:
             raise HTTPException(status_code=400, detail="Invalid order status ID")
 
         # Obtener el order status antes de eliminarlo
-        order_status = coll.find_one({"_id": ObjectId(order_status_id)})
+        order_status = next(coll.aggregate(get_order_statuses_pipeline(order_status_id)), None)
 
         if not order_status:
             raise HTTPException(status_code=404, detail="Order status not found")
 
+        # Ningún otro estado puede seguir apuntando a este
+        _validate_transitions(_other_statuses(order_status_id))
+
         # Eliminar el order status
         result = coll.delete_one({"_id": ObjectId(order_status_id)})
 
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Order status not found")
 
-        # Convertir ObjectId a string para la respuesta
-        order_status["id"] = str(order_status["_id"])
-        del order_status["_id"]
+        version_stamps.bump(ORDER_STATUSES_VERSION)
 
         return {
             "message": "Order status deleted successfully",
@@ -1,4 +1,5 @@
-from models.orders import Order, CreateOrder
+import os
+from models.orders import Order, CreateOrder, OrderQuote
 from models.order_status_records import OrderStatusRecord, CreateOrderStatusRecord
 from pipelines.order_pipelines import (
     get_all_orders_pipeline,
@@ -7,15 +8,48 @@ from pipelines.order_pipelines import (
     get_order_owner_pipeline,
     get_existing_inprogress_order_pipeline
 )
-from utils.mongodb import get_collection
+from utils.services import services
+from controllers.order_statuses import get_transition_table
+from utils.catalog_cache import catalog_cache
+from utils.order_pricing import price_cart
+from controllers.order_details import get_tax_rate
+from utils.event_hub import event_hub, sse_stream, parse_last_event_id, HEARTBEAT_SECONDS
+from utils.json_response import dumps
+from utils.outbox import (
+    run_in_transaction,
+    write_event,
+    outbox_dispatcher,
+    ORDER_CREATED,
+    ORDER_STATUS_CHANGED,
+    ORDER_DETAIL_CREATED,
+    ORDER_DETAIL_UPDATED,
+    ORDER_DETAIL_DELETED
+)
 from bson import ObjectId
 from datetime import datetime
 
 # Conexión a las colecciones
-orders_collection = get_collection("orders")
-users_collection = get_collection("users")
-order_status_records_collection = get_collection("order_status_record")  # Historial de cambios de estado
-order_statuses_collection = get_collection("order_statuses")  # Catálogo de estados disponibles
+orders_collection = services.collection("orders")
+users_collection = services.collection("users")
+order_status_records_collection = services.collection("order_status_record")  # Historial de cambios de estado
+order_details_collection = services.collection("order_details")
+
+INPROGRESS_STATUS = "inprogress"
+ORDERED_STATUS = "ordered"
+
+# Estados que ve la cocina (cola de preparación) y tema del hub para sus avisos
+KITCHEN_STATUSES = [s.strip() for s in os.getenv("KITCHEN_STATUSES", "ordered,processing").split(",") if s.strip()]
+KITCHEN_TOPIC = "kitchen"
+
+# Un tema por usuario: buffer corto para que la memoria no crezca con los usuarios
+USER_ORDERS_TOPIC_PREFIX = "orders:"
+USER_ORDERS_BUFFER_SIZE = int(os.getenv("USER_ORDERS_EVENT_BUFFER", "20"))
+event_hub.limit_topics(USER_ORDERS_TOPIC_PREFIX, USER_ORDERS_BUFFER_SIZE)
+
+
+def user_orders_topic(user_id: str) -> str:
+    """Tema del hub con los cambios de estado de las órdenes de un usuario"""
+    return f"{USER_ORDERS_TOPIC_PREFIX}{user_id}"
 
 # ============================================================================
 # ORDERS - FUNCIONES DE CREACIÓN
@@ -39,34 +73,40 @@ async def create_order(order_data: CreateOrder, user_id: str) -> dict:
                 "data": existing_order[0]
             }
 
+        # Estado inicial "InProgress", desnormalizado en la propia orden
+        initial_status_id = get_transition_table().status_id(INPROGRESS_STATUS)
+        now = datetime.utcnow()
+
         # Crear nueva orden vacía (sin subtotal, taxes, etc.)
         order_dict = {
             "id_user": user_id,  # Mantener como string para consistencia
-            "date": datetime.utcnow(),
+            "date": now,
             "subtotal": 0.0,
             "taxes": 0.0,
             "discount": 0.0,
-            "total": 0.0
+            "total": 0.0,
+            "id_status": initial_status_id,
+            "status": INPROGRESS_STATUS if initial_status_id else None,
+            "status_date": now
         }
 
-        result = orders_collection.insert_one(order_dict)
-
-        if result.inserted_id:
-            # Crear estado inicial "InProgress" automáticamente
-            initial_status = list(order_statuses_collection.aggregate([
-                {"$match": {"description": "inprogress"}},
-                {"$project": {"_id": 1}},
-                {"$limit": 1}
-            ]))
-
-            if initial_status:
+        def write(session):
+            result = orders_collection.insert_one(order_dict, session=session)
+            order_id = str(result.inserted_id)  # Convertir a string para consistencia
+            if initial_status_id:
                 status_data = {
-                    "id_order": str(result.inserted_id),  # Convertir a string para consistencia
-                    "id_status": str(initial_status[0]["_id"]),  # Convertir a string para consistencia
-                    "date": datetime.utcnow()
+                    "id_order": order_id,
+                    "id_status": initial_status_id,
+                    "date": now
                 }
-                order_status_records_collection.insert_one(status_data)
+                order_status_records_collection.insert_one(status_data, session=session)
+            write_event(session, ORDER_CREATED, order_id, {"id_user": user_id, "status": order_dict["status"], "date": now})
+            return result
+
+        # Orden, historial y evento se confirman juntos
+        result = run_in_transaction(write)
 
+        if result.inserted_id:
             # Retornar la orden creada con formato similar al existente
             created_order = {
                 "_id": str(result.inserted_id),
@@ -167,6 +207,105 @@ async def get_order_by_id(order_id: str, requesting_user_id: str = None, is_admi
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}", "data": None}
 
+# ============================================================================
+# ORDERS - COLA DE COCINA
+# ============================================================================
+
+async def get_kitchen_queue(limit: int = 50) -> dict:
+    """Órdenes abiertas para cocina (más antiguas primero) con sus productos activos"""
+    try:
+        # Servido por el índice (status, date) sobre el estado desnormalizado
+        query = {"status": {"$in": KITCHEN_STATUSES}}
+        orders = list(
+            orders_collection.find(query, {"id_user": 1, "date": 1, "status": 1, "status_date": 1})
+            .sort("date", 1)
+            .limit(limit)
+        )
+        total = orders_collection.count_documents(query) if len(orders) == limit else len(orders)
+
+        order_ids = [str(order["_id"]) for order in orders]
+        snapshot = catalog_cache.get()
+        items: dict[str, list] = {}
+        for detail in order_details_collection.find(
+            {"id_order": {"$in": order_ids}, "active": True},
+            {"id_order": 1, "id_producto": 1, "quantity": 1}
+        ):
+            product = snapshot.get_product(detail["id_producto"])
+            items.setdefault(detail["id_order"], []).append({
+                "id_producto": detail["id_producto"],
+                "product_name": product["name"] if product else None,
+                "quantity": detail["quantity"]
+            })
+
+        queue = [
+            {
+                "id": order_id,
+                "id_user": order["id_user"],
+                "date": order["date"],
+                "status": order["status"],
+                "status_date": order.get("status_date"),
+                "items": items.get(order_id, [])
+            }
+            for order_id, order in zip(order_ids, orders)
+        ]
+
+        return {
+            "success": True,
+            "message": "Cola de cocina obtenida exitosamente",
+            "data": {"orders": queue, "total": total}
+        }
+
+    except Exception as e:
+        return {"success": False, "message": f"Error: {str(e)}", "data": None}
+
+def kitchen_event_stream(last_event_id: str = None):
+    """Flujo SSE con los cambios de estado que entran o salen de la cola de cocina"""
+    return sse_stream(event_hub, KITCHEN_TOPIC, parse_last_event_id(last_event_id))
+
+async def stream_user_order_events(websocket, user_id: str, last_event_id: str = None) -> None:
+    """
+    Enviar por WebSocket los cambios de estado de las órdenes del usuario hasta
+    que el cliente se desconecte. Un ping periódico detecta conexiones muertas.
+    """
+    from fastapi import WebSocketDisconnect
+
+    topic = user_orders_topic(user_id)
+    try:
+        async with event_hub.subscribe(topic, parse_last_event_id(last_event_id)) as subscription:
+            while True:
+                event = await subscription.next(HEARTBEAT_SECONDS)
+                if event is None:
+                    message = {"type": "ping"}
+                else:
+                    message = {"id": event.id, "type": event.type, "data": event.data}
+                await websocket.send_text(dumps(message).decode())
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: envío sobre un socket que ya se cerró
+        pass
+
+async def quote_order(quote: OrderQuote) -> dict:
+    """
+    Cotizar un carrito con el catálogo en memoria y la tasa de impuesto en
+    caché: mismos totales que tendría la orden, sin escribir nada.
+    """
+    try:
+        snapshot = catalog_cache.get()
+        items = [item.model_dump() for item in quote.items]
+        quote_data = price_cart(items, snapshot.products, get_tax_rate())
+
+        if quote_data["unavailable"]:
+            return {
+                "success": False,
+                "message": f"Productos no encontrados o inactivos: {', '.join(quote_data['unavailable'])}",
+                "data": None
+            }
+
+        del quote_data["unavailable"]
+        return {"success": True, "message": "Cotización calculada exitosamente", "data": quote_data}
+
+    except Exception as e:
+        return {"success": False, "message": f"Error: {str(e)}", "data": None}
+
 # ============================================================================
 # ORDERS - FUNCIONES DE ACTUALIZACIÓN DE ESTADO
 # ============================================================================
@@ -179,10 +318,14 @@ async def update_order_status(order_id: str, order_status_id: str = None, reques
             return {"success": False, "message": "ID de orden inválido", "data": None}
 
         # Verificar que la orden existe
-        order_exists = orders_collection.find_one({"_id": ObjectId(order_id)})
+        order_exists = orders_collection.find_one({"_id": ObjectId(order_id)}, {"id_user": 1, "id_status": 1})
         if not order_exists:
             return {"success": False, "message": "Orden no encontrada", "data": None}
 
+        # Transiciones validadas contra la tabla en memoria, sin consultar estados
+        table = get_transition_table()
+        current_status_id = order_exists.get("id_status") or _latest_status_id(order_id)
+
         # Si no es admin, verificar permisos y restricciones
         if not is_admin:
             if not requesting_user_id:
@@ -193,64 +336,66 @@ async def update_order_status(order_id: str, order_status_id: str = None, reques
                 return {"success": False, "message": "No tienes permiso para modificar esta orden", "data": None}
 
             # Verificar que el estado actual es "InProgress"
-            current_status = order_status_records_collection.find_one(
-                {"id_order": order_id},  # Buscar por string directamente
-                sort=[("date", -1)]
-            )
-
-            if current_status:
-                current_status_info = order_statuses_collection.find_one({"_id": ObjectId(current_status["id_status"])})
-                if current_status_info and current_status_info["description"] != "inprogress":
-                    return {"success": False, "message": "Solo puedes finalizar órdenes en progreso", "data": None}
+            if current_status_id and table.description(current_status_id) != INPROGRESS_STATUS:
+                return {"success": False, "message": "Solo puedes finalizar órdenes en progreso", "data": None}
 
             # Para usuarios, automáticamente buscar el estado "ordered"
             if order_status_id is None:
-                ordered_status = order_statuses_collection.find_one({"description": "ordered"})
-                if not ordered_status:
+                order_status_id = table.status_id(ORDERED_STATUS)
+                if not order_status_id:
                     return {"success": False, "message": "Estado 'ordered' no encontrado en el sistema", "data": None}
-                order_status_id = str(ordered_status["_id"])
 
-            # VALIDACIÓN CRÍTICA: Verificar que la orden tenga productos antes de finalizar
-            order_details_collection = get_collection("order_details")
-            active_products = order_details_collection.count_documents({
-                "id_order": order_id,
-                "active": True
+        if not order_status_id or not ObjectId.is_valid(order_status_id):
+            return {"success": False, "message": "ID de estado inválido", "data": None}
+
+        status_description = table.description(order_status_id)
+        if status_description is None:
+            return {"success": False, "message": "Estado de orden no encontrado", "data": None}
+
+        if current_status_id and not table.allowed(current_status_id, order_status_id):
+            current_description = table.description(current_status_id) or current_status_id
+            return {"success": False, "message": f"No se puede pasar una orden de '{current_description}' a '{status_description}'", "data": None}
+
+        # VALIDACIÓN CRÍTICA: Verificar que la orden tenga productos si el estado lo exige
+        if table.requires_products(order_status_id):
+            has_products = order_details_collection.find_one({"id_order": order_id, "active": True}, {"_id": 1})
+            if not has_products:
+                if not is_admin:
+                    return {"success": False, "message": "No puedes finalizar una orden vacía. Agrega al menos un producto antes de finalizar.", "data": None}
+                return {"success": False, "message": f"No se puede cambiar a '{status_description}' una orden vacía. La orden debe tener al menos un producto.", "data": None}
+
+        now = datetime.utcnow()
+
+        def write(session):
+            # Actualización condicional: solo si nadie cambió el estado mientras tanto
+            updated = orders_collection.update_one(
+                {"_id": ObjectId(order_id), "id_status": order_exists.get("id_status")},
+                {"$set": {"id_status": order_status_id, "status": status_description, "status_date": now}},
+                session=session
+            )
+            if updated.matched_count == 0:
+                return None
+
+            # Crear nuevo registro de estado (historial)
+            status_data = {
+                "id_order": order_id,  # Ya viene como string del parámetro
+                "id_status": order_status_id,  # Ya viene como string del parámetro
+                "date": now
+            }
+            result = order_status_records_collection.insert_one(status_data, session=session)
+
+            # Los avisos en vivo (cocina, cliente) salen del outbox, ver _publish_status_change
+            write_event(session, ORDER_STATUS_CHANGED, order_id, {
+                "id_user": order_exists["id_user"],
+                "status": status_description,
+                "previous_status": table.description(current_status_id),
+                "date": now
             })
+            return result
 
-            if active_products == 0:
-                return {"success": False, "message": "No puedes finalizar una orden vacía. Agrega al menos un producto antes de finalizar.", "data": None}
-
-        # Para admins, validar que el estado existe si se proporciona
-        if order_status_id:
-            if not ObjectId.is_valid(order_status_id):
-                return {"success": False, "message": "ID de estado inválido", "data": None}
-
-            status_exists = order_statuses_collection.find_one({"_id": ObjectId(order_status_id)})
-            if not status_exists:
-                return {"success": False, "message": "Estado de orden no encontrado", "data": None}
-
-            # VALIDACIÓN PARA ADMINS: También verificar productos para ciertos estados
-            status_description = status_exists.get("description", "").lower()
-            states_requiring_products = ["ordered", "shipped", "delivered", "processing"]
-
-            if status_description in states_requiring_products:
-                order_details_collection = get_collection("order_details")
-                active_products = order_details_collection.count_documents({
-                    "id_order": order_id,
-                    "active": True
-                })
-
-                if active_products == 0:
-                    return {"success": False, "message": f"No se puede cambiar a '{status_description}' una orden vacía. La orden debe tener al menos un producto.", "data": None}
-
-        # Crear nuevo registro de estado
-        status_data = {
-            "id_order": order_id,  # Ya viene como string del parámetro
-            "id_status": order_status_id,  # Ya viene como string del parámetro
-            "date": datetime.utcnow()
-        }
-
-        result = order_status_records_collection.insert_one(status_data)
+        result = run_in_transaction(write)
+        if result is None:
+            return {"success": False, "message": "La orden cambió de estado mientras se procesaba la solicitud, intenta de nuevo", "data": None}
 
         if result.inserted_id:
             return {
@@ -263,3 +408,70 @@ async def update_order_status(order_id: str, order_status_id: str = None, reques
 
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}", "data": None}
+
+def _publish_status_change(event: dict) -> None:
+    """Suscriptor del outbox: reenvía el cambio de estado al hub (cocina y cliente)"""
+    data = event["data"]
+    message = {
+        "id": event["aggregate_id"],
+        "status": data["status"],
+        "previous_status": data["previous_status"],
+        "date": data["date"]
+    }
+    if data["previous_status"] in KITCHEN_STATUSES or data["status"] in KITCHEN_STATUSES:
+        event_hub.publish(KITCHEN_TOPIC, "status_changed", message)
+    event_hub.publish(user_orders_topic(data["id_user"]), "status_changed", message)
+
+def _publish_order_update(event: dict) -> None:
+    """Suscriptor del outbox: avisa al cliente de los nuevos totales de su orden"""
+    data = event["data"]
+    event_hub.publish(user_orders_topic(data["id_user"]), "order_updated", {
+        "id": event["aggregate_id"],
+        "change": event["type"],
+        "order_totals": data["order_totals"]
+    })
+
+outbox_dispatcher.subscribe(ORDER_STATUS_CHANGED, _publish_status_change)
+for _event_type in (ORDER_DETAIL_CREATED, ORDER_DETAIL_UPDATED, ORDER_DETAIL_DELETED):
+    outbox_dispatcher.subscribe(_event_type, _publish_order_update)
+
+def _latest_status_id(order_id: str) -> str | None:
+    """Último estado del historial, para órdenes sin estado desnormalizado"""
+    record = order_status_records_collection.find_one({"id_order": order_id}, sort=[("date", -1)])
+    return record["id_status"] if record else None
+
+def backfill_order_status(batch_size: int = 1000) -> int:
+    """Copiar a las órdenes antiguas su último estado del historial (id_status, status)"""
+    from pymongo import UpdateOne
+
+    table = get_transition_table()
+    updated = 0
+    while True:
+        missing = [
+            str(doc["_id"])
+            for doc in orders_collection.find({"id_status": {"$exists": False}}, {"_id": 1}).limit(batch_size)
+        ]
+        if not missing:
+            return updated
+
+        latest = {
+            doc["_id"]: doc
+            for doc in order_status_records_collection.aggregate([
+                {"$match": {"id_order": {"$in": missing}}},
+                {"$sort": {"date": -1}},
+                {"$group": {"_id": "$id_order", "id_status": {"$first": "$id_status"}, "date": {"$first": "$date"}}}
+            ])
+        }
+        # Las órdenes sin historial quedan con id_status null para no volver a procesarlas
+        operations = [
+            UpdateOne(
+                {"_id": ObjectId(order_id), "id_status": {"$exists": False}},
+                {"$set": {
+                    "id_status": latest[order_id]["id_status"] if order_id in latest else None,
+                    "status": table.description(latest[order_id]["id_status"]) if order_id in latest else None,
+                    "status_date": latest[order_id]["date"] if order_id in latest else None
+                }}
+            )
+            for order_id in missing
+        ]
+        updated += orders_collection.bulk_write(operations, ordered=False).modified_count
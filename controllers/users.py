@@ -1,64 +1,57 @@
 import os
+import asyncio
 import logging
-import firebase_admin
 import requests
-import json
-import base64
+from datetime import datetime, timedelta
 from fastapi import HTTPException
-from firebase_admin import credentials, auth as firebase_auth
 
 from models.users import User
 from models.login import Login
 
-from utils.security import create_jwt_token
-from utils.mongodb import get_collection
+from utils.security import create_jwt_token, encrypt_secret, decrypt_secret
+from utils.mongodb import get_collection, is_duplicate_key_error
+from utils.identity import ensure_account, IdentityProviderError
+from utils.services import services
+from utils.outbox import run_in_transaction
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def initialize_firebase():
-    if firebase_admin._apps:
-        return
+# Configuración del aprovisionamiento asíncrono de cuentas
+PROVISIONING_INTERVAL_SECONDS = float(os.getenv("USER_PROVISIONING_INTERVAL", "10"))
+PROVISIONING_MAX_ATTEMPTS = int(os.getenv("USER_PROVISIONING_MAX_ATTEMPTS", "8"))
+PROVISIONING_LEASE_SECONDS = 60
+PROVISIONING_BATCH_SIZE = 20
 
-    try:
-        firebase_creds_base64 = os.getenv("FIREBASE_CREDENTIALS_BASE64")
-
-        if firebase_creds_base64:
-            firebase_creds_json = base64.b64decode(firebase_creds_base64).decode('utf-8')
-            firebase_creds = json.loads(firebase_creds_json)
-            cred = credentials.Certificate(firebase_creds)
-            firebase_admin.initialize_app(cred)
-            logger.info("Firebase initialized with environment variable credentials")
-        else:
-            # Fallback to local file (for local development)
-            cred = credentials.Certificate("secrets/dulceria-secret.json")
-            firebase_admin.initialize_app(cred)
-            logger.info("Firebase initialized with JSON file")
-
-    except Exception as e:
-        logger.error(f"Failed to initialize Firebase: {e}")
-        raise HTTPException(status_code=500, detail=f"Firebase configuration error: {str(e)}")
+provisioning_stats = {
+    "provisioned": 0,
+    "retried": 0,
+    "failed": 0,
+    "last_run": None
+}
 
-initialize_firebase()
+# Se activa al registrar un usuario para que el worker no espere al siguiente ciclo
+provisioning_wakeup = asyncio.Event()
 
 async def create_user( user: User ) -> User:
+    """
+    Registrar un usuario como 'pending'. La cuenta de Firebase se crea
+    después en segundo plano (ver run_user_provisioning_worker).
+    """
+    coll = get_collection("users")
+    jobs = get_collection("user_provisioning")
 
-    user_record = {}
-    try:
-        user_record = firebase_auth.create_user(
-            email=user.email,
-            password=user.password
-        )
-    except Exception as e:
-        logger.warning( e )
-        raise HTTPException(
-            status_code=400,
-            detail="Error al registrar usuario en firebase"
-        )
+    email_taken = HTTPException(
+        status_code=400,
+        detail="Error al registrar usuario: el correo ya está registrado"
+    )
 
-    try:
-        coll = get_collection("users")
+    # Un alta que falló definitivamente no bloquea el correo: se puede repetir
+    if coll.find_one({ "email": user.email, "status": { "$ne": "failed" } }, { "_id": 1 }):
+        raise email_taken
+    coll.delete_one({ "email": user.email, "status": "failed" })
 
+    try:
         # Aunque se manden en el payload igual los excluimos ya que sabes el 
         # state inicial cuando se crea el usuario.
 
@@ -66,20 +59,164 @@ async def create_user( user: User ) -> User:
             name=user.name,
             lastname=user.lastname,
             email=user.email,
-            password=user.password
+            password=user.password,
+            active=False
         )
 
+        now = datetime.utcnow()
         user_dict = new_user.model_dump(exclude={"id", "password"})
-        inserted = coll.insert_one(user_dict)
+        user_dict["status"] = "pending"
+        user_dict["date_created"] = now
+        # Outbox de aprovisionamiento: comparte el _id con el usuario, así que
+        # reintentos y workers concurrentes operan siempre sobre el mismo trabajo.
+        # La contraseña se guarda cifrada y solo hasta que la cuenta se crea.
+        def write(session):
+            inserted = coll.insert_one(user_dict, session=session)
+            try:
+                jobs.insert_one({
+                    "_id": inserted.inserted_id,
+                    "email": user.email,
+                    "password_encrypted": encrypt_secret(user.password),
+                    "attempts": 0,
+                    "next_attempt": now,
+                    "last_error": None,
+                    "date_created": now
+                }, session=session)
+            except Exception:
+                # Sin transacción no hay rollback: el usuario huérfano se borra aquí
+                if session is None:
+                    coll.delete_one({ "_id": inserted.inserted_id })
+                raise
+            return inserted
+
+        # Usuario y trabajo se confirman juntos; el índice único de email
+        # resuelve las altas simultáneas
+        try:
+            inserted = run_in_transaction(write)
+        except Exception as e:
+            if is_duplicate_key_error(e):
+                raise email_taken
+            raise
+
+        provisioning_wakeup.set()
+
         new_user.id = str(inserted.inserted_id)
         new_user.password = "*********"  # Mask the password in the response
         return new_user
 
+    except HTTPException:
+        raise
     except Exception as e:
-        firebase_auth.delete_user(user_record.uid)
         logger.error(f"Error creating user: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def provision_user(job: dict) -> bool:
+    """Crear la cuenta de un trabajo pendiente y activar al usuario"""
+    users = get_collection("users")
+    jobs = get_collection("user_provisioning")
+
+    try:
+        known_uid = job.get("uid")
+        password = decrypt_secret(job["password_encrypted"]) if known_uid is None else None
+        uid = ensure_account(services.identity, job["email"], password, known_uid)
+        if known_uid is None:
+            # Los reintentos de este trabajo reutilizan la cuenta recién creada
+            jobs.update_one({ "_id": job["_id"] }, { "$set": { "uid": uid } })
+    except Exception as e:
+        attempts = job.get("attempts", 0) + 1
+        retryable = isinstance(e, IdentityProviderError) and e.retryable
+
+        if not retryable or attempts >= PROVISIONING_MAX_ATTEMPTS:
+            users.update_one(
+                { "_id": job["_id"], "status": "pending" },
+                { "$set": { "status": "failed", "provisioning_error": str(e) } }
+            )
+            jobs.delete_one({ "_id": job["_id"] })
+            provisioning_stats["failed"] += 1
+            logger.error(f"User provisioning failed for {job['email']}: {e}")
+        else:
+            delay = min(2 ** attempts, 300)
+            jobs.update_one(
+                { "_id": job["_id"] },
+                { "$set": {
+                    "attempts": attempts,
+                    "next_attempt": datetime.utcnow() + timedelta(seconds=delay),
+                    "last_error": str(e)
+                } }
+            )
+            provisioning_stats["retried"] += 1
+            logger.warning(f"User provisioning attempt {attempts} failed for {job['email']}: {e}")
+        return False
+
+    users.update_one(
+        { "_id": job["_id"] },
+        { "$set": {
+            "status": "active",
+            "active": True,
+            "firebase_uid": uid,
+            "date_provisioned": datetime.utcnow()
+        } }
+    )
+    jobs.delete_one({ "_id": job["_id"] })
+    provisioning_stats["provisioned"] += 1
+    return True
+
+def provision_pending_users(batch_size: int = PROVISIONING_BATCH_SIZE) -> int:
+    """Procesar un lote de trabajos vencidos; devuelve cuántos se procesaron"""
+    from pymongo import ReturnDocument
+
+    jobs = get_collection("user_provisioning")
+    processed = 0
+
+    while processed < batch_size:
+        now = datetime.utcnow()
+        # Reclamar el trabajo moviendo next_attempt hacia adelante (lease),
+        # de modo que otros workers no lo tomen mientras se procesa
+        job = jobs.find_one_and_update(
+            { "next_attempt": { "$lte": now } },
+            { "$set": { "next_attempt": now + timedelta(seconds=PROVISIONING_LEASE_SECONDS) } },
+            sort=[("next_attempt", 1)],
+            return_document=ReturnDocument.BEFORE
+        )
+        if not job:
+            break
+
+        provision_user(job)
+        processed += 1
+
+    provisioning_stats["last_run"] = datetime.utcnow()
+    return processed
+
+async def run_user_provisioning_worker() -> None:
+    """Bucle en segundo plano que aprovisiona las cuentas pendientes"""
+    while True:
+        provisioning_wakeup.clear()
+        try:
+            await asyncio.to_thread(provision_pending_users)
+        except Exception as e:
+            logger.error(f"User provisioning worker error: {e}")
+
+        try:
+            await asyncio.wait_for(provisioning_wakeup.wait(), timeout=PROVISIONING_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def get_provisioning_status() -> dict:
+    """Estado del aprovisionamiento para monitoreo"""
+    users = get_collection("users")
+    jobs = get_collection("user_provisioning")
+
+    oldest = jobs.find_one({}, { "date_created": 1 }, sort=[("date_created", 1)])
+
+    return {
+        "provider": services.identity.name,
+        "pending": users.count_documents({ "status": "pending" }),
+        "failed": users.count_documents({ "status": "failed" }),
+        "queued_jobs": jobs.count_documents({}),
+        "oldest_job": oldest["date_created"] if oldest else None,
+        **provisioning_stats
+    }
+
 
 async def login(user: Login) -> dict:
     api_key = os.getenv("FIREBASE_API_KEY")
@@ -90,6 +227,16 @@ async def login(user: Login) -> dict:
         "returnSecureToken": True
     }
 
+    coll = get_collection("users")
+    user_info = coll.find_one({ "email": user.email })
+
+    # La cuenta todavía no existe en Firebase mientras se aprovisiona
+    if user_info and user_info.get("status") == "pending":
+        raise HTTPException(
+            status_code=409,
+            detail="La cuenta se está activando, intenta de nuevo en unos segundos"
+        )
+
     response = requests.post(url, json=payload)
     response_data = response.json()
 
@@ -99,9 +246,6 @@ async def login(user: Login) -> dict:
             detail="Error al autenticar usuario"
         )
 
-    coll = get_collection("users")
-    user_info = coll.find_one({ "email": user.email })
-
     if not user_info:
         raise HTTPException(
             status_code=404,
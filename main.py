@@ -1,13 +1,38 @@
+import os
 import uvicorn
 import logging
+import asyncio
 
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Request
 
-from controllers.users import create_user, login
+from controllers.users import (
+    create_user,
+    login,
+    run_user_provisioning_worker,
+    get_provisioning_status
+)
+from controllers.catalogtypes import run_product_counter_reconciliation
+from controllers.catalogs import CATALOG_CHANGE_STREAM, run_catalog_change_stream
+from controllers.order_statuses import get_transition_table
+from controllers.orders import backfill_order_status
+from controllers.bundle_details import backfill_bundle_compositions
 from models.users import User
 from models.login import Login
 
 from utils.security import validateuser, validateadmin
+from utils.rate_limit import RateLimitMiddleware, build_rate_limiter
+from utils.compression import CompressionMiddleware
+from utils.services import services
+from utils.cache_versions import version_stamps
+from utils.catalog_cache import catalog_cache
+from utils.response_cache import response_cache
+from utils.json_response import FastJSONResponse
+from utils.event_hub import event_hub, MongoEventBackend
+from utils.task_queue import task_queue
+from utils.outbox import outbox_dispatcher
+from utils.idempotency import idempotency_store
+from utils.indexes import ensure_indexes
 
 from routes.catalogtypes import router as catalogtypes_router
 from routes.catalogs import router as catalogs_router
@@ -16,7 +41,57 @@ from routes.order_statuses import router as order_statuses_router
 from routes.orders import router as orders_router
 from routes.order_details import router as order_details_router
 
-app = FastAPI()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tareas en segundo plano que viven mientras la app está arriba.
+    # Mongo y Firebase se calientan en un hilo para no retrasar el arranque.
+    background_tasks = [
+        asyncio.create_task(warm_up_services()),
+        asyncio.create_task(version_stamps.run_poller()),
+        asyncio.create_task(run_user_provisioning_worker()),
+        asyncio.create_task(run_product_counter_reconciliation()),
+        asyncio.create_task(task_queue.run()),
+        asyncio.create_task(outbox_dispatcher.run())
+    ]
+    if CATALOG_CHANGE_STREAM:
+        background_tasks.append(asyncio.create_task(run_catalog_change_stream()))
+    # Con varios workers los eventos del hub se reparten por una colección capped
+    if os.getenv("EVENT_HUB_BACKEND") == "mongo":
+        backend = MongoEventBackend(services.collection("hub_events"))
+        event_hub.set_backend(backend)
+        background_tasks.append(asyncio.create_task(backend.run(event_hub)))
+    yield
+    # Terminar las tareas encoladas antes de cerrar workers y conexiones
+    await task_queue.drain()
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+    services.close()
+
+async def warm_up_services():
+    try:
+        await asyncio.to_thread(services.warm_up)
+        await asyncio.to_thread(ensure_indexes)
+        await asyncio.to_thread(backfill_bundle_compositions)
+        await catalog_cache.warm_up()
+        await asyncio.to_thread(get_transition_table)
+        await asyncio.to_thread(backfill_order_status)
+    except Exception as e:
+        logger.error(f"Service warm-up failed: {e}")
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Compresión gzip/brotli (COMPRESSION_MIN_SIZE, COMPRESSION_CONTENT_TYPES)
+app.add_middleware(CompressionMiddleware)
+
+# Rate limiting (se registra antes que CORS para que las respuestas 429 lleven sus headers)
+rate_limiter = build_rate_limiter()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 # Add CORS
 from fastapi.middleware.cors import CORSMiddleware
@@ -35,9 +110,6 @@ app.include_router(order_statuses_router)
 app.include_router(orders_router)
 app.include_router(order_details_router)
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 @app.get("/")
 def read_root():
     return {"version": "0.0.0"}
@@ -71,6 +143,24 @@ def readiness_check():
 async def create_user_endpoint(user: User) -> User:
     return await create_user(user)
 
+@app.get("/users/provisioning")
+@validateadmin
+async def provisioning_status(request: Request) -> dict:
+    return await get_provisioning_status()
+
+@app.get("/metrics")
+@validateadmin
+async def metrics(request: Request) -> dict:
+    return {
+        "rate_limit": rate_limiter.metrics(),
+        "catalog_cache": catalog_cache.stats,
+        "response_cache": response_cache.metrics(),
+        "event_hub": event_hub.metrics(),
+        "task_queue": task_queue.metrics(),
+        "outbox": outbox_dispatcher.metrics(),
+        "idempotency": idempotency_store.metrics()
+    }
+
 @app.post("/login")
 async def login_access(l: Login) -> dict:
     return await login(l)
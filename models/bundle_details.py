@@ -39,6 +39,10 @@ class BundleWithProducts(BaseModel):
     cost: float = Field(description="Costo del bundle")
     discount: int = Field(description="Descuento del bundle")
     active: bool = Field(description="Estado activo del bundle")
+    pricing: Optional[dict] = Field(
+        default=None,
+        description="Valor de los componentes, precio, ahorro y descuento efectivo del bundle"
+    )
     products: list[dict] = Field(description="Lista de productos en el bundle")
 
 # Modelo para agregar producto a bundle
@@ -60,3 +64,11 @@ class AddProductToBundle(BaseModel):
         if value <= 0:
             raise ValueError("La cantidad debe ser mayor a 0")
         return value
+
+# Modelo para agregar varios productos al bundle en una sola petición
+class AddProductsToBundle(BaseModel):
+    items: list[AddProductToBundle] = Field(
+        description="Productos a agregar con su cantidad",
+        min_length=1,
+        max_length=100
+    )
@@ -13,4 +13,15 @@ class OrderStatus(BaseModel):
         max_length=50,
         pattern=r"^[a-zA-Z0-9\s\-_]+$",  # Solo letras, números, espacios, guiones y guiones bajos
         examples=["ordered", "pending", "processing", "shipped", "delivered", "cancelled"]
-    )
\ No newline at end of file
+    )
+
+    next_statuses: Optional[list[str]] = Field(
+        default=None,
+        description="Descripciones de los estados a los que se puede pasar desde este. Si se omite se usa el grafo por defecto",
+        examples=[["processing", "cancelled"]]
+    )
+
+    requires_products: Optional[bool] = Field(
+        default=None,
+        description="Si la orden debe tener productos activos para entrar en este estado. Si se omite se usa el valor por defecto"
+    )
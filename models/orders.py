@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
+from models.order_details import CreateOrderDetail
 
 class Order(BaseModel):
     id: Optional[str] = Field(
@@ -61,3 +62,20 @@ class CreateOrder(BaseModel):
         json_schema_extra = {
             "example": {}
         }
+
+class OrderQuote(BaseModel):
+    """Carrito tentativo a cotizar, sin crear la orden"""
+    items: list[CreateOrderDetail] = Field(
+        min_length=1,
+        max_length=100,
+        description="Productos y cantidades del carrito"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {"id_producto": "507f1f77bcf86cd799439012", "quantity": 2}
+                ]
+            }
+        }
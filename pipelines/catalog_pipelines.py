@@ -31,99 +31,51 @@ def get_catalog_with_type_pipeline(catalog_id: str) -> list:
         }}
     ]
 
-def get_catalogs_by_type_pipeline(catalog_type_description: str, skip: int = 0, limit: int = 10) -> list:
+def get_catalogs_by_type_pipeline(catalog_type_ids: list[str], skip: int = 0, limit: int = 10) -> list:
     """
-    Pipeline para obtener catálogos filtrados por tipo con paginación
+    Pipeline para obtener catálogos de uno o varios tipos con paginación.
+    Los ids de tipo se resuelven antes (registro de tipos), así el $match usa
+    el índice (id_catalog_type, active) y la página y el total salen de un $facet.
     """
     return [
-        {"$addFields": {
-            "id_catalog_type_obj": {"$toObjectId": "$id_catalog_type"}
-        }},
-        {"$lookup": {
-            "from": "catalogtypes",
-            "localField": "id_catalog_type_obj",
-            "foreignField": "_id",
-            "as": "catalog_type"
-        }},
-        {"$unwind": "$catalog_type"},
         {"$match": {
-            "catalog_type.description": {"$regex": f"^{catalog_type_description}$", "$options": "i"},
+            "id_catalog_type": {"$in": catalog_type_ids},
             "active": True
         }},
-        {"$project": {
-            "id": {"$toString": "$_id"},
-            "id_catalog_type": {"$toString": "$id_catalog_type"},
-            "name": "$name",
-            "description": "$description",
-            "cost": "$cost",
-            "discount": "$discount",
-            "active": "$active"
-        }},
-        {"$skip": skip},
-        {"$limit": limit}
-    ]
-
-def get_all_catalogs_with_types_pipeline(skip: int = 0, limit: int = 10) -> list:
-    """
-    Pipeline para obtener todos los catálogos con información del tipo
-    """
-    return [
-        {"$addFields": {
-            "id_catalog_type_obj": {"$toObjectId": "$id_catalog_type"}
-        }},
-        {"$lookup": {
-            "from": "catalogtypes",
-            "localField": "id_catalog_type_obj",
-            "foreignField": "_id",
-            "as": "catalog_type"
-        }},
-        {"$unwind": "$catalog_type"},
-        {"$match": {
-            "catalog_type.active": True
-        }},
-        {"$project": {
-            "_id": 0,  # Excluir el _id original
-            "id": {"$toString": "$_id"},
-            "id_catalog_type": {"$toString": "$id_catalog_type"},
-            "name": "$name",
-            "description": "$description",
-            "cost": "$cost",
-            "discount": "$discount",
-            "active": "$active",
-            "catalog_type_description": "$catalog_type.description"
-        }},
-        {"$skip": skip},
-        {"$limit": limit}
-    ]
-
-def validate_catalog_type_pipeline(catalog_type_id: str) -> list:
-    """
-    Pipeline para validar que un catalog type existe y está activo
-    """
-    return [
-        {"$match": {
-            "_id": ObjectId(catalog_type_id),
-            "active": True
-        }},
-        {"$project": {
-            "id": {"$toString": "$_id"},
-            "description": "$description",
-            "active": "$active"
+        {"$facet": {
+            "catalogs": [
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": {
+                    "_id": 0,
+                    "id": {"$toString": "$_id"},
+                    "id_catalog_type": {"$toString": "$id_catalog_type"},
+                    "name": "$name",
+                    "description": "$description",
+                    "cost": "$cost",
+                    "discount": "$discount",
+                    "active": "$active"
+                }}
+            ],
+            "total": [{"$count": "total"}]
         }}
     ]
 
 def search_catalogs_pipeline(search_term: str, skip: int = 0, limit: int = 10) -> list:
     """
-    Pipeline para buscar catálogos por nombre o descripción
+    Pipeline para buscar catálogos por nombre o descripción usando el índice
+    de texto (catalogs_text_search), ordenados por relevancia.
+    $text interpreta la entrada como palabras, nunca como expresión regular.
     """
     return [
         {"$match": {
-            "$or": [
-                {"name": {"$regex": search_term, "$options": "i"}},
-                {"description": {"$regex": search_term, "$options": "i"}}
-            ],
+            "$text": {"$search": search_term},
             "active": True
         }},
+        {"$addFields": {
+            "score": {"$meta": "textScore"}
+        }},
+        {"$sort": {"score": -1}},
         {"$addFields": {
             "id_catalog_type_obj": {"$toObjectId": "$id_catalog_type"}
         }},
@@ -134,7 +86,13 @@ def search_catalogs_pipeline(search_term: str, skip: int = 0, limit: int = 10) -
             "as": "catalog_type"
         }},
         {"$unwind": "$catalog_type"},
+        # Mismo criterio que el listado: solo tipos activos (sin el campo cuenta como activo)
+        {"$match": {"catalog_type.active": {"$ne": False}}},
+        # Se pagina tras el filtro por tipo: los catálogos excluidos no dejan páginas cortas
+        {"$skip": skip},
+        {"$limit": limit},
         {"$project": {
+            "_id": 0,
             "id": {"$toString": "$_id"},
             "id_catalog_type": {"$toString": "$id_catalog_type"},
             "name": "$name",
@@ -142,8 +100,7 @@ def search_catalogs_pipeline(search_term: str, skip: int = 0, limit: int = 10) -
             "cost": "$cost",
             "discount": "$discount",
             "active": "$active",
-            "catalog_type_description": "$catalog_type.description"
-        }},
-        {"$skip": skip},
-        {"$limit": limit}
+            "catalog_type_description": "$catalog_type.description",
+            "score": "$score"
+        }}
     ]
@@ -1,76 +1,36 @@
 from bson import ObjectId
 
-def get_catalog_type_pipeline() -> list:
-    return [
+def get_catalog_type_pipeline(catalog_type_id: str = None) -> list:
+    """
+    Listado de tipos (o uno solo si se indica catalog_type_id). number_of_products
+    es un contador mantenido en el propio documento (ver adjust_product_count /
+    reconcile_product_counters).
+    """
+    pipeline = []
+    if catalog_type_id:
+        pipeline.append({"$match": {"_id": ObjectId(catalog_type_id)}})
+    return pipeline + [
         {
-            "$addFields": {
-                "id": {"$toString": "$_id"}
-            }
-        },{
-            "$lookup": {
-                "from": "catalogs",
-                "localField": "id",
-                "foreignField": "id_catalog_type",
-                "as": "result"
-            }
-        },{
-            "$group": {
-                "_id": {
-                    "id": "$id",
-                    "description": "$description",
-                    "active": "$active"
-                },
-                "number_of_products": {
-                    "$sum": {"$size": "$result"}
-                }
-            }
-        },{
             "$project": {
                 "_id": 0,
-                "id": "$_id.id",
-                "description": "$_id.description",
-                "active": "$_id.active",
-                "number_of_products": 1
+                "id": {"$toString": "$_id"},
+                "description": 1,
+                "active": 1,
+                "number_of_products": {"$ifNull": ["$number_of_products", 0]}
             }
         }
     ]
 
 
-def validate_type_is_assigned_pipeline(id: str) -> list:
-    return [
-        {
-            "$match": {
-                "_id": ObjectId(id),
-            }
-        },{
-            "$addFields": {
-                "id": {"$toString": "$_id"}
-            }
-        },{
-            "$lookup": {
-                "from": "catalogs",
-                "localField": "id",
-                "foreignField": "id_catalog_type",
-                "as": "result"
-            }
-        },{
-            "$group": {
-                "_id": {
-                    "id": "$id",
-                    "description": "$description",
-                    "active": "$active"
-                },
-                "number_of_products": {
-                    "$sum": {"$size": "$result"}
-                }
-            }
-        },{
-            "$project": {
-                "_id": 0,
-                "id": "$_id.id",
-                "description": "$_id.description",
-                "active": "$_id.active",
-                "number_of_products": 1
-            }
+def count_products_by_type_pipeline(type_ids: list[str] = None) -> list:
+    """Conteo real de productos por tipo, para reconciliar los contadores"""
+    pipeline = []
+    if type_ids is not None:
+        pipeline.append({"$match": {"id_catalog_type": {"$in": type_ids}}})
+    pipeline.append({
+        "$group": {
+            "_id": "$id_catalog_type",
+            "number_of_products": {"$sum": 1}
         }
-    ]
\ No newline at end of file
+    })
+    return pipeline
\ No newline at end of file
@@ -87,4 +87,18 @@ def search_order_status_pipeline(search_term: str, skip: int = 0, limit: int = 1
         }},
         {"$skip": skip},
         {"$limit": limit}
-    ]
\ No newline at end of file
+    ]
+
+
+def get_order_statuses_pipeline(order_status_id: str = None) -> list:
+    """
+    Pipeline para obtener estados de orden con el _id ya convertido a id
+    """
+    pipeline = []
+    if order_status_id:
+        pipeline.append({"$match": {"_id": ObjectId(order_status_id)}})
+    pipeline += [
+        {"$addFields": {"id": {"$toString": "$_id"}}},
+        {"$project": {"_id": 0}}
+    ]
+    return pipeline
@@ -1,19 +1,29 @@
 from fastapi import APIRouter, HTTPException, Request
-from models.bundle_details import BundleWithProducts, AddProductToBundle
+from models.bundle_details import BundleWithProducts, AddProductToBundle, AddProductsToBundle
 from controllers.bundle_details import (
     get_bundle_with_products,
+    get_bundles_pricing,
     add_product_to_bundle,
+    add_products_to_bundle,
     remove_product_from_bundle
 )
 from utils.security import validateadmin
+from utils.response_cache import cached_response
 
 router = APIRouter()
 
 @router.get("/bundle/{bundle_id}", response_model=BundleWithProducts, tags=["🎁 Bundle Details"])
-async def get_bundle_with_products_endpoint(bundle_id: str) -> BundleWithProducts:
+@cached_response("catalog", model=BundleWithProducts)
+async def get_bundle_with_products_endpoint(request: Request, bundle_id: str) -> BundleWithProducts:
     """Obtener información completa del bundle con todos sus productos"""
     return await get_bundle_with_products(bundle_id)
 
+@router.get("/bundles/pricing", response_model=dict, tags=["🎁 Bundle Details"])
+@cached_response("catalog")
+async def get_bundles_pricing_endpoint(request: Request) -> dict:
+    """Precio de todos los bundles frente a comprar sus productos por separado"""
+    return await get_bundles_pricing()
+
 @router.post("/bundles/{bundle_id}/product", tags=["🎁 Bundle Details"])
 @validateadmin
 async def add_product_to_bundle_endpoint(
@@ -24,6 +34,16 @@ async def add_product_to_bundle_endpoint(
     """Agregar un producto al bundle (requiere permisos de admin)"""
     return await add_product_to_bundle(bundle_id, product_data)
 
+@router.post("/bundles/{bundle_id}/products", tags=["🎁 Bundle Details"])
+@validateadmin
+async def add_products_to_bundle_endpoint(
+    bundle_id: str,
+    products_data: AddProductsToBundle,
+    request: Request
+) -> dict:
+    """Agregar varios productos al bundle en una sola operación (requiere permisos de admin)"""
+    return await add_products_to_bundle(bundle_id, products_data)
+
 @router.delete("/bundles/{bundle_id}/product/{bundle_detail_id}", tags=["🎁 Bundle Details"])
 @validateadmin
 async def remove_product_from_bundle_endpoint(
@@ -1,13 +1,20 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from models.catalogs import Catalog
 from controllers.catalogs import (
     create_catalog,
     get_catalogs,
     get_catalog_by_id,
+    get_catalogs_by_type,
+    search_catalogs,
+    import_catalogs,
+    catalog_event_stream,
     update_catalog,
     deactivate_catalog
 )
 from utils.security import validateadmin
+from utils.http_cache import conditional_get
+from utils.response_cache import cached_response
 
 router = APIRouter()
 
@@ -17,13 +24,64 @@ async def create_catalog_endpoint(request: Request, catalog: Catalog) -> Catalog
     """Crear un nuevo catálogo"""
     return await create_catalog(catalog)
 
+@router.post("/catalogs/import", response_model=dict, tags=["📋 Catalogs"])
+@validateadmin
+async def import_catalogs_endpoint(
+    request: Request,
+    format: str = Query(default=None, pattern="^(csv|ndjson)$", description="csv o ndjson; por defecto según Content-Type")
+) -> dict:
+    """Importar catálogos en bloque (CSV con encabezado o NDJSON) con reporte por fila"""
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "json" in content_type else "csv"
+    return await import_catalogs(request.stream(), format)
+
 @router.get("/catalogs", response_model=dict, tags=["📋 Catalogs"])
-async def get_catalogs_endpoint() -> dict:
+@conditional_get("catalog", route="catalogs")
+@cached_response("catalog")
+async def get_catalogs_endpoint(request: Request, response: Response) -> dict:
     """Obtener todos los catálogos"""
     return await get_catalogs()
 
+@router.get("/catalogs/search", response_model=dict, tags=["📋 Catalogs"])
+async def search_catalogs_endpoint(
+    q: str = Query(min_length=2, max_length=100, description="Texto a buscar en nombre y descripción"),
+    fuzzy: bool = Query(default=False, description="Tolerar errores de escritura"),
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=10, ge=1, le=50)
+) -> dict:
+    """Buscar catálogos por relevancia"""
+    return await search_catalogs(q, skip, limit, fuzzy)
+
+@router.get("/catalogs/stream", tags=["📋 Catalogs"])
+async def catalog_stream_endpoint(
+    last_event_id: str | None = Header(default=None),
+    last_event_id_query: str | None = Query(default=None, alias="last_event_id")
+) -> StreamingResponse:
+    """Cambios del menú en vivo (Server-Sent Events): created, updated, deactivated, reset"""
+    return StreamingResponse(
+        catalog_event_stream(last_event_id or last_event_id_query),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/catalogs/type/{catalog_type}", response_model=dict, tags=["📋 Catalogs"])
+@conditional_get("catalog", route="catalogs")
+@cached_response("catalog")
+async def get_catalogs_by_type_endpoint(
+    request: Request,
+    response: Response,
+    catalog_type: str,
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=10, ge=1, le=100)
+) -> dict:
+    """Obtener catálogos activos por tipo (id o descripción del tipo)"""
+    return await get_catalogs_by_type(catalog_type, skip, limit)
+
 @router.get("/catalogs/{catalog_id}", response_model=Catalog, tags=["📋 Catalogs"])
-async def get_catalog_by_id_endpoint(catalog_id: str) -> Catalog:
+@conditional_get("catalog", route="catalogs")
+@cached_response("catalog", model=Catalog)
+async def get_catalog_by_id_endpoint(request: Request, response: Response, catalog_id: str) -> Catalog:
     """Obtener un catálogo por ID"""
     return await get_catalog_by_id(catalog_id)
 
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response
 from models.catalogtypes import CatalogType
 from controllers.catalogtypes import (
     create_catalog_type,
     get_catalog_types,
     get_catalog_type_by_id,
     update_catalog_type,
-    deactivate_catalog_type
+    deactivate_catalog_type,
+    reconcile_product_counters
 )
-from utils.security import validateuser
+from utils.security import validateuser, validateadmin
+from utils.http_cache import conditional_get
+from utils.response_cache import cached_response
 
 router = APIRouter()
 
@@ -18,12 +21,16 @@ async def create_catalog_type_endpoint(request: Request, catalog_type: CatalogTy
 
 @router.get("/catalogtypes", response_model=list, tags=["📂 Catalog Types"])
 @validateuser
-async def get_catalog_types_endpoint(request: Request, ) -> list:
+@conditional_get("catalogtypes", "catalog", route="catalogtypes")
+@cached_response("catalogtypes", "catalog")
+async def get_catalog_types_endpoint(request: Request, response: Response) -> list:
     return await get_catalog_types()
 
 @router.get("/catalogtypes/{catalog_type_id}", response_model=CatalogType, tags=["📂 Catalog Types"])
 @validateuser
-async def get_catalog_type_by_id_endpoint(request: Request, catalog_type_id: str) -> CatalogType:
+@conditional_get("catalogtypes", route="catalogtypes")
+@cached_response("catalogtypes", model=CatalogType)
+async def get_catalog_type_by_id_endpoint(request: Request, response: Response, catalog_type_id: str) -> CatalogType:
     return await get_catalog_type_by_id(catalog_type_id)
 
 @router.put("/catalogtypes/{catalog_type_id}", response_model=CatalogType, tags=["📂 Catalog Types"])
@@ -35,3 +42,9 @@ async def update_catalog_type_endpoint(request: Request, catalog_type_id: str, c
 @validateuser
 async def deactivate_catalog_type_endpoint(request: Request, catalog_type_id: str) -> dict:
     return await deactivate_catalog_type(catalog_type_id)
+
+@router.post("/catalogtypes/reconcile", response_model=dict, tags=["📂 Catalog Types"])
+@validateadmin
+async def reconcile_catalog_types_endpoint(request: Request) -> dict:
+    """Recalcular el número de productos de cada tipo (requiere permisos de admin)"""
+    return await reconcile_product_counters()
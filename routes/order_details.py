@@ -7,12 +7,14 @@ from controllers.order_details import (
     delete_order_detail
 )
 from utils.security import validateuser
+from utils.idempotency import idempotent
 
 router = APIRouter(prefix="/orders")
 
 
 @router.post("/{order_id}/detail", tags=["� Order Details"])
 @validateuser
+@idempotent
 async def add_product_to_order(
     request: Request,
     order_id: str,
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 from models.order_statuses import OrderStatus
 from controllers.order_statuses import (
     create_order_status,
     get_order_statuses,
     get_order_status_by_id,
+    get_order_status_transitions,
     update_order_status,
     delete_order_status
 )
 from utils.security import validateadmin
+from utils.http_cache import conditional_get
+from utils.response_cache import cached_response
 
 router = APIRouter()
 
@@ -21,12 +24,23 @@ async def create_order_status_endpoint(
     return await create_order_status(order_status)
 
 @router.get("/order-statuses", tags=["📊 Order Status"])
-async def get_order_statuses_endpoint() -> dict:
+@conditional_get("order_statuses", route="order_statuses")
+@cached_response("order_statuses")
+async def get_order_statuses_endpoint(request: Request, response: Response) -> dict:
     """Obtener todos los order statuses"""
     return await get_order_statuses()
 
+@router.get("/order-statuses/transitions", tags=["📊 Order Status"])
+@conditional_get("order_statuses", route="order_statuses")
+@cached_response("order_statuses")
+async def get_order_status_transitions_endpoint(request: Request, response: Response) -> dict:
+    """Grafo de transiciones entre estados (se edita con next_statuses y requires_products)"""
+    return await get_order_status_transitions()
+
 @router.get("/order-statuses/{order_status_id}", tags=["📊 Order Status"])
-async def get_order_status_by_id_endpoint(order_status_id: str) -> dict:
+@conditional_get("order_statuses", route="order_statuses")
+@cached_response("order_statuses")
+async def get_order_status_by_id_endpoint(request: Request, response: Response, order_status_id: str) -> dict:
     """Obtener un order status por ID"""
     return await get_order_status_by_id(order_status_id)
 
@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Query, HTTPException, Request
-from models.orders import CreateOrder
+from fastapi import APIRouter, Header, Query, HTTPException, Request, WebSocket, status
+from fastapi.responses import StreamingResponse
+from models.orders import CreateOrder, OrderQuote
 from models.change_order_status import ChangeOrderStatus
 from controllers.orders import (
     create_order,
     get_orders,
     get_order_by_id,
+    get_kitchen_queue,
+    kitchen_event_stream,
+    quote_order,
+    stream_user_order_events,
     update_order_status
 )
-from utils.security import validateuser, validateadmin
+from utils.security import validateuser, validateadmin, decode_user_token
+from utils.json_response import FastJSONResponse
+from utils.idempotency import idempotent
 
 router = APIRouter(prefix="/orders")
 
 
 @router.post("/", tags=["📦 Orders"])
 @validateuser
+@idempotent
 async def create_new_order(
     request: Request,
     order_data: CreateOrder
@@ -28,6 +36,21 @@ async def create_new_order(
     return result
 
 
+@router.post("/quote", tags=["📦 Orders"])
+@validateuser
+async def quote_cart(
+    request: Request,
+    quote: OrderQuote
+):
+    """Totales de un carrito tentativo (subtotal, impuestos, descuento) sin crear la orden"""
+    result = await quote_order(quote)
+
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+
+    return result
+
+
 @router.get("/", tags=["📦 Orders"])
 @validateuser
 async def get_all_orders(
@@ -49,7 +72,53 @@ async def get_all_orders(
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
     
-    return result
+    # Respuesta directa: se omite el jsonable_encoder de FastAPI en listados grandes
+    return FastJSONResponse(result)
+
+
+@router.get("/kitchen", tags=["📦 Orders"])
+@validateadmin
+async def get_kitchen_queue_endpoint(
+    request: Request,
+    limit: int = Query(default=50, ge=1, le=200, description="Número máximo de órdenes")
+):
+    """Órdenes en preparación (ordered/processing), las más antiguas primero"""
+    result = await get_kitchen_queue(limit=limit)
+
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+
+    return FastJSONResponse(result)
+
+
+@router.get("/kitchen/stream", tags=["📦 Orders"])
+@validateadmin
+async def kitchen_stream_endpoint(
+    request: Request,
+    last_event_id: str | None = Header(default=None)
+):
+    """Avisos en vivo (SSE) cuando una orden entra o sale de la cola de cocina"""
+    return StreamingResponse(
+        kitchen_event_stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/ws")
+async def orders_websocket(
+    websocket: WebSocket,
+    token: str = Query(..., description="JWT del usuario (el navegador no envía headers en WebSocket)"),
+    last_event_id: str | None = Query(default=None)
+):
+    """Cambios de estado de las órdenes del usuario autenticado, en vivo"""
+    payload = decode_user_token(token)
+    if payload is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await stream_user_order_events(websocket, payload["id"], last_event_id)
 
 
 @router.get("/{order_id}", tags=["📦 Orders"])
@@ -76,7 +145,7 @@ async def get_order_details(
         else:
             raise HTTPException(status_code=400, detail=result["message"])
     
-    return result
+    return FastJSONResponse(result)
 
 
 @router.put("/{order_id}/status", summary="Finalizar orden (cambiar a Ordered)", tags=["📦 Orders"])
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from utils.bundle_pricing import compute_bundle_pricing
+
+
+PRODUCTS = {
+    "cafe": {"cost": 30.0, "discount": 0},
+    "pan": {"cost": 20.0, "discount": 50},
+    "combo": {"cost": 40.0, "discount": 0},
+    "vacio": {"cost": 10.0, "discount": 0}
+}
+
+
+def test_pricing_for_every_bundle():
+    bundles = {
+        "combo": [{"id_producto": "cafe", "quantity": 1}, {"id_producto": "pan", "quantity": 2}],
+        "vacio": []
+    }
+
+    pricing = compute_bundle_pricing(bundles, PRODUCTS)
+
+    # 30 + 2 * (20 con 50% de descuento) = 50 frente a 40 del combo
+    assert pricing["combo"] == {
+        "component_total": 50.0,
+        "bundle_price": 40.0,
+        "savings": 10.0,
+        "effective_discount": 20.0
+    }
+    # Sin componentes no hay descuento efectivo (y no se divide entre cero)
+    assert pricing["vacio"]["effective_discount"] == 0.0
+
+def test_unknown_components_and_bundles_are_ignored():
+    bundles = {
+        "combo": [{"id_producto": "cafe", "quantity": 1}, {"id_producto": "borrado", "quantity": 3}],
+        "no_existe": [{"id_producto": "cafe", "quantity": 1}]
+    }
+
+    pricing = compute_bundle_pricing(bundles, PRODUCTS)
+
+    assert set(pricing) == {"combo"}
+    assert pricing["combo"]["component_total"] == 30.0
@@ -0,0 +1,29 @@
+from utils.catalog_search import CatalogSearchIndex
+
+PRODUCTS = [
+    {"id": "1", "name": "Galletas de avena", "description": "Hechas artesanalmente", "active": True},
+    {"id": "2", "name": "Chocolate Premium", "description": "Cacao al 70%", "active": True},
+    {"id": "3", "name": "Café americano", "description": "Taza de 12 oz", "active": True},
+    {"id": "4", "name": "Galletas de chocolate", "description": "Con chispas", "active": False},
+]
+
+
+def test_exact_search_ranks_name_matches_first():
+    index = CatalogSearchIndex(PRODUCTS)
+    results = index.search("chocolate", fuzzy=False)
+
+    # El producto inactivo no se devuelve
+    assert [r["id"] for r in results] == ["2"]
+
+def test_fuzzy_search_tolerates_typos_and_accents():
+    index = CatalogSearchIndex(PRODUCTS)
+
+    assert index.search("galetas")[0]["id"] == "1"
+    assert index.search("cafe")[0]["id"] == "3"
+    assert index.search("choco")[0]["id"] == "2"
+
+def test_regex_metacharacters_are_plain_text():
+    index = CatalogSearchIndex(PRODUCTS)
+
+    assert index.search("(a+)+$") == []
+    assert index.search(".*") == []
@@ -0,0 +1,46 @@
+from bson import ObjectId
+
+import utils.catalog_type_registry as registry_module
+from utils.catalog_type_registry import CatalogTypeRegistry
+
+TYPE_ID = ObjectId()
+
+
+class FakeCatalogTypes:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        return list(self.docs)
+
+
+def make_registry(monkeypatch, docs):
+    collection = FakeCatalogTypes(docs)
+    monkeypatch.setattr(registry_module.services, "collection", lambda name: collection)
+    return CatalogTypeRegistry(), collection
+
+
+def test_reloads_after_invalidate(monkeypatch):
+    registry, collection = make_registry(monkeypatch, [{"_id": TYPE_ID, "description": "Bebidas"}])
+    assert registry.ids_for(" bebidas ") == [str(TYPE_ID)]
+
+    collection.docs = [{"_id": TYPE_ID, "description": "Postres", "active": False}]
+    registry.invalidate()
+
+    assert registry.ids_for("Bebidas") == []
+    assert registry.get(str(TYPE_ID)) == {"id": str(TYPE_ID), "description": "Postres", "active": False}
+
+def test_invalidate_between_load_and_read_keeps_loaded_maps(monkeypatch):
+    registry, _ = make_registry(monkeypatch, [{"_id": TYPE_ID, "description": "Bebidas"}])
+    ensure_loaded = registry._ensure_loaded
+
+    # El poller invalida justo después de la carga y antes de leer el mapa
+    def racing_load():
+        maps = ensure_loaded()
+        registry.invalidate()
+        return maps
+
+    monkeypatch.setattr(registry, "_ensure_loaded", racing_load)
+
+    assert registry.get(str(TYPE_ID))["description"] == "Bebidas"
+    assert registry.ids_for("bebidas") == [str(TYPE_ID)]
@@ -0,0 +1,57 @@
+import gzip
+import asyncio
+
+from utils import compression
+from utils.compression import CompressionMiddleware, choose_encoding
+
+
+def _run(app, accept_encoding=None):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    scope = {"type": "http", "method": "GET", "path": "/catalogs", "headers": headers}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, receive, send))
+    return dict(sent[0]["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+def _json_app(body: bytes, content_type: bytes = b"application/json"):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode())
+        ]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+def test_choose_encoding_respects_q_values(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding(None) is None
+
+def test_large_json_is_gzipped(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    body = b'{"catalogs":[' + b",".join(b'{"name":"cafe"}' for _ in range(50)) + b"]}"
+
+    headers, sent_body = _run(_json_app(body), "gzip")
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(sent_body)
+    assert gzip.decompress(sent_body) == body
+
+def test_small_or_streamed_responses_pass_through():
+    headers, sent_body = _run(_json_app(b'{"ok":true}'), "gzip")
+    assert b"content-encoding" not in headers
+    assert sent_body == b'{"ok":true}'
+
+    big = b"data: x\n\n" * 100
+    headers, sent_body = _run(_json_app(big, b"text/event-stream"), "gzip")
+    assert b"content-encoding" not in headers
+    assert sent_body == big
@@ -0,0 +1,130 @@
+import asyncio
+
+from utils.event_hub import EventHub, RESET_EVENT, format_sse
+
+
+def test_subscribers_receive_published_events():
+    async def scenario():
+        hub = EventHub()
+        async with hub.subscribe("catalog") as first, hub.subscribe("catalog") as second:
+            hub.publish("catalog", "updated", {"id": "1", "cost": 25.0})
+            hub.publish("orders", "created", {"id": "9"})
+            events = [await first.next(0.1), await second.next(0.1)]
+            # Sin novedades se devuelve None para enviar el heartbeat
+            assert await first.next(0.01) is None
+        return events, hub.metrics()
+
+    events, metrics = asyncio.run(scenario())
+    assert [e.type for e in events] == ["updated", "updated"]
+    assert metrics["subscribers"]["catalog"] == 0
+    assert format_sse(events[0]) == f'id: {events[0].id}\nevent: updated\ndata: {{"id":"1","cost":25.0}}\n\n'
+    assert events[0].id.endswith("-1")
+
+def test_resume_replays_missed_events():
+    async def scenario():
+        hub = EventHub()
+        for i in range(3):
+            hub.publish("catalog", "updated", {"id": str(i)})
+        async with hub.subscribe("catalog", last_event_id=f"{hub.epoch}-1") as subscription:
+            return [(await subscription.next(0.1)).data["id"] for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["1", "2"]
+
+def test_resume_outside_buffer_sends_reset():
+    async def scenario():
+        hub = EventHub(buffer_size=2)
+        for i in range(5):
+            hub.publish("catalog", "updated", {"id": str(i)})
+        async with hub.subscribe("catalog", last_event_id=f"{hub.epoch}-1") as old, \
+                hub.subscribe("catalog", last_event_id=f"{hub.epoch}-99") as future:
+            return (await old.next(0.1)).type, (await future.next(0.1)).type
+
+    assert asyncio.run(scenario()) == (RESET_EVENT, RESET_EVENT)
+
+def test_ids_from_another_worker_send_reset():
+    async def scenario():
+        hub, other = EventHub(), EventHub()
+        for i in range(3):
+            hub.publish("catalog", "updated", {"id": str(i)})
+        # Mismo número pero de otra época: no se reanuda con eventos ajenos
+        foreign_id = other.publish("catalog", "updated", {"id": "x"}).id
+        async with hub.subscribe("catalog", last_event_id=foreign_id) as foreign, \
+                hub.subscribe("catalog", last_event_id="1") as legacy:
+            return (await foreign.next(0.1)).type, (await legacy.next(0.1)).type
+
+    assert asyncio.run(scenario()) == (RESET_EVENT, RESET_EVENT)
+
+def test_restart_epoch_resets_subscribers():
+    async def scenario():
+        hub = EventHub()
+        last_id = hub.publish("catalog", "updated", {"id": "1"}).id
+        async with hub.subscribe("catalog", last_event_id=last_id) as subscription:
+            hub.restart_epoch()
+            reset = await subscription.next(0.1)
+        # Tras perder eventos de otros workers ningún id anterior es reanudable
+        return reset.type, hub.replay("catalog", last_id)
+
+    assert asyncio.run(scenario()) == (RESET_EVENT, None)
+
+def test_events_of_other_topics_do_not_force_a_reset():
+    async def scenario():
+        hub = EventHub(buffer_size=2)
+        # Ids globales intercalados: catalog recibe 1, 3 y 5
+        for i in range(5):
+            hub.publish("catalog" if i % 2 == 0 else "orders", "updated", {"id": str(i)})
+        async with hub.subscribe("catalog", last_event_id=f"{hub.epoch}-1") as subscription:
+            return [(await subscription.next(0.1)).seq for _ in range(2)]
+
+    # El 1 ya salió del buffer pero el cliente lo tenía: no falta nada
+    assert asyncio.run(scenario()) == [3, 5]
+
+def test_slow_subscriber_is_reset_instead_of_blocking():
+    async def scenario():
+        hub = EventHub(queue_size=2)
+        async with hub.subscribe("catalog") as subscription:
+            for i in range(5):
+                hub.publish("catalog", "updated", {"id": str(i)})
+            return (await subscription.next(0.1)).type, subscription.queue.qsize()
+
+    assert asyncio.run(scenario())[0] == RESET_EVENT
+
+def test_per_user_topics_stay_bounded():
+    async def scenario():
+        # Ventana de replay nula: todo tema sin suscriptores se descarta al podar
+        hub = EventHub(replay_window=0)
+        hub.limit_topics("orders:", 5)
+        first_id = hub.publish("orders:u0", "status_changed", {"id": "0"}).id
+        async with hub.subscribe("orders:connected"):
+            for user in range(1000):
+                for i in range(10):
+                    hub.publish(f"orders:u{user}", "status_changed", {"id": str(i)})
+                hub.publish("orders:connected", "status_changed", {"id": str(user)})
+            metrics = hub.metrics()
+        async with hub.subscribe("orders:u0", last_event_id=first_id) as pruned:
+            return metrics, (await pruned.next(0.1)).type
+
+    metrics, resumed = asyncio.run(scenario())
+    # Solo queda el tema conectado (y el último publicado), con su buffer corto
+    assert metrics["topics"] <= 2 and metrics["buffered_events"] <= 10
+    assert len(metrics["subscribers"]) <= 2
+    # El tema descartado ya no puede reanudarse: el cliente recarga
+    assert resumed == RESET_EVENT
+
+def test_backend_forwards_only_local_publications():
+    class RecordingBackend:
+        def __init__(self):
+            self.forwarded = []
+
+        def forward(self, topic, event_type, data):
+            self.forwarded.append((topic, event_type))
+
+    hub = EventHub()
+    backend = RecordingBackend()
+    hub.set_backend(backend)
+
+    hub.publish("orders:u1", "status_changed", {"id": "1"})
+    # Un evento que llega de otro worker no se vuelve a reenviar
+    hub.publish("orders:u1", "status_changed", {"id": "2"}, forward=False)
+
+    assert backend.forwarded == [("orders:u1", "status_changed")]
+    assert hub.metrics()["published"] == 2
@@ -0,0 +1,71 @@
+import gzip
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Response
+
+from utils.cache_versions import version_stamps
+from utils.http_cache import conditional_get
+from utils.response_cache import cached_response, response_cache
+
+
+def make_request(**headers):
+    return SimpleNamespace(
+        url=SimpleNamespace(path="/catalogs", query=""),
+        headers={name.replace("_", "-"): value for name, value in headers.items()}
+    )
+
+
+@pytest.fixture(autouse=True)
+def stamps(monkeypatch):
+    monkeypatch.setattr(version_stamps, "_loaded", True)
+    monkeypatch.setattr(version_stamps, "_versions", {"catalog": 3})
+    response_cache.invalidate()
+
+
+def test_conditional_get_answers_304_for_the_current_version():
+    calls = []
+
+    @conditional_get("catalog", route="catalogs")
+    async def get_catalogs(request, response):
+        calls.append(request)
+        return {"success": True}
+
+    response = Response()
+    asyncio.run(get_catalogs(request=make_request(), response=response))
+    etag = response.headers["etag"]
+    # Débil: cubre también las variantes comprimidas
+    assert etag.startswith('W/"')
+
+    cached = asyncio.run(get_catalogs(request=make_request(if_none_match=etag), response=Response()))
+    assert cached.status_code == 304 and len(calls) == 1
+    # Algunos proxies quitan el prefijo W/ al reenviar el ETag
+    stripped = asyncio.run(get_catalogs(request=make_request(if_none_match=etag[2:]), response=Response()))
+    assert stripped.status_code == 304
+
+    # Una escritura sube la versión: el ETag guardado ya no vale
+    version_stamps._set("catalog", 4)
+    response = Response()
+    asyncio.run(get_catalogs(request=make_request(if_none_match=etag), response=response))
+    assert len(calls) == 2 and response.headers["etag"] != etag
+
+def test_cached_response_reuses_bytes_for_each_encoding():
+    calls = []
+    catalogs = {"success": True, "data": [{"name": f"Producto {i}"} for i in range(200)]}
+
+    @cached_response("catalog")
+    async def get_catalogs(request):
+        calls.append(request)
+        return catalogs
+
+    plain = asyncio.run(get_catalogs(request=make_request()))
+    compressed = asyncio.run(get_catalogs(request=make_request(accept_encoding="gzip")))
+    assert len(calls) == 1
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(compressed.body) == plain.body
+
+    # El cambio de versión descarta la entrada
+    version_stamps._set("catalog", 4)
+    asyncio.run(get_catalogs(request=make_request()))
+    assert len(calls) == 2
@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import utils.idempotency as idempotency
+from utils.idempotency import IdempotencyStore, idempotent, PROCESSING, COMPLETED
+
+
+class DuplicateKey(Exception):
+    code = 11000
+
+
+class FakeKeys:
+    """Lo mínimo de la colección idempotency_keys que usa el store"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def _find(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        for field, condition in query.items():
+            value = doc.get(field)
+            if isinstance(condition, dict):
+                if value is None or not value < condition["$lt"]:
+                    return None
+            elif value != condition:
+                return None
+        return doc
+
+    def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKey()
+        self.docs[doc["_id"]] = dict(doc)
+
+    def update_one(self, query, update):
+        doc = self._find(query)
+        if doc is not None:
+            doc.update(update.get("$set", {}))
+            for field in update.get("$unset", {}):
+                doc.pop(field, None)
+        return SimpleNamespace(modified_count=int(doc is not None))
+
+    def find_one(self, query):
+        doc = self._find(query)
+        return dict(doc) if doc else None
+
+    def delete_one(self, query):
+        if self._find(query) is not None:
+            del self.docs[query["_id"]]
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, key: str = "clave-1"):
+        self.headers = {"idempotency-key": key}
+        self.state = SimpleNamespace(id="user-1")
+        self.method = "POST"
+        self.url = SimpleNamespace(path="/orders")
+        self._body = body
+
+    async def body(self):
+        return self._body
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    collection = FakeKeys()
+    monkeypatch.setattr(idempotency, "idempotency_collection", collection)
+    monkeypatch.setattr(idempotency, "idempotency_store", IdempotencyStore())
+    return collection
+
+
+def test_retry_replays_the_stored_body(keys, monkeypatch):
+    calls = []
+
+    @idempotent
+    async def create_order(request):
+        calls.append(request)
+        return {"success": True, "data": {"n": len(calls)}}
+
+    first = asyncio.run(create_order(request=FakeRequest(b'{"total": 1}')))
+    again = asyncio.run(create_order(request=FakeRequest(b'{"total": 1}')))
+    assert len(calls) == 1
+    assert again.body == first.body
+    assert again.headers["idempotent-replayed"] == "true"
+
+    # Otro worker sin la entrada en memoria la lee de Mongo
+    monkeypatch.setattr(idempotency, "idempotency_store", IdempotencyStore())
+    from_mongo = asyncio.run(create_order(request=FakeRequest(b'{"total": 1}')))
+    assert len(calls) == 1 and from_mongo.body == first.body
+
+def test_concurrent_request_with_same_key_gets_409(keys):
+    @idempotent
+    async def create_order(request):
+        # Llega el reintento mientras la primera ejecución sigue en curso
+        with pytest.raises(HTTPException) as error:
+            await create_order(request=FakeRequest(b"{}"))
+        assert error.value.status_code == 409
+        assert error.value.headers["Retry-After"] == "1"
+        return {"success": True}
+
+    asyncio.run(create_order(request=FakeRequest(b"{}")))
+    assert next(iter(keys.docs.values()))["status"] == COMPLETED
+
+def test_stale_lock_is_taken_over(keys):
+    store = IdempotencyStore()
+    assert store.claim("key", "fp") is None
+
+    # Con el lock vigente se devuelve la ejecución en curso
+    assert store.claim("key", "fp")["status"] == PROCESSING
+
+    # El worker que la tenía murió: al vencer el lock se retoma
+    keys.docs["key"]["locked_until"] = datetime.utcnow() - timedelta(seconds=1)
+    assert store.claim("key", "fp") is None
+    assert keys.docs["key"]["locked_until"] > datetime.utcnow()
+
+def test_same_key_with_other_payload_is_rejected(keys):
+    @idempotent
+    async def create_order(request):
+        return {"success": True}
+
+    asyncio.run(create_order(request=FakeRequest(b'{"total": 1}')))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(create_order(request=FakeRequest(b'{"total": 2}')))
+    assert error.value.status_code == 422
+
+def test_key_is_released_after_an_error(keys):
+    calls = []
+
+    @idempotent
+    async def create_order(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise HTTPException(status_code=500, detail="Database error")
+        return {"success": True}
+
+    with pytest.raises(HTTPException):
+        asyncio.run(create_order(request=FakeRequest(b"{}")))
+    assert keys.docs == {}
+
+    # El reintento vuelve a ejecutar el controlador
+    asyncio.run(create_order(request=FakeRequest(b"{}")))
+    assert len(calls) == 2
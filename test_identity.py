@@ -0,0 +1,38 @@
+import pytest
+from utils.identity import FakeIdentityProvider, IdentityProviderError, AccountAlreadyExistsError, ensure_account
+
+
+def test_ensure_account_creates_once():
+    provider = FakeIdentityProvider()
+
+    uid = ensure_account(provider, "usuario@example.com", "MiPassword123!")
+    assert uid is not None, "No se creó la cuenta"
+
+    # Un reintento del mismo trabajo reutiliza el uid que guardó
+    again = ensure_account(provider, "usuario@example.com", "MiPassword123!", known_uid=uid)
+    assert again == uid, "El aprovisionamiento no es idempotente"
+    assert provider.calls.count("create_account") == 1
+
+def test_existing_account_is_not_linked_to_a_new_signup():
+    provider = FakeIdentityProvider()
+    ensure_account(provider, "usuario@example.com", "MiPassword123!")
+
+    # Otra alta con el mismo email no hereda la cuenta ni ignora su contraseña
+    with pytest.raises(AccountAlreadyExistsError) as error:
+        ensure_account(provider, "usuario@example.com", "OtraPassword456!")
+    assert error.value.retryable is False
+    assert provider.verify_password("usuario@example.com", "MiPassword123!")
+
+def test_fake_provider_simulated_failures():
+    provider = FakeIdentityProvider()
+    provider.fail_next(retryable=False)
+
+    with pytest.raises(IdentityProviderError) as error:
+        ensure_account(provider, "usuario@example.com", "MiPassword123!")
+    assert error.value.retryable is False
+
+    uid = ensure_account(provider, "usuario@example.com", "MiPassword123!")
+    assert provider.verify_password("usuario@example.com", "MiPassword123!")
+
+    provider.delete_account(uid)
+    assert provider.get_uid_by_email("usuario@example.com") is None
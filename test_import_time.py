@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+# Presupuesto para "import main" (ms); se puede ajustar por entorno en CI
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Módulos que solo deben cargarse al primer uso, nunca al importar la app
+LAZY_MODULES = ["firebase_admin", "pymongo"]
+
+
+def import_main_times() -> dict:
+    env = os.environ.copy()
+    env.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+    env.setdefault("MONGO_DB_NAME", "import_time_test")
+    env.setdefault("SECRET_KEY", "import-time-test")
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, f"No se pudo importar main: {result.stderr[-2000:]}"
+
+    # Formato: "import time: self [us] | cumulative | imported package"
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def test_import_does_not_load_heavy_clients():
+    times = import_main_times()
+    for module in LAZY_MODULES:
+        assert module not in times, f"{module} se importa al cargar la app"
+
+def test_import_time_budget():
+    times = import_main_times()
+    elapsed_ms = times["main"] / 1000
+    assert elapsed_ms < IMPORT_BUDGET_MS, f"import main tardó {elapsed_ms:.0f} ms (presupuesto {IMPORT_BUDGET_MS:.0f} ms)"
@@ -0,0 +1,31 @@
+from utils.order_pricing import compute_order_totals, price_cart
+
+
+PRODUCTS = {
+    "cafe": {"name": "Café", "cost": 30.0, "active": True},
+    "pan": {"name": "Pan", "cost": 12.5, "active": True},
+    "agotado": {"name": "Jugo", "cost": 20.0, "active": False}
+}
+
+
+def test_cart_quote_merges_lines_and_applies_tax():
+    items = [
+        {"id_producto": "cafe", "quantity": 1},
+        {"id_producto": "pan", "quantity": 2},
+        {"id_producto": "cafe", "quantity": 1}
+    ]
+
+    quote = price_cart(items, PRODUCTS, tax_rate=0.1)
+
+    assert [(line["id_producto"], line["quantity"]) for line in quote["lines"]] == [("cafe", 2), ("pan", 2)]
+    assert quote["subtotal"] == 85.0
+    assert quote["taxes"] == 8.5
+    assert quote["total"] == 93.5
+    assert quote["unavailable"] == [] and quote["total_items"] == 4
+
+def test_unavailable_products_are_reported_and_empty_cart_is_zero():
+    quote = price_cart([{"id_producto": "agotado", "quantity": 1}, {"id_producto": "borrado", "quantity": 1}], PRODUCTS, 0.1)
+
+    assert quote["unavailable"] == ["agotado", "borrado"]
+    assert quote["lines"] == []
+    assert compute_order_totals(0, 0.1) == {"subtotal": 0.0, "taxes": 0.0, "discount": 0.0, "total": 0.0}
@@ -0,0 +1,51 @@
+import pytest
+
+from utils.order_state_machine import InvalidTransitionGraph, compile_transitions
+
+
+STATUSES = [
+    {"id": "1", "description": "inprogress"},
+    {"id": "2", "description": "ordered"},
+    {"id": "3", "description": "processing"},
+    {"id": "4", "description": "delivered"}
+]
+
+
+def test_defaults_apply_to_known_statuses():
+    table = compile_transitions(STATUSES)
+
+    assert table.allowed("1", "2")
+    assert table.allowed("2", "3")
+    assert not table.allowed("2", "1")
+    # 'cancelled' no existe en este catálogo: la arista por defecto se omite
+    assert table.as_dict()["ordered"]["next_statuses"] == ["processing"]
+    assert table.requires_products("2") and not table.requires_products("1")
+
+def test_declared_transitions_override_defaults():
+    docs = STATUSES[:3] + [{"id": "4", "description": "delivered", "next_statuses": ["inprogress"], "requires_products": False}]
+    docs[1] = {**docs[1], "next_statuses": ["delivered"]}
+
+    table = compile_transitions(docs)
+
+    assert table.allowed("2", "4") and not table.allowed("2", "3")
+    assert table.allowed("4", "1")
+    assert not table.requires_products("4")
+    assert table.status_id("processing") == "3"
+
+def test_strict_mode_rejects_invalid_graphs():
+    with pytest.raises(InvalidTransitionGraph):
+        compile_transitions(STATUSES + [{"id": "5", "description": "ready", "next_statuses": ["picked-up"]}], strict=True)
+    with pytest.raises(InvalidTransitionGraph):
+        compile_transitions(STATUSES + [{"id": "5", "description": "ready", "next_statuses": ["ready"]}], strict=True)
+
+    # Sin strict los destinos desconocidos se ignoran
+    table = compile_transitions(STATUSES + [{"id": "5", "description": "ready", "next_statuses": ["picked-up", "delivered"]}])
+    assert table.allowed("5", "4")
+
+def test_statuses_without_edges_are_reported(caplog):
+    table = compile_transitions(STATUSES + [{"id": "5", "description": "pending"}])
+
+    # 'pending' no declara salidas ni tiene grafo por defecto: las órdenes quedarían atascadas
+    assert table.undeclared == {"pending"}
+    assert "pending" in caplog.text
+    assert compile_transitions(STATUSES).undeclared == frozenset()
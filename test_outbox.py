@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import utils.outbox as outbox
+from utils.outbox import OutboxDispatcher, write_event, ORDER_CREATED, PENDING, DISPATCHED
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, arg in condition.items():
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$lte" and (value is None or value > arg):
+                return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeOutbox:
+    """Lo mínimo de una colección de pymongo que usa el outbox"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def insert_one(self, doc, session=None):
+        self.docs[doc["_id"]] = dict(doc)
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs.values() if _matches(doc, query)])
+
+    def update_many(self, query, update):
+        for doc in self.docs.values():
+            if _matches(doc, query):
+                doc.update(update.get("$set", {}))
+                for field in update.get("$unset", {}):
+                    doc.pop(field, None)
+
+    def update_one(self, query, update):
+        self.update_many(query, update)
+
+
+def make_outbox(monkeypatch):
+    collection = FakeOutbox()
+    monkeypatch.setattr(outbox, "outbox_collection", collection)
+    return collection
+
+def expire_leases(collection):
+    for doc in collection.docs.values():
+        doc["available_at"] = datetime.utcnow() - timedelta(seconds=1)
+
+
+def test_claim_leases_events_until_they_expire(monkeypatch):
+    collection = make_outbox(monkeypatch)
+    event_id = write_event(None, ORDER_CREATED, "order-1", {"status": "new"})
+
+    first, second = OutboxDispatcher(), OutboxDispatcher()
+    assert [str(doc["_id"]) for doc in first._claim()] == [event_id]
+    # Con el lease vigente otro worker no lo toma
+    assert second._claim() == []
+
+    # El primer worker murió sin marcarlo: al vencer el lease lo retoma otro
+    expire_leases(collection)
+    assert [str(doc["_id"]) for doc in second._claim()] == [event_id]
+
+def test_failed_subscriber_gets_the_event_again(monkeypatch):
+    collection = make_outbox(monkeypatch)
+    write_event(None, ORDER_CREATED, "order-1", {"status": "new"})
+
+    received = []
+
+    def flaky(event):
+        received.append(event["aggregate_id"])
+        if len(received) == 1:
+            raise RuntimeError("transient")
+
+    dispatcher = OutboxDispatcher()
+    dispatcher.subscribe(ORDER_CREATED, flaky)
+
+    asyncio.run(dispatcher.dispatch_batch())
+    doc = next(iter(collection.docs.values()))
+    assert doc["status"] == PENDING and doc["attempts"] == 1
+    assert "lease_id" not in doc
+
+    # Tras el backoff se vuelve a entregar y queda despachado
+    expire_leases(collection)
+    asyncio.run(dispatcher.dispatch_batch())
+    assert received == ["order-1", "order-1"]
+    assert doc["status"] == DISPATCHED
+    assert dispatcher.stats["retried"] == 1 and dispatcher.stats["dispatched"] == 1
+
+def test_already_delivered_event_is_not_repeated(monkeypatch):
+    collection = make_outbox(monkeypatch)
+    write_event(None, ORDER_CREATED, "order-1", {"status": "new"}, dedupe_key="order-1:created")
+
+    received = []
+    dispatcher = OutboxDispatcher()
+    dispatcher.subscribe("*", lambda event: received.append(event["dedupe_key"]))
+    asyncio.run(dispatcher.dispatch_batch())
+
+    # Se entregó pero el marcado no llegó a Mongo: el evento vuelve a la cola
+    doc = next(iter(collection.docs.values()))
+    doc["status"] = PENDING
+    expire_leases(collection)
+
+    asyncio.run(dispatcher.dispatch_batch())
+    assert received == ["order-1:created"]
+    assert doc["status"] == DISPATCHED
+    assert dispatcher.stats["duplicates"] == 1
@@ -0,0 +1,32 @@
+from utils.rate_limit import MemoryRateLimitBackend, RatePolicy, build_rate_limiter
+
+
+def test_bucket_rejects_when_empty():
+    backend = MemoryRateLimitBackend()
+    policy = RatePolicy("login", capacity=3, refill_per_second=1)
+
+    results = [backend.hit("1.2.3.4", policy, now=100.0) for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+
+    # Sin tokens, Retry-After indica cuánto falta para el siguiente
+    assert results[-1][1] == 1.0
+
+def test_bucket_refills_over_time():
+    backend = MemoryRateLimitBackend()
+    policy = RatePolicy("login", capacity=2, refill_per_second=0.5)
+
+    backend.hit("user", policy, now=0.0)
+    backend.hit("user", policy, now=0.0)
+    assert backend.hit("user", policy, now=1.0)[0] is False
+    assert backend.hit("user", policy, now=3.0)[0] is True
+
+    # Cada clave tiene su propio bucket
+    assert backend.hit("other", policy, now=3.0)[0] is True
+
+def test_order_quote_does_not_consume_order_writes():
+    limiter = build_rate_limiter()
+
+    assert limiter.match("POST", "/orders/quote").name == "order_quotes"
+    assert limiter.match("POST", "/orders").name == "order_writes"
+    assert limiter.match("PUT", "/orders/abc").name == "order_writes"
+    assert limiter.match("GET", "/orders/quote") is None
@@ -0,0 +1,41 @@
+import asyncio
+
+from utils.task_queue import TaskQueue
+
+
+def test_tasks_run_with_retries_and_drain():
+    calls = []
+
+    def flaky(item):
+        calls.append(item)
+        if calls.count(item) < 2:
+            raise RuntimeError("transient")
+
+    async def always_fails():
+        raise RuntimeError("permanent")
+
+    async def scenario():
+        queue = TaskQueue(concurrency=2, max_attempts=2, retry_delay=0)
+        runner = asyncio.create_task(queue.run())
+        queue.enqueue(flaky, "a")
+        queue.enqueue(always_fails)
+        assert await queue.drain(timeout=1)
+        # Cerrada tras el drain: las tareas nuevas se descartan
+        assert not queue.enqueue(flaky, "b")
+        runner.cancel()
+        return queue.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert calls == ["a", "a"]
+    assert metrics["completed"] == 1 and metrics["failed"] == 1
+    assert metrics["retried"] == 2 and metrics["dropped"] == 1
+    assert metrics["pending"] == 0
+
+def test_full_queue_drops_instead_of_blocking():
+    async def scenario():
+        queue = TaskQueue(max_size=1)
+        return queue.enqueue(print), queue.enqueue(print), queue.metrics()
+
+    first, second, metrics = asyncio.run(scenario())
+    assert first and not second
+    assert metrics["dropped"] == 1 and metrics["pending"] == 1
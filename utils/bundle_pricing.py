@@ -0,0 +1,59 @@
+"""
+Precios de todos los bundles calculados de una vez con NumPy: la composición
+se guarda como matriz dispersa bundle x producto (formato COO) y un único
+producto matriz-vector contra el vector de precios da el valor de cada bundle.
+"""
+
+
+def effective_price(product: dict) -> float:
+    """Precio de venta: costo menos su descuento porcentual"""
+    return product["cost"] * (1 - product.get("discount", 0) / 100)
+
+def compute_bundle_pricing(bundles: dict[str, list[dict]], products: dict[str, dict]) -> dict[str, dict]:
+    """
+    `bundles`: id de bundle -> líneas con id_producto y quantity.
+    `products`: id -> producto con cost y discount (incluye los bundles).
+    Devuelve por bundle: valor de sus componentes, precio del bundle, ahorro
+    y descuento efectivo (%) frente a comprar los productos por separado.
+    """
+    # NumPy se importa aquí para no cargarlo en el arranque de la app
+    import numpy as np
+
+    bundle_ids = [bundle_id for bundle_id in bundles if bundle_id in products]
+    if not bundle_ids:
+        return {}
+
+    product_index = {product_id: i for i, product_id in enumerate(products)}
+    prices = np.fromiter((effective_price(p) for p in products.values()), dtype=np.float64, count=len(products))
+
+    rows, cols, quantities = [], [], []
+    for row, bundle_id in enumerate(bundle_ids):
+        for line in bundles[bundle_id]:
+            col = product_index.get(line["id_producto"])
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
+                quantities.append(line["quantity"])
+
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    quantities = np.asarray(quantities, dtype=np.float64)
+
+    # Producto matriz dispersa x vector: suma por fila de cantidad * precio
+    component_totals = np.bincount(rows, weights=quantities * prices[cols], minlength=len(bundle_ids))
+    bundle_prices = prices[[product_index[bundle_id] for bundle_id in bundle_ids]]
+    savings = component_totals - bundle_prices
+    effective_discounts = np.divide(
+        savings * 100, component_totals,
+        out=np.zeros_like(savings), where=component_totals > 0
+    )
+
+    return {
+        bundle_id: {
+            "component_total": round(float(component_totals[i]), 2),
+            "bundle_price": round(float(bundle_prices[i]), 2),
+            "savings": round(float(savings[i]), 2),
+            "effective_discount": round(float(effective_discounts[i]), 2)
+        }
+        for i, bundle_id in enumerate(bundle_ids)
+    }
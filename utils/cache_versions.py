@@ -0,0 +1,79 @@
+"""
+Sellos de versión compartidos entre workers para invalidar cachés en memoria.
+Cada escritura incrementa la versión en la colección cache_versions y los
+demás procesos la detectan con un sondeo periódico.
+"""
+import os
+import asyncio
+import logging
+import threading
+
+from utils.services import services
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = float(os.getenv("CACHE_VERSION_POLL_SECONDS", "5"))
+
+
+class VersionStamps:
+    def __init__(self):
+        self._coll = services.collection("cache_versions")
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+        self._listeners: dict[str, list] = {}
+        self._loaded = False
+
+    def get(self, name: str) -> int:
+        """Versión conocida localmente (sin consultar la base de datos)"""
+        return self._versions.get(name, 0)
+
+    def is_loaded(self) -> bool:
+        """True cuando ya se leyeron las versiones de Mongo al menos una vez"""
+        return self._loaded
+
+    def on_change(self, name: str, callback) -> None:
+        """Registrar una función que se llama con la nueva versión cuando cambia"""
+        self._listeners.setdefault(name, []).append(callback)
+
+    def bump(self, name: str) -> int:
+        """Incrementar la versión tras una escritura"""
+        from pymongo import ReturnDocument
+
+        doc = self._coll.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._set(name, doc["version"])
+        return doc["version"]
+
+    def refresh(self) -> None:
+        """Leer todas las versiones de Mongo y avisar de las que cambiaron"""
+        for doc in self._coll.find({}):
+            self._set(doc["_id"], doc["version"])
+        self._loaded = True
+
+    def _set(self, name: str, version: int) -> None:
+        with self._lock:
+            if self._versions.get(name, 0) >= version:
+                return
+            self._versions[name] = version
+
+        for callback in self._listeners.get(name, []):
+            try:
+                callback(version)
+            except Exception as e:
+                logger.error(f"Cache version listener for {name} failed: {e}")
+
+    async def run_poller(self, interval: float = POLL_INTERVAL_SECONDS) -> None:
+        """Bucle en segundo plano que detecta escrituras de otros workers"""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Cache version poll failed: {e}")
+            await asyncio.sleep(interval)
+
+
+version_stamps = VersionStamps()
@@ -0,0 +1,146 @@
+"""
+Snapshot en memoria del menú (productos, tipos y bundles) para servir las
+lecturas del catálogo sin consultar MongoDB.
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+from utils.services import services
+from utils.catalog_search import CatalogSearchIndex
+from utils.bundle_pricing import compute_bundle_pricing
+from utils.cache_versions import version_stamps
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = "catalog"
+
+
+class CatalogSnapshot:
+    """Vista inmutable del catálogo indexada por id y por tipo"""
+
+    def __init__(self, version: int, types: dict, products: dict, bundles: dict):
+        self.version = version
+        self.built_at = datetime.utcnow()
+        self.types = types
+        self.products = products
+        self.bundles = bundles
+
+        self.by_type: dict[str, list[dict]] = {}
+        for product in products.values():
+            self.by_type.setdefault(product["id_catalog_type"], []).append(product)
+
+        # Listado de GET /catalogs: productos cuyo tipo está activo
+        self.listing = [p for p in products.values() if types[p["id_catalog_type"]]["active"]]
+        self.active_count = sum(1 for p in products.values() if p["active"])
+        self._search_index = None
+        self._pricing = None
+
+    def get_product(self, catalog_id: str) -> dict | None:
+        return self.products.get(catalog_id)
+
+    def get_bundle_lines(self, bundle_id: str) -> list[dict]:
+        return self.bundles.get(bundle_id, [])
+
+    @property
+    def search_index(self) -> CatalogSearchIndex:
+        """
+        Índice de búsqueda construido la primera vez que se usa. Cubre el
+        listado (tipo activo), igual que la búsqueda con $text.
+        """
+        if self._search_index is None:
+            self._search_index = CatalogSearchIndex(self.listing)
+        return self._search_index
+
+    @property
+    def pricing(self) -> dict[str, dict]:
+        """Precios de todos los bundles; se recalculan solo al cambiar el snapshot"""
+        if self._pricing is None:
+            self._pricing = compute_bundle_pricing(self.bundles, self.products)
+        return self._pricing
+
+
+def load_snapshot(version: int) -> CatalogSnapshot:
+    """
+    Construir el snapshot con una consulta por colección. La composición de
+    los bundles viene embebida en su documento (bundle_items).
+    """
+    types = {}
+    for doc in services.collection("catalogtypes").find({}):
+        type_id = str(doc["_id"])
+        types[type_id] = {
+            "id": type_id,
+            "description": doc["description"],
+            "active": doc.get("active", True)
+        }
+
+    products = {}
+    embedded_items = {}
+    for doc in services.collection("catalogs").find({}):
+        type_id = str(doc.get("id_catalog_type"))
+        catalog_type = types.get(type_id)
+        if catalog_type is None:
+            # Igual que el $unwind de las pipelines: sin tipo no se expone
+            continue
+
+        catalog_id = str(doc["_id"])
+        products[catalog_id] = {
+            "id": catalog_id,
+            "id_catalog_type": type_id,
+            "name": doc["name"],
+            "description": doc["description"],
+            "cost": doc["cost"],
+            "discount": doc.get("discount", 0),
+            "active": doc.get("active", True),
+            "catalog_type_description": catalog_type["description"]
+        }
+        if "bundle_items" in doc:
+            embedded_items[catalog_id] = doc["bundle_items"]
+
+    # Igual que antes: los componentes sin tipo válido no se exponen
+    bundles = {
+        bundle_id: [item for item in items if item["id_producto"] in products]
+        for bundle_id, items in embedded_items.items()
+    }
+
+    return CatalogSnapshot(version, types, products, bundles)
+
+
+class CatalogCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: CatalogSnapshot | None = None
+        self.stats = {"hits": 0, "builds": 0, "invalidations": 0}
+        version_stamps.on_change(CATALOG_VERSION, self._on_version_change)
+
+    def get(self) -> CatalogSnapshot:
+        """Snapshot vigente; se reconstruye solo si la versión cambió"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version_stamps.get(CATALOG_VERSION):
+            self.stats["hits"] += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            version = version_stamps.get(CATALOG_VERSION)
+            if snapshot is None or snapshot.version != version:
+                snapshot = load_snapshot(version)
+                self._snapshot = snapshot
+                self.stats["builds"] += 1
+                logger.info(f"Catalog snapshot v{version} built with {len(snapshot.products)} products")
+            return snapshot
+
+    def invalidate(self) -> None:
+        """Llamar después de cualquier escritura que afecte al menú"""
+        version_stamps.bump(CATALOG_VERSION)
+
+    def _on_version_change(self, version: int) -> None:
+        self.stats["invalidations"] += 1
+        self._snapshot = None
+
+    async def warm_up(self) -> None:
+        await asyncio.to_thread(self.get)
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,94 @@
+"""
+Índice invertido en memoria sobre el catálogo con coincidencia difusa por trigramas
+"""
+import re
+import unicodedata
+
+# Peso de cada campo en la relevancia
+FIELD_WEIGHTS = {"name": 3.0, "description": 1.0}
+
+# Similitud mínima (Jaccard de trigramas) para aceptar un término parecido
+FUZZY_THRESHOLD = 0.4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin acentos, para que 'Café' y 'cafe' coincidan"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+def trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogSearchIndex:
+    def __init__(self, products: list[dict]):
+        self._products = {p["id"]: p for p in products}
+        # término -> {id de producto: peso acumulado}
+        self._postings: dict[str, dict[str, float]] = {}
+        # trigrama -> términos que lo contienen
+        self._trigrams: dict[str, set[str]] = {}
+        self._token_trigrams: dict[str, set[str]] = {}
+
+        for product in products:
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(product.get(field) or ""):
+                    postings = self._postings.setdefault(token, {})
+                    postings[product["id"]] = postings.get(product["id"], 0.0) + weight
+
+        for token in self._postings:
+            grams = trigrams(token)
+            self._token_trigrams[token] = grams
+            for gram in grams:
+                self._trigrams.setdefault(gram, set()).add(token)
+
+    def _similar_terms(self, term: str, fuzzy: bool) -> list[tuple[str, float]]:
+        """Términos del índice que corresponden al término buscado, con su similitud"""
+        if term in self._postings:
+            matches = [(term, 1.0)]
+        else:
+            matches = []
+
+        if not fuzzy:
+            return matches
+
+        grams = trigrams(term)
+        candidates: dict[str, int] = {}
+        for gram in grams:
+            for token in self._trigrams.get(gram, ()):
+                candidates[token] = candidates.get(token, 0) + 1
+
+        for token, shared in candidates.items():
+            if token == term:
+                continue
+            similarity = shared / len(grams | self._token_trigrams[token])
+            # Un prefijo de la palabra (búsqueda mientras se escribe) también cuenta
+            if token.startswith(term) and len(term) >= 3:
+                similarity = max(similarity, 0.8)
+            if similarity >= FUZZY_THRESHOLD:
+                matches.append((token, similarity))
+        return matches
+
+    def search(self, query: str, fuzzy: bool = True, active_only: bool = True) -> list[dict]:
+        """Productos ordenados por relevancia, con el campo score"""
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            best: dict[str, float] = {}
+            for token, similarity in self._similar_terms(term, fuzzy):
+                for product_id, weight in self._postings[token].items():
+                    best[product_id] = max(best.get(product_id, 0.0), weight * similarity)
+            for product_id, score in best.items():
+                scores[product_id] = scores.get(product_id, 0.0) + score
+
+        results = []
+        for product_id, score in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+            product = self._products[product_id]
+            if active_only and not product.get("active", True):
+                continue
+            results.append({**product, "score": round(score, 4)})
+        return results
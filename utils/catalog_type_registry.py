@@ -0,0 +1,69 @@
+"""
+Registro en memoria de los tipos de catálogo (id <-> descripción), para no
+hacer $lookup a catalogtypes cada vez que hay que filtrar o validar por tipo.
+"""
+import threading
+
+from utils.services import services
+from utils.cache_versions import version_stamps
+
+CATALOG_TYPES_VERSION = "catalogtypes"
+
+# Descripciones de los tipos con significado especial en la API
+BUNDLE_TYPE = "bundle"
+PRODUCT_TYPE = "products"
+
+
+class CatalogTypeRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (por id, por descripción): se reemplazan juntos para que un lector
+        # nunca vea uno de los mapas ya invalidado
+        self._maps: tuple[dict[str, dict], dict[str, list[str]]] | None = None
+        version_stamps.on_change(CATALOG_TYPES_VERSION, lambda version: self.invalidate())
+
+    def _ensure_loaded(self) -> tuple[dict[str, dict], dict[str, list[str]]]:
+        """
+        Mapas vigentes. Se devuelven como referencias locales: el poller puede
+        invalidar el registro desde otro hilo en cualquier momento.
+        """
+        maps = self._maps
+        if maps is not None:
+            return maps
+
+        with self._lock:
+            if self._maps is not None:
+                return self._maps
+
+            by_id = {}
+            by_description = {}
+            for doc in services.collection("catalogtypes").find({}, {"description": 1, "active": 1}):
+                type_id = str(doc["_id"])
+                by_id[type_id] = {
+                    "id": type_id,
+                    "description": doc["description"],
+                    "active": doc.get("active", True)
+                }
+                # Las descripciones se comparan sin distinguir mayúsculas
+                by_description.setdefault(doc["description"].strip().lower(), []).append(type_id)
+
+            self._maps = (by_id, by_description)
+            return self._maps
+
+    def get(self, type_id: str) -> dict | None:
+        by_id, _ = self._ensure_loaded()
+        return by_id.get(type_id)
+
+    def ids_for(self, description: str) -> list[str]:
+        """
+        Ids de los tipos con esa descripción. Se resuelven una vez y se vuelven
+        a cargar cuando los controladores de catalogtypes suben la versión.
+        """
+        _, by_description = self._ensure_loaded()
+        return list(by_description.get(description.strip().lower(), []))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._maps = None
+
+catalog_type_registry = CatalogTypeRegistry()
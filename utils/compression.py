@@ -0,0 +1,132 @@
+"""
+Compresión gzip/brotli de respuestas según Accept-Encoding
+"""
+import os
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él solo se usa gzip
+    brotli = None
+
+# Por debajo de este tamaño la compresión no compensa
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Tipos de contenido que se comprimen (text/event-stream queda fuera a propósito)
+CONTENT_TYPES = tuple(
+    t.strip() for t in os.getenv(
+        "COMPRESSION_CONTENT_TYPES", "application/json,text/plain,text/html,text/csv"
+    ).split(",") if t.strip()
+)
+
+
+def available_encodings() -> list[str]:
+    """Codificaciones soportadas, en orden de preferencia"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Mejor codificación aceptada por el cliente, o None para enviar sin comprimir"""
+    if not accept_encoding:
+        return None
+
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    for encoding in available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+def is_compressible(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.split(";")[0].strip().lower()
+    return any(content_type == t or (t.endswith("/") and content_type.startswith(t)) for t in CONTENT_TYPES)
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime respuestas de un solo bloque. Las respuestas
+    en streaming (SSE, descargas) y las ya comprimidas se envían tal cual.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = choose_encoding(_header(scope.get("headers", []), b"accept-encoding"))
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                return await send(message)
+
+            pending, start = start, None
+            headers = list(pending.get("headers", []))
+            body = message.get("body", b"")
+
+            if not is_compressible(_header(headers, b"content-type")) or _header(headers, b"content-encoding"):
+                await send(pending)
+                return await send(message)
+
+            headers = _add_vary(headers)
+            if encoding is None or message.get("more_body", False) or len(body) < self.minimum_size:
+                await send({**pending, "headers": headers})
+                return await send(message)
+
+            compressed = compress(body, encoding)
+            if len(compressed) >= len(body):
+                await send({**pending, "headers": headers})
+                return await send(message)
+
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode())
+            ]
+            await send({**pending, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _header(headers, name: bytes) -> str | None:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+def _add_vary(headers: list) -> list:
+    vary = _header(headers, b"vary")
+    if vary and "accept-encoding" in vary.lower():
+        return headers
+    headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+    value = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+    return headers + [(b"vary", value.encode("latin-1"))]
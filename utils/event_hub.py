@@ -0,0 +1,309 @@
+"""
+Hub de eventos en proceso para SSE y WebSocket: reparte cada evento a los
+suscriptores de un tema y guarda los últimos en un buffer circular para que
+los clientes que se reconectan puedan reanudar con Last-Event-ID. Un backend
+opcional reenvía los eventos a los demás workers.
+
+Cada worker numera sus eventos por separado, así que el id lleva la época del
+proceso ("<época>-<n>"): un Last-Event-ID de otro worker o de un proceso
+anterior no se puede reanudar y el cliente recibe un reset.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+
+BUFFER_SIZE = int(os.getenv("EVENT_HUB_BUFFER_SIZE", "1000"))
+QUEUE_SIZE = int(os.getenv("EVENT_HUB_QUEUE_SIZE", "100"))
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Un tema sin suscriptores y sin eventos en este tiempo se descarta de memoria
+REPLAY_WINDOW_SECONDS = float(os.getenv("EVENT_HUB_REPLAY_WINDOW", "300"))
+
+logger = logging.getLogger(__name__)
+
+# Indica al cliente que perdió eventos y debe volver a pedir el listado completo
+RESET_EVENT = "reset"
+
+
+class Event:
+    def __init__(self, epoch: str, seq: int, topic: str, event_type: str, data: dict):
+        self.id = f"{epoch}-{seq}"
+        self.seq = seq
+        self.topic = topic
+        self.type = event_type
+        self.data = data
+        self.published_at = time.monotonic()
+
+
+class Subscription:
+    def __init__(self, topic: str, queue_size: int):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, event: Event) -> bool:
+        """Encolar sin bloquear; False si el cliente va demasiado atrasado"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def next(self, timeout: float = HEARTBEAT_SECONDS) -> Event | None:
+        """Siguiente evento, o None si pasó `timeout` sin novedades"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    def __init__(self, buffer_size: int = BUFFER_SIZE, queue_size: int = QUEUE_SIZE,
+                 replay_window: float = REPLAY_WINDOW_SECONDS):
+        self._buffer_size = buffer_size
+        self._queue_size = queue_size
+        self._replay_window = replay_window
+        # Prefijo de tema -> tamaño de buffer (p. ej. los temas por usuario)
+        self._topic_limits: dict[str, int] = {}
+        self._buffers: dict[str, deque] = {}
+        # Id del último evento que cada tema descartó de su buffer
+        self._evicted: dict[str, int] = {}
+        # Último evento de los temas ya descartados de memoria
+        self._pruned_seq = 0
+        self._last_prune = time.monotonic()
+        self._subscribers: dict[str, set[Subscription]] = {}
+        self._last_id = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self.backend = None
+        self.stats = {"published": 0, "resets": 0, "forward_errors": 0}
+
+    def set_backend(self, backend) -> None:
+        """Backend que reenvía los eventos publicados aquí al resto de workers"""
+        self.backend = backend
+
+    def limit_topics(self, prefix: str, buffer_size: int) -> None:
+        """Buffer más pequeño para los temas que empiezan por `prefix` (uno por usuario, etc.)"""
+        self._topic_limits[prefix] = buffer_size
+
+    def _new_buffer(self, topic: str) -> deque:
+        size = next((limit for prefix, limit in self._topic_limits.items() if topic.startswith(prefix)),
+                    self._buffer_size)
+        # Si el tema ya existió y se descartó, sus eventos anteriores no se pueden reanudar
+        self._evicted[topic] = self._pruned_seq
+        buffer = self._buffers[topic] = deque(maxlen=size)
+        return buffer
+
+    def publish(self, topic: str, event_type: str, data: dict, forward: bool = True) -> Event:
+        """
+        Publicar desde el hilo del event loop. Con forward=False el evento solo
+        se entrega en este proceso (p. ej. porque ya llegó desde otro worker).
+        """
+        if forward and self.backend is not None:
+            try:
+                self.backend.forward(topic, event_type, data)
+            except Exception as e:
+                # Los suscriptores locales reciben el evento igualmente
+                self.stats["forward_errors"] += 1
+                logger.error(f"Event hub backend failed to forward {topic}/{event_type}: {e}")
+
+        self._last_id += 1
+        event = Event(self.epoch, self._last_id, topic, event_type, data)
+        buffer = self._buffers.get(topic) or self._new_buffer(topic)
+        if len(buffer) == buffer.maxlen:
+            self._evicted[topic] = buffer[0].seq
+        buffer.append(event)
+        self.stats["published"] += 1
+
+        for subscription in list(self._subscribers.get(topic, ())):
+            if not subscription.push(event):
+                self._reset(subscription)
+
+        if event.published_at - self._last_prune >= self._replay_window / 10:
+            self._prune(event.published_at)
+        return event
+
+    def _prune(self, now: float) -> None:
+        """
+        Descartar los temas sin suscriptores cuyo último evento salió de la
+        ventana de replay: la memoria depende de los clientes conectados y no
+        del total de usuarios que alguna vez recibieron eventos.
+        """
+        self._last_prune = now
+        cutoff = now - self._replay_window
+        for topic, buffer in list(self._buffers.items()):
+            if self._subscribers.get(topic) or buffer[-1].published_at > cutoff:
+                continue
+            self._pruned_seq = max(self._pruned_seq, buffer[-1].seq)
+            del self._buffers[topic]
+            del self._evicted[topic]
+        for topic in [t for t, subs in self._subscribers.items() if not subs and t not in self._buffers]:
+            del self._subscribers[topic]
+
+    def publish_threadsafe(self, loop: asyncio.AbstractEventLoop, topic: str, event_type: str, data: dict,
+                           forward: bool = True) -> None:
+        """Publicar desde otro hilo (p. ej. el lector del change stream)"""
+        loop.call_soon_threadsafe(lambda: self.publish(topic, event_type, data, forward=forward))
+
+    def replay(self, topic: str, last_event_id: str | None) -> list[Event] | None:
+        """
+        Eventos posteriores a `last_event_id`. None si ya no están en el buffer
+        o el id es de otra época (otro worker o un reinicio) y el cliente debe
+        recargar.
+        """
+        if last_event_id is None:
+            return []
+        epoch, _, seq = last_event_id.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._last_id:
+            return None
+
+        # Los números son de todo el proceso y el buffer es por tema: solo hay
+        # hueco si el tema descartó un evento que el cliente no llegó a recibir
+        seq = int(seq)
+        buffer = self._buffers.get(topic)
+        # Sin buffer el tema pudo descartarse con eventos que el cliente no vio
+        floor = self._evicted[topic] if buffer is not None else self._pruned_seq
+        if seq < floor:
+            return None
+        return [event for event in buffer or () if event.seq > seq]
+
+    @asynccontextmanager
+    async def subscribe(self, topic: str, last_event_id: str | None = None):
+        subscription = Subscription(topic, self._queue_size)
+        missed = self.replay(topic, last_event_id)
+        if missed is None:
+            self._reset(subscription)
+        else:
+            for event in missed[-self._queue_size:]:
+                subscription.push(event)
+
+        self._subscribers.setdefault(topic, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscribers.get(topic, set()).discard(subscription)
+
+    def _reset(self, subscription: Subscription) -> None:
+        """Vaciar la cola del suscriptor y dejar solo un evento reset"""
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.push(Event(self.epoch, self._last_id, subscription.topic, RESET_EVENT, {}))
+        self.stats["resets"] += 1
+
+    def restart_epoch(self) -> None:
+        """
+        Empezar una época nueva cuando este worker perdió eventos de los demás:
+        los buffers ya no están completos, así que ningún id anterior se puede
+        reanudar y los suscriptores actuales reciben un reset.
+        """
+        self.epoch = uuid.uuid4().hex[:12]
+        self._buffers.clear()
+        self._evicted.clear()
+        self._pruned_seq = 0
+        for subscriptions in self._subscribers.values():
+            for subscription in list(subscriptions):
+                self._reset(subscription)
+
+    def metrics(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "subscribers": {topic: len(subs) for topic, subs in self._subscribers.items()},
+            "topics": len(self._buffers),
+            "buffered_events": sum(len(buffer) for buffer in self._buffers.values()),
+            "epoch": self.epoch,
+            "last_event_id": self._last_id,
+            **self.stats
+        }
+
+
+class MongoEventBackend:
+    """
+    Reparto entre workers con una colección capped de MongoDB: cada worker
+    inserta sus eventos y lee los de los demás con un cursor tailable.
+    """
+
+    def __init__(self, collection, size_bytes: int = 16 * 1024 * 1024):
+        self._coll = collection
+        self._size_bytes = size_bytes
+        self.origin = uuid.uuid4().hex
+
+    def ensure_collection(self) -> None:
+        database = self._coll.database
+        if self._coll.name not in database.list_collection_names():
+            try:
+                database.create_collection(self._coll.name, capped=True, size=self._size_bytes)
+            except Exception as e:
+                # Otro worker pudo crearla al mismo tiempo
+                logger.info(f"Capped collection {self._coll.name} not created: {e}")
+
+    def forward(self, topic: str, event_type: str, data: dict) -> None:
+        self._coll.insert_one({"origin": self.origin, "topic": topic, "type": event_type, "data": data})
+
+    def _tail(self, hub: EventHub, loop: asyncio.AbstractEventLoop, stop: threading.Event) -> None:
+        from pymongo import CursorType
+
+        self.ensure_collection()
+        newest = self._coll.find_one({}, sort=[("$natural", -1)], projection={"_id": 1})
+        last_id = newest["_id"] if newest else None
+
+        while not stop.is_set():
+            # Orden natural = orden de inserción en el servidor. Los ObjectId los
+            # generan los workers y no siguen ese orden, así que no se filtra con
+            # $gt: al reabrir se avanza hasta el último documento ya leído
+            cursor = self._coll.find({}, cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(1000)
+            resuming = last_id is not None
+            while cursor.alive and not stop.is_set():
+                for doc in cursor:
+                    if resuming:
+                        resuming = doc["_id"] != last_id
+                        continue
+                    last_id = doc["_id"]
+                    if doc["origin"] != self.origin:
+                        hub.publish_threadsafe(loop, doc["topic"], doc["type"], doc["data"], forward=False)
+                if resuming:
+                    # La colección capped ya sobrescribió el último leído: se perdieron eventos
+                    logger.warning(f"Event hub lost events from {self._coll.name}, starting a new epoch")
+                    loop.call_soon_threadsafe(hub.restart_epoch)
+                    resuming = False
+            # Cursor muerto (colección vacía al abrirlo): se reabre tras una pausa
+            stop.wait(1)
+
+    async def run(self, hub: EventHub) -> None:
+        """Tarea del lifespan que entrega en este worker los eventos de los demás"""
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.to_thread(self._tail, hub, loop, stop)
+                except Exception as e:
+                    logger.error(f"Event hub tail failed: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            stop.set()
+
+
+def parse_last_event_id(value: str | None) -> str | None:
+    """Last-Event-ID tal cual lo envió el cliente; replay decide si es de esta época"""
+    if not value:
+        return None
+    return value.strip() or None
+
+def format_sse(event: Event) -> str:
+    data = json.dumps(event.data, ensure_ascii=False, separators=(",", ":"), default=str)
+    return f"id: {event.id}\nevent: {event.type}\ndata: {data}\n\n"
+
+async def sse_stream(hub: EventHub, topic: str, last_event_id: int | None = None,
+                     heartbeat: float = HEARTBEAT_SECONDS):
+    """Generador de texto SSE con comentarios de heartbeat para mantener viva la conexión"""
+    async with hub.subscribe(topic, last_event_id) as subscription:
+        yield f"retry: {int(heartbeat * 1000)}\n\n"
+        while True:
+            event = await subscription.next(heartbeat)
+            yield ": ping\n\n" if event is None else format_sse(event)
+
+
+event_hub = EventHub()
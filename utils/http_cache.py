@@ -0,0 +1,71 @@
+"""
+ETags y GET condicionales a partir de los sellos de versión de las colecciones
+"""
+import os
+import hashlib
+from functools import wraps
+from fastapi import Request, Response
+
+from utils.cache_versions import version_stamps
+
+# Cache-Control por grupo de rutas, configurable por entorno
+CACHE_CONTROL = {
+    "catalogs": os.getenv("CACHE_CONTROL_CATALOGS", "public, max-age=30"),
+    "catalogtypes": os.getenv("CACHE_CONTROL_CATALOGTYPES", "private, max-age=60"),
+    "order_statuses": os.getenv("CACHE_CONTROL_ORDER_STATUSES", "public, max-age=300")
+}
+
+
+def compute_etag(request: Request, versions: tuple[str, ...]) -> str | None:
+    """
+    ETag derivado de las versiones y de la URL; None si aún no se conocen.
+    Es débil (W/) porque el mismo valor cubre las variantes gzip, br y sin
+    comprimir, que son equivalentes pero no idénticas byte a byte.
+    """
+    if not version_stamps.is_loaded():
+        return None
+
+    raw = "|".join(f"{name}:{version_stamps.get(name)}" for name in versions)
+    raw += f"|{request.url.path}?{request.url.query}"
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+def _opaque_tag(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparación débil de If-None-Match: se ignora el prefijo W/"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [_opaque_tag(tag.strip()) for tag in if_none_match.split(",")]
+    return _opaque_tag(etag) in candidates or "*" in candidates
+
+def conditional_get(*versions: str, route: str):
+    """
+    Decorador para endpoints GET que dependen de las colecciones indicadas.
+    Responde 304 sin ejecutar el endpoint si el cliente ya tiene la versión vigente.
+    El endpoint debe recibir `request: Request` y `response: Response`.
+    """
+    cache_control = CACHE_CONTROL[route]
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.get("request")
+            etag = compute_etag(request, versions) if request else None
+
+            if etag is None:
+                return await func(*args, **kwargs)
+
+            headers = {"ETag": etag, "Cache-Control": cache_control}
+            if etag_matches(request, etag):
+                return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+
+            result = await func(*args, **kwargs)
+
+            target = result if isinstance(result, Response) else kwargs.get("response")
+            if target is not None:
+                target.headers.update(headers)
+            return result
+        return wrapper
+    return decorator
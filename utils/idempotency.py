@@ -0,0 +1,178 @@
+"""
+Idempotency-Key para los POST que los clientes reintentan: la primera
+ejecución guarda su respuesta (colección con TTL y LRU en memoria delante) y
+los reintentos con la misma clave la reciben sin volver a ejecutar el
+controlador.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from fastapi import HTTPException, Response
+
+from utils.services import services
+from utils.mongodb import is_duplicate_key_error
+from utils.json_response import dumps
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Tiempo tras el cual una ejecución que no terminó (worker caído) se puede retomar
+LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1024"))
+
+PROCESSING = "processing"
+COMPLETED = "completed"
+
+idempotency_collection = services.collection("idempotency_keys")
+
+
+class IdempotencyStore:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"replayed": 0, "stored": 0, "in_progress": 0, "mismatched": 0}
+
+    def _remember(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + TTL_SECONDS, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def cached(self, key: str) -> dict | None:
+        """Respuesta completada en memoria (solo se guardan las terminadas, que no cambian)"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def claim(self, key: str, fingerprint: str) -> dict | None:
+        """
+        Reservar la clave para ejecutar el controlador. None si la reserva es
+        nuestra; si no, el documento existente (en curso o completado).
+        """
+        now = datetime.utcnow()
+        try:
+            idempotency_collection.insert_one({
+                "_id": key,
+                "fingerprint": fingerprint,
+                "status": PROCESSING,
+                "locked_until": now + timedelta(seconds=LOCK_SECONDS),
+                "expires_at": now + timedelta(seconds=TTL_SECONDS)
+            })
+            return None
+        except Exception as e:
+            if not is_duplicate_key_error(e):
+                raise
+
+        # Una ejecución abandonada se retoma en lugar de bloquear la clave hasta el TTL
+        taken = idempotency_collection.update_one(
+            {"_id": key, "status": PROCESSING, "locked_until": {"$lt": now}},
+            {"$set": {"fingerprint": fingerprint, "locked_until": now + timedelta(seconds=LOCK_SECONDS)}}
+        )
+        if taken.modified_count:
+            return None
+
+        existing = idempotency_collection.find_one({"_id": key})
+        if existing is None:
+            # Expiró entre la inserción fallida y la lectura
+            return self.claim(key, fingerprint)
+        if existing["status"] == COMPLETED:
+            self._remember(key, existing)
+        return existing
+
+    def complete(self, key: str, fingerprint: str, status_code: int, body: bytes) -> None:
+        entry = {
+            "fingerprint": fingerprint,
+            "status": COMPLETED,
+            "status_code": status_code,
+            "body": body,
+            "expires_at": datetime.utcnow() + timedelta(seconds=TTL_SECONDS)
+        }
+        idempotency_collection.update_one({"_id": key}, {"$set": entry, "$unset": {"locked_until": ""}})
+        self._remember(key, entry)
+        self.stats["stored"] += 1
+
+    def release(self, key: str) -> None:
+        """La ejecución falló: se libera la clave para que el reintento vuelva a ejecutarse"""
+        idempotency_collection.delete_one({"_id": key, "status": PROCESSING})
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._entries), **self.stats}
+
+
+idempotency_store = IdempotencyStore()
+
+
+def _replay(entry: dict, fingerprint: str) -> Response:
+    if entry["fingerprint"] != fingerprint:
+        idempotency_store.stats["mismatched"] += 1
+        raise HTTPException(status_code=422, detail="Idempotency-Key ya usada con otro contenido")
+    if entry["status"] != COMPLETED:
+        idempotency_store.stats["in_progress"] += 1
+        raise HTTPException(
+            status_code=409,
+            detail="Una solicitud con esta Idempotency-Key sigue en proceso",
+            headers={"Retry-After": "1"}
+        )
+
+    idempotency_store.stats["replayed"] += 1
+    return Response(
+        content=entry["body"],
+        status_code=entry["status_code"],
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+def idempotent(func):
+    """
+    Decorador para POST que deben poder reintentarse: con el header
+    Idempotency-Key solo la primera ejecución llega al controlador. Solo se
+    guardan las respuestas correctas; un error libera la clave. Va debajo de
+    @validateuser (la clave se separa por usuario). El endpoint debe recibir
+    `request: Request`.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        request = kwargs.get("request")
+        client_key = request.headers.get(HEADER) if request else None
+        if not client_key:
+            return await func(*args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+
+        user_id = getattr(request.state, "id", None)
+        raw_key = f"{user_id}|{request.method}|{request.url.path}|{client_key}"
+        key = hashlib.sha256(raw_key.encode()).hexdigest()
+        # FastAPI ya leyó el cuerpo para validarlo, así que body() no vuelve a leer del socket
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+        entry = idempotency_store.cached(key) or idempotency_store.claim(key, fingerprint)
+        if entry is not None:
+            return _replay(entry, fingerprint)
+
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException:
+            idempotency_store.release(key)
+            raise
+
+        if isinstance(result, Response):
+            idempotency_store.release(key)
+            return result
+
+        body = dumps(result)
+        idempotency_store.complete(key, fingerprint, 200, body)
+        return Response(content=body, media_type="application/json")
+    return wrapper
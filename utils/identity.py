@@ -0,0 +1,155 @@
+"""
+Proveedores de identidad usados para aprovisionar las cuentas de usuario
+"""
+import os
+import json
+import base64
+import logging
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityProviderError(Exception):
+    """Error devuelto por el proveedor de identidad"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class AccountAlreadyExistsError(IdentityProviderError):
+    """El email ya tiene cuenta en el proveedor: no se enlaza a un alta nueva"""
+
+    def __init__(self, email: str):
+        super().__init__(f"An account already exists for {email}", retryable=False)
+
+
+class FirebaseIdentityProvider:
+    """Proveedor real respaldado por Firebase Authentication"""
+
+    name = "firebase"
+
+    def __init__(self):
+        import firebase_admin
+        from firebase_admin import credentials, auth as firebase_auth
+
+        self._auth = firebase_auth
+
+        if firebase_admin._apps:
+            return
+
+        firebase_creds_base64 = os.getenv("FIREBASE_CREDENTIALS_BASE64")
+
+        if firebase_creds_base64:
+            firebase_creds_json = base64.b64decode(firebase_creds_base64).decode('utf-8')
+            firebase_creds = json.loads(firebase_creds_json)
+            cred = credentials.Certificate(firebase_creds)
+            firebase_admin.initialize_app(cred)
+            logger.info("Firebase initialized with environment variable credentials")
+        else:
+            # Fallback to local file (for local development)
+            cred = credentials.Certificate("secrets/dulceria-secret.json")
+            firebase_admin.initialize_app(cred)
+            logger.info("Firebase initialized with JSON file")
+
+    def get_uid_by_email(self, email: str) -> str | None:
+        try:
+            return self._auth.get_user_by_email(email).uid
+        except self._auth.UserNotFoundError:
+            return None
+        except Exception as e:
+            raise IdentityProviderError(str(e))
+
+    def create_account(self, email: str, password: str) -> str:
+        try:
+            return self._auth.create_user(email=email, password=password).uid
+        except self._auth.EmailAlreadyExistsError:
+            raise AccountAlreadyExistsError(email)
+        except ValueError as e:
+            # Datos inválidos (email o contraseña): reintentar no sirve de nada
+            raise IdentityProviderError(str(e), retryable=False)
+        except Exception as e:
+            raise IdentityProviderError(str(e))
+
+    def delete_account(self, uid: str) -> None:
+        try:
+            self._auth.delete_user(uid)
+        except self._auth.UserNotFoundError:
+            pass
+        except Exception as e:
+            raise IdentityProviderError(str(e))
+
+
+class FakeIdentityProvider:
+    """Proveedor en memoria para pruebas y desarrollo sin conexión"""
+
+    name = "fake"
+
+    def __init__(self):
+        self._accounts: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._pending_failures: list[IdentityProviderError] = []
+        self.calls: list[str] = []
+
+    def fail_next(self, times: int = 1, retryable: bool = True) -> None:
+        """Hacer que las siguientes llamadas a create_account fallen"""
+        for _ in range(times):
+            self._pending_failures.append(IdentityProviderError("Simulated failure", retryable=retryable))
+
+    def get_uid_by_email(self, email: str) -> str | None:
+        with self._lock:
+            self.calls.append("get_uid_by_email")
+            account = self._accounts.get(email.lower())
+            return account["uid"] if account else None
+
+    def create_account(self, email: str, password: str) -> str:
+        with self._lock:
+            self.calls.append("create_account")
+            if self._pending_failures:
+                raise self._pending_failures.pop(0)
+
+            if email.lower() in self._accounts:
+                raise AccountAlreadyExistsError(email)
+
+            account = {"uid": uuid.uuid4().hex, "email": email, "password": password}
+            self._accounts[email.lower()] = account
+            return account["uid"]
+
+    def delete_account(self, uid: str) -> None:
+        with self._lock:
+            self.calls.append("delete_account")
+            for email, account in list(self._accounts.items()):
+                if account["uid"] == uid:
+                    del self._accounts[email]
+
+    def verify_password(self, email: str, password: str) -> bool:
+        account = self._accounts.get(email.lower())
+        return bool(account) and account["password"] == password
+
+
+def ensure_account(provider, email: str, password: str, known_uid: str = None) -> str:
+    """
+    Crear la cuenta del usuario en el proveedor. `known_uid` es el uid que un
+    intento anterior del mismo trabajo ya guardó; solo ese se reutiliza. Una
+    cuenta existente para el email lanza AccountAlreadyExistsError, para no
+    enlazar el alta a la cuenta de otra persona ignorando su contraseña.
+    """
+    if known_uid is not None:
+        return known_uid
+    return provider.create_account(email, password)
+
+
+_provider = None
+
+def get_identity_provider():
+    """Proveedor configurado con IDENTITY_PROVIDER (firebase por defecto, o fake)"""
+    global _provider
+    if _provider is None:
+        kind = os.getenv("IDENTITY_PROVIDER", "firebase").lower()
+        if kind == "fake":
+            _provider = FakeIdentityProvider()
+        else:
+            _provider = FirebaseIdentityProvider()
+    return _provider
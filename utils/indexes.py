@@ -0,0 +1,76 @@
+"""
+Índices de MongoDB que la API necesita. Se crean al arrancar; create_index
+es idempotente, así que ejecutarlo en cada despliegue es seguro.
+"""
+import os
+import logging
+
+from utils.services import services
+
+logger = logging.getLogger(__name__)
+
+# Comparación de nombres sin distinguir mayúsculas (strength 2 = ignora mayúsculas, no acentos)
+NAME_COLLATION = {"locale": "es", "strength": 2}
+
+OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7")) * 86400
+
+
+def ensure_indexes() -> None:
+    catalogs = services.collection("catalogs")
+
+    _create(catalogs, [("name", "text"), ("description", "text")],
+            name="catalogs_text_search",
+            weights={"name": 10, "description": 2},
+            default_language="spanish")
+
+    # Unicidad de nombres: la consulta de duplicados pasa a ser una sonda al índice
+    _create(catalogs, [("name", 1)],
+            name="catalogs_name_unique_ci",
+            unique=True,
+            collation=NAME_COLLATION)
+
+    # Listados por tipo: $match sobre tipo + activo
+    _create(catalogs, [("id_catalog_type", 1), ("active", 1)],
+            name="catalogs_type_active")
+
+    # Una línea por producto en cada bundle: los $inc con upsert se apoyan en él
+    _create(services.collection("bundle_details"), [("id_bundle", 1), ("id_producto", 1)],
+            name="bundle_details_bundle_product_unique",
+            unique=True)
+
+    # Un usuario por correo: las altas simultáneas chocan en el índice
+    _create(services.collection("users"), [("email", 1)],
+            name="users_email_unique",
+            unique=True)
+
+    # Cola de cocina: órdenes por estado actual, las más antiguas primero
+    _create(services.collection("orders"), [("status", 1), ("date", 1)],
+            name="orders_status_date")
+
+    outbox = services.collection("outbox")
+
+    # Lotes del dispatcher: pendientes ya disponibles, en orden de escritura
+    _create(outbox, [("status", 1), ("available_at", 1), ("_id", 1)],
+            name="outbox_status_available")
+
+    # Un mismo evento lógico no se guarda dos veces
+    _create(outbox, [("dedupe_key", 1)],
+            name="outbox_dedupe_key_unique",
+            unique=True)
+
+    # Los eventos entregados se borran solos pasado el periodo de retención
+    _create(outbox, [("dispatched_at", 1)],
+            name="outbox_dispatched_ttl",
+            expireAfterSeconds=OUTBOX_RETENTION_SECONDS)
+
+    # Respuestas guardadas por Idempotency-Key: cada documento lleva su expiración
+    _create(services.collection("idempotency_keys"), [("expires_at", 1)],
+            name="idempotency_keys_ttl",
+            expireAfterSeconds=0)
+
+def _create(collection, keys, **kwargs) -> None:
+    """Crear un índice sin tumbar el arranque si falla (p.ej. datos duplicados)"""
+    try:
+        collection.create_index(keys, **kwargs)
+    except Exception as e:
+        logger.error(f"Could not create index {kwargs.get('name')} on {collection.name}: {e}")
@@ -0,0 +1,47 @@
+"""
+Serialización JSON rápida con orjson y soporte para tipos de MongoDB
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - entorno sin orjson
+    orjson = None
+
+
+def _default(obj):
+    """Tipos que ni orjson ni json saben codificar por sí solos"""
+    # ObjectId, Decimal128 y similares de bson se exponen como texto
+    if type(obj).__name__ in ("ObjectId", "Decimal128"):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(content) -> bytes:
+    """Codificar `content` a bytes JSON en formato compacto"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Clase de respuesta por defecto de la app"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
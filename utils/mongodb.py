@@ -1,7 +1,5 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
 
 load_dotenv()
 
@@ -9,18 +7,22 @@ load_dotenv()
 DB = os.getenv("DATABASE_NAME") or os.getenv("MONGO_DB_NAME")
 URI = os.getenv("MONGODB_URI") or os.getenv("URI")
 
-# Validate that we have the required environment variables
-if not DB:
-    raise ValueError("Database name not found. Set DATABASE_NAME or MONGO_DB_NAME environment variable")
-if not URI:
-    raise ValueError("MongoDB URI not found. Set MONGODB_URI or URI environment variable")
-
 
 _client = None
 
 def get_mongo_client():
     global _client
     if _client is None:
+        # Validate that we have the required environment variables
+        if not DB:
+            raise ValueError("Database name not found. Set DATABASE_NAME or MONGO_DB_NAME environment variable")
+        if not URI:
+            raise ValueError("MongoDB URI not found. Set MONGODB_URI or URI environment variable")
+
+        # pymongo se importa aquí para no pagar su carga al importar la app
+        from pymongo import MongoClient
+        from pymongo.server_api import ServerApi
+
         _client = MongoClient(
             URI,
             server_api=ServerApi("1"),
@@ -30,6 +32,16 @@ def get_mongo_client():
         )
     return _client
 
+def close_mongo_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+def is_duplicate_key_error(error: Exception) -> bool:
+    """True si el error viene de un índice único (DuplicateKeyError, código 11000)"""
+    return getattr(error, "code", None) == 11000
+
 def get_collection(col):
     """Obtiene una colección de MongoDB"""
     client = get_mongo_client()
@@ -42,4 +54,4 @@ def t_connection():
         return True
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
-        return False
\ No newline at end of file
+        return False
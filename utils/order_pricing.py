@@ -0,0 +1,61 @@
+"""
+Totales de una orden (subtotal, impuestos, descuento), compartidos por el
+recálculo al escribir detalles y por la cotización de carritos, para que
+ambos den siempre el mismo resultado.
+"""
+
+DEFAULT_TAX_RATE = 0.01
+
+
+def compute_order_totals(subtotal: float, tax_rate: float) -> dict:
+    """Totales redondeados; una orden sin importe queda en cero"""
+    if subtotal <= 0:
+        return {"subtotal": 0.0, "taxes": 0.0, "discount": 0.0, "total": 0.0}
+
+    taxes = subtotal * tax_rate
+    # Por ahora no hay descuentos automáticos
+    discount = 0.0
+    total = subtotal + taxes - discount
+    return {
+        "subtotal": round(subtotal, 2),
+        "taxes": round(taxes, 2),
+        "discount": discount,
+        "total": round(total, 2)
+    }
+
+def price_cart(items: list[dict], products: dict[str, dict], tax_rate: float) -> dict:
+    """
+    Cotizar líneas {id_producto, quantity} contra `products` (id -> producto).
+    Las líneas repetidas se suman. Los productos que no existen o están
+    inactivos se devuelven en `unavailable` y no cuentan en el subtotal.
+    """
+    quantities: dict[str, int] = {}
+    for item in items:
+        quantities[item["id_producto"]] = quantities.get(item["id_producto"], 0) + item["quantity"]
+
+    lines = []
+    unavailable = []
+    subtotal = 0.0
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None or not product["active"]:
+            unavailable.append(product_id)
+            continue
+
+        # Mismo precio que usa el recálculo de la orden: costo de catálogo x cantidad
+        line_total = product["cost"] * quantity
+        subtotal += line_total
+        lines.append({
+            "id_producto": product_id,
+            "name": product["name"],
+            "unit_price": product["cost"],
+            "quantity": quantity,
+            "line_total": round(line_total, 2)
+        })
+
+    return {
+        "lines": lines,
+        "unavailable": unavailable,
+        "total_items": sum(line["quantity"] for line in lines),
+        **compute_order_totals(subtotal, tax_rate)
+    }
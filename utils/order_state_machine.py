@@ -0,0 +1,107 @@
+"""
+Máquina de estados de las órdenes: el grafo de transiciones declarado en
+order_statuses se compila a una tabla en memoria para validar cada cambio de
+estado sin consultar la base de datos.
+"""
+import logging
+
+# Grafo por defecto para los estados que no declaran next_statuses /
+# requires_products: descripción -> (estados siguientes, requiere productos)
+DEFAULT_TRANSITIONS = {
+    "inprogress": (["ordered", "cancelled"], False),
+    "ordered": (["processing", "cancelled"], True),
+    "processing": (["shipped", "delivered", "cancelled"], True),
+    "shipped": (["delivered"], True),
+    "delivered": ([], True),
+    "cancelled": ([], False)
+}
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidTransitionGraph(ValueError):
+    pass
+
+
+class TransitionTable:
+    def __init__(self, descriptions: dict[str, str], edges: dict[str, frozenset], requires_products: frozenset,
+                 undeclared: frozenset = frozenset()):
+        self._descriptions = descriptions
+        # Estados sin next_statuses ni grafo por defecto: las órdenes no pueden salir de ellos
+        self.undeclared = undeclared
+        self._ids = {description: status_id for status_id, description in descriptions.items()}
+        self._edges = edges
+        self._requires_products = requires_products
+
+    def status_id(self, description: str) -> str | None:
+        return self._ids.get(description)
+
+    def description(self, status_id: str | None) -> str | None:
+        return self._descriptions.get(status_id)
+
+    def allowed(self, from_id: str, to_id: str) -> bool:
+        return to_id in self._edges.get(from_id, ())
+
+    def requires_products(self, status_id: str) -> bool:
+        return status_id in self._requires_products
+
+    def as_dict(self) -> dict:
+        """Grafo legible por descripción, para la API"""
+        return {
+            description: {
+                "next_statuses": sorted(self._descriptions[t] for t in self._edges.get(status_id, ())),
+                "requires_products": status_id in self._requires_products
+            }
+            for status_id, description in self._descriptions.items()
+        }
+
+
+def compile_transitions(docs: list[dict], strict: bool = False) -> TransitionTable:
+    """
+    `docs`: estados con id, description y opcionalmente next_statuses
+    (descripciones) y requires_products. Con strict=True un destino
+    desconocido o una transición a sí mismo lanzan InvalidTransitionGraph;
+    si no, se ignoran. Los estados sin next_statuses que tampoco están en
+    DEFAULT_TRANSITIONS se registran en un warning y quedan en `undeclared`.
+    """
+    descriptions = {doc["id"]: doc["description"] for doc in docs}
+    ids = {description: status_id for status_id, description in descriptions.items()}
+
+    edges = {}
+    requires_products = set()
+    undeclared = set()
+    for doc in docs:
+        status_id, description = doc["id"], doc["description"]
+        default_next, default_requires = DEFAULT_TRANSITIONS.get(description, ([], False))
+
+        configured = doc.get("next_statuses")
+        if configured is None:
+            if description not in DEFAULT_TRANSITIONS:
+                undeclared.add(description)
+            targets = default_next
+        else:
+            targets = configured
+            if strict:
+                unknown = [target for target in configured if target not in ids]
+                if unknown:
+                    raise InvalidTransitionGraph(
+                        f"El estado '{description}' apunta a estados que no existen: {', '.join(unknown)}"
+                    )
+                if description in configured:
+                    raise InvalidTransitionGraph(f"El estado '{description}' no puede transicionar a sí mismo")
+
+        edges[status_id] = frozenset(
+            ids[target] for target in targets if target in ids and target != description
+        )
+
+        required = doc.get("requires_products")
+        if required is None:
+            required = default_requires
+        if required:
+            requires_products.add(status_id)
+
+    if undeclared:
+        logger.warning(
+            f"Order statuses without next_statuses or default transitions: {', '.join(sorted(undeclared))}"
+        )
+    return TransitionTable(descriptions, edges, frozenset(requires_products), frozenset(undeclared))
@@ -0,0 +1,236 @@
+"""
+Outbox transaccional: cada escritura que cambia el estado de una orden guarda
+también un evento en la colección `outbox` dentro de la misma transacción. Un
+dispatcher lo reparte por lotes a los suscriptores en proceso con entrega
+at-least-once; la dedupe_key permite descartar las entregas repetidas.
+"""
+import os
+import uuid
+import asyncio
+import inspect
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from utils.services import services
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "30"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+DEDUPE_CACHE_SIZE = 10000
+
+PENDING = "pending"
+DISPATCHED = "dispatched"
+FAILED = "failed"
+
+# Tipos de evento de las órdenes
+ORDER_CREATED = "order.created"
+ORDER_STATUS_CHANGED = "order.status_changed"
+ORDER_DETAIL_CREATED = "order_detail.created"
+ORDER_DETAIL_UPDATED = "order_detail.updated"
+ORDER_DETAIL_DELETED = "order_detail.deleted"
+
+logger = logging.getLogger(__name__)
+
+outbox_collection = services.collection("outbox")
+
+_transactions_supported = None
+
+
+def transactions_supported() -> bool:
+    """Las transacciones requieren replica set o mongos; un mongod suelto no las admite"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = services.client.admin.command("hello")
+        _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+def run_in_transaction(callback):
+    """
+    Ejecutar `callback(session)` en una transacción y devolver su resultado.
+    Sin soporte de transacciones se llama con session=None: las escrituras
+    dejan de ser atómicas pero el evento se sigue guardando tras el cambio.
+    """
+    result = _run_callback(callback)
+    # Los eventos ya están confirmados: el dispatcher puede verlos
+    outbox_dispatcher.notify()
+    return result
+
+def _run_callback(callback):
+    global _transactions_supported
+    from pymongo.errors import OperationFailure
+
+    if transactions_supported():
+        try:
+            with services.client.start_session() as session:
+                return session.with_transaction(callback)
+        except OperationFailure as e:
+            # IllegalOperation: el servidor rechazó la transacción, se recuerda
+            if e.code != 20:
+                raise
+            logger.warning(f"MongoDB transactions unavailable, writing outbox without them: {e}")
+            _transactions_supported = False
+
+    return callback(None)
+
+def write_event(session, event_type: str, aggregate_id: str, data: dict, dedupe_key: str = None) -> str:
+    """Guardar un evento en el outbox con la sesión de la transacción en curso"""
+    event_id = ObjectId()
+    now = datetime.utcnow()
+    outbox_collection.insert_one({
+        "_id": event_id,
+        "type": event_type,
+        "aggregate_id": aggregate_id,
+        "data": data,
+        "dedupe_key": dedupe_key or str(event_id),
+        "status": PENDING,
+        "attempts": 0,
+        "available_at": now,
+        "date_created": now
+    }, session=session)
+    return str(event_id)
+
+
+class OutboxDispatcher:
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self._batch_size = batch_size
+        self._handlers: dict[str, list] = {}
+        self._seen: OrderedDict = OrderedDict()
+        self._owner = uuid.uuid4().hex
+        self._loop = None
+        self._wakeup = asyncio.Event()
+        self.stats = {
+            "dispatched": 0,
+            "duplicates": 0,
+            "retried": 0,
+            "failed": 0,
+            "last_run": None
+        }
+
+    def subscribe(self, event_type: str, handler) -> None:
+        """
+        Registrar `handler(event)` para un tipo de evento ("*" recibe todos).
+        Puede ser async; corre en el event loop. Una excepción hace que el
+        evento se reintente, así que los handlers deben ser idempotentes.
+        """
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def notify(self) -> None:
+        """Despertar al dispatcher tras escribir un evento (seguro desde cualquier hilo)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self) -> list[dict]:
+        """Tomar un lote de eventos con un lease; si este worker muere, otro los retoma al vencer"""
+        now = datetime.utcnow()
+        query = {"status": PENDING, "available_at": {"$lte": now}}
+        ids = [doc["_id"] for doc in outbox_collection.find(query, {"_id": 1}).sort("_id", 1).limit(self._batch_size)]
+        if not ids:
+            return []
+
+        lease_id = ObjectId()
+        outbox_collection.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {
+                "available_at": now + timedelta(seconds=LEASE_SECONDS),
+                "lease_owner": self._owner,
+                "lease_id": lease_id
+            }}
+        )
+        return list(outbox_collection.find({"_id": {"$in": ids}, "lease_id": lease_id}).sort("_id", 1))
+
+    def _mark_dispatched(self, event_ids: list) -> None:
+        outbox_collection.update_many(
+            {"_id": {"$in": event_ids}},
+            {"$set": {"status": DISPATCHED, "dispatched_at": datetime.utcnow()},
+             "$unset": {"lease_owner": "", "lease_id": ""}}
+        )
+
+    def _release(self, event: dict, error: Exception) -> None:
+        """Devolver el evento a la cola con backoff, o marcarlo como fallido"""
+        attempts = event.get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_error": str(error)}
+        if attempts >= MAX_ATTEMPTS:
+            update["status"] = FAILED
+            self.stats["failed"] += 1
+            logger.error(f"Outbox event {event['_id']} ({event['type']}) failed after {attempts} attempts: {error}")
+        else:
+            update["available_at"] = datetime.utcnow() + timedelta(seconds=min(2 ** attempts, 300))
+            self.stats["retried"] += 1
+        outbox_collection.update_one(
+            {"_id": event["_id"]},
+            {"$set": update, "$unset": {"lease_owner": "", "lease_id": ""}}
+        )
+
+    def _remember(self, dedupe_key: str) -> None:
+        self._seen[dedupe_key] = True
+        if len(self._seen) > DEDUPE_CACHE_SIZE:
+            self._seen.popitem(last=False)
+
+    async def _deliver(self, event: dict) -> None:
+        payload = {
+            "id": str(event["_id"]),
+            "type": event["type"],
+            "aggregate_id": event["aggregate_id"],
+            "data": event["data"],
+            "dedupe_key": event["dedupe_key"]
+        }
+        for handler in self._handlers.get(event["type"], []) + self._handlers.get("*", []):
+            result = handler(payload)
+            if inspect.isawaitable(result):
+                await result
+
+    async def dispatch_batch(self) -> int:
+        """Entregar un lote; devuelve cuántos eventos se tomaron"""
+        events = await asyncio.to_thread(self._claim)
+        delivered = []
+        for event in events:
+            # Ya entregado por este proceso (p. ej. falló el marcado anterior)
+            if event["dedupe_key"] in self._seen:
+                self.stats["duplicates"] += 1
+                delivered.append(event["_id"])
+                continue
+            try:
+                await self._deliver(event)
+            except Exception as e:
+                await asyncio.to_thread(self._release, event, e)
+                continue
+            self._remember(event["dedupe_key"])
+            delivered.append(event["_id"])
+
+        if delivered:
+            await asyncio.to_thread(self._mark_dispatched, delivered)
+            self.stats["dispatched"] += len(delivered)
+        self.stats["last_run"] = datetime.utcnow()
+        return len(events)
+
+    async def run(self) -> None:
+        """Bucle del lifespan: drena el outbox al recibir avisos o cada POLL_INTERVAL_SECONDS"""
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            try:
+                claimed = await self.dispatch_batch()
+            except Exception as e:
+                logger.error(f"Outbox dispatcher error: {e}")
+                claimed = 0
+
+            # Lote completo: probablemente quedan más, se sigue sin esperar
+            if claimed >= self._batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def metrics(self) -> dict:
+        return {
+            "subscriptions": {event_type: len(handlers) for event_type, handlers in self._handlers.items()},
+            **self.stats
+        }
+
+
+outbox_dispatcher = OutboxDispatcher()
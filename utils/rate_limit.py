@@ -0,0 +1,246 @@
+"""
+Rate limiting con token buckets por usuario o por IP
+"""
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class RatePolicy:
+    """Política de un grupo de rutas: capacidad del bucket y recarga por segundo"""
+
+    def __init__(self, name: str, capacity: int, refill_per_second: float, key: str = "ip"):
+        if key not in ("ip", "user"):
+            raise ValueError("key must be 'ip' or 'user'")
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.key = key
+
+
+class MemoryRateLimitBackend:
+    """
+    Buckets en memoria repartidos en shards con su propio lock, para que
+    las peticiones concurrentes no compitan por un único lock global.
+    Solo sirve para un proceso; con varios workers usar MongoRateLimitBackend.
+    """
+
+    blocking = False
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10000):
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self._max_keys = max_keys_per_shard
+
+    def hit(self, key: str, policy: RatePolicy, now: float = None) -> tuple[bool, float]:
+        """Consumir un token; devuelve (permitido, segundos hasta el próximo token)"""
+        now = time.monotonic() if now is None else now
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+
+        with lock:
+            tokens, updated = buckets.pop(key, (policy.capacity, now))
+            tokens = min(policy.capacity, tokens + (now - updated) * policy.refill_per_second)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            # OrderedDict como LRU: las claves inactivas se descartan primero
+            buckets[key] = (tokens, now)
+            if len(buckets) > self._max_keys:
+                buckets.popitem(last=False)
+
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / policy.refill_per_second
+
+
+class MongoRateLimitBackend:
+    """
+    Buckets compartidos entre workers guardados en MongoDB. Cada petición es
+    un único find_one_and_update atómico con pipeline de actualización.
+    """
+
+    blocking = True
+
+    def __init__(self, collection):
+        self._coll = collection
+        self._indexed = False
+
+    def hit(self, key: str, policy: RatePolicy, now: float = None) -> tuple[bool, float]:
+        from pymongo import ReturnDocument
+
+        if not self._indexed:
+            self._coll.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+        now = time.time() if now is None else now
+        cap = policy.capacity
+        rate = policy.refill_per_second
+        expires_at = datetime.utcnow() + timedelta(seconds=cap / rate)
+
+        doc = self._coll.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [cap, {"$add": [
+                        {"$ifNull": ["$tokens", cap]},
+                        {"$multiply": [
+                            {"$max": [0, {"$subtract": [now, {"$ifNull": ["$ts", now]}]}]},
+                            rate
+                        ]}
+                    ]}]},
+                    "ts": now
+                }},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": expires_at
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (1 - doc["tokens"]) / rate
+
+
+class RateLimiter:
+    """Asocia rutas con políticas y lleva métricas de admisión"""
+
+    def __init__(self, backend, trust_proxy: bool = False):
+        self.backend = backend
+        self.trust_proxy = trust_proxy
+        self._rules: list[tuple[set, re.Pattern, RatePolicy]] = []
+        self._stats: dict[str, dict] = {}
+
+    def add_rule(self, methods: list[str], path_pattern: str, policy: RatePolicy) -> None:
+        self._rules.append(({m.upper() for m in methods}, re.compile(path_pattern), policy))
+        self._stats.setdefault(policy.name, {"allowed": 0, "rejected": 0})
+
+    def match(self, method: str, path: str) -> RatePolicy | None:
+        for methods, pattern, policy in self._rules:
+            if method in methods and pattern.match(path):
+                return policy
+        return None
+
+    def client_key(self, scope: dict, policy: RatePolicy) -> str:
+        if policy.key == "user":
+            user_id = _user_id_from_scope(scope)
+            if user_id:
+                return f"{policy.name}:user:{user_id}"
+
+        ip = None
+        if self.trust_proxy:
+            forwarded = _header(scope, b"x-forwarded-for")
+            if forwarded:
+                ip = forwarded.split(",")[0].strip()
+        if not ip:
+            client = scope.get("client")
+            ip = client[0] if client else "unknown"
+        return f"{policy.name}:ip:{ip}"
+
+    async def check(self, scope: dict) -> tuple[RatePolicy | None, bool, float]:
+        policy = self.match(scope["method"], scope["path"])
+        if policy is None:
+            return None, True, 0.0
+
+        key = self.client_key(scope, policy)
+        try:
+            if self.backend.blocking:
+                allowed, retry_after = await asyncio.to_thread(self.backend.hit, key, policy)
+            else:
+                allowed, retry_after = self.backend.hit(key, policy)
+        except Exception as e:
+            # Si el backend compartido falla se deja pasar la petición
+            logger.error(f"Rate limit backend error: {e}")
+            return policy, True, 0.0
+
+        self._stats[policy.name]["allowed" if allowed else "rejected"] += 1
+        return policy, allowed, retry_after
+
+    def metrics(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "policies": {name: dict(counts) for name, counts in self._stats.items()}
+        }
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI que responde 429 con Retry-After cuando se agota el bucket"""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        policy, allowed, retry_after = await self.limiter.check(scope)
+        if allowed:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Demasiadas solicitudes, intenta más tarde"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                (b"x-ratelimit-policy", policy.name.encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope: dict, name: bytes) -> str | None:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def _user_id_from_scope(scope: dict) -> str | None:
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+
+    import jwt
+    try:
+        payload = jwt.decode(authorization[7:], os.getenv("SECRET_KEY"), algorithms=["HS256"])
+    except Exception:
+        return None
+    return payload.get("id")
+
+def build_rate_limiter() -> RateLimiter:
+    """Limitador con las políticas de la API; backend según RATE_LIMIT_BACKEND"""
+    if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "mongo":
+        from utils.services import services
+        backend = MongoRateLimitBackend(services.collection("rate_limits"))
+    else:
+        backend = MemoryRateLimitBackend()
+
+    limiter = RateLimiter(backend, trust_proxy=os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1")
+    limiter.add_rule(["POST"], r"^/login$", RatePolicy("login", capacity=10, refill_per_second=10 / 60))
+    limiter.add_rule(["POST"], r"^/users$", RatePolicy("signup", capacity=5, refill_per_second=5 / 600))
+    # La cotización no escribe: tiene su propio bucket, más holgado
+    limiter.add_rule(
+        ["POST"], r"^/orders/quote$",
+        RatePolicy("order_quotes", capacity=60, refill_per_second=2, key="user")
+    )
+    limiter.add_rule(
+        ["POST", "PUT", "DELETE"], r"^/orders(?!/quote$)(/|$)",
+        RatePolicy("order_writes", capacity=30, refill_per_second=1, key="user")
+    )
+    return limiter
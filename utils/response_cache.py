@@ -0,0 +1,128 @@
+"""
+Caché de respuestas ya serializadas para los GET más consultados.
+Un acierto devuelve los bytes guardados (y ya comprimidos) sin validar con
+Pydantic ni codificar JSON.
+"""
+import threading
+from collections import OrderedDict
+from functools import wraps
+from fastapi import Response
+
+from utils.cache_versions import version_stamps
+from utils.json_response import dumps
+from utils.compression import MIN_SIZE, choose_encoding, compress
+
+MAX_ENTRIES = 512
+
+
+class CachedResponse:
+    def __init__(self, body: bytes, versions: dict[str, int]):
+        self.body = body
+        self.versions = versions
+        # Variantes comprimidas por codificación, calculadas una sola vez
+        self._variants: dict[str, bytes | None] = {}
+
+    def encoded(self, encoding: str | None) -> tuple[bytes, str | None]:
+        """Cuerpo para la codificación pedida y la codificación realmente usada"""
+        if encoding is None or len(self.body) < MIN_SIZE:
+            return self.body, None
+        if encoding not in self._variants:
+            compressed = compress(self.body, encoding)
+            self._variants[encoding] = compressed if len(compressed) < len(self.body) else None
+        variant = self._variants[encoding]
+        if variant is None:
+            return self.body, None
+        return variant, encoding
+
+    def to_response(self, request) -> Response:
+        body, encoding = self.encoded(choose_encoding(request.headers.get("accept-encoding")))
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._max_entries = max_entries
+        self._watched: set[str] = set()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def watch(self, version: str) -> None:
+        """Vaciar las entradas que dependen de `version` cuando esta cambie"""
+        if version not in self._watched:
+            self._watched.add(version)
+            version_stamps.on_change(version, lambda _: self.invalidate(version))
+
+    def get(self, key: str, versions: dict[str, int]) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.versions != versions:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, version: str = None) -> None:
+        """Descartar las entradas que dependen de `version` (o todas)"""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if version is None or version in e.versions]:
+                del self._entries[key]
+            self.stats["invalidations"] += 1
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._entries), **self.stats}
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(*versions: str, model=None):
+    """
+    Decorador para GETs cuyo contenido depende solo de la URL y de las
+    colecciones indicadas. `model` replica el filtrado de response_model.
+    El endpoint debe recibir `request: Request`.
+    """
+    for version in versions:
+        response_cache.watch(version)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.get("request")
+            if request is None:
+                return await func(*args, **kwargs)
+
+            key = f"{request.url.path}?{request.url.query}"
+            # Versiones leídas antes de ejecutar: si cambian mientras tanto,
+            # la entrada guardada queda obsoleta y no se vuelve a servir
+            current = {version: version_stamps.get(version) for version in versions}
+
+            cacheable = version_stamps.is_loaded()
+            entry = response_cache.get(key, current) if cacheable else None
+            if entry is not None:
+                return entry.to_response(request)
+
+            result = await func(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+
+            if model is not None:
+                result = model.model_validate(result).model_dump(mode="json", by_alias=True)
+
+            entry = CachedResponse(dumps(result), current)
+            if cacheable:
+                response_cache.put(key, entry)
+            return entry.to_response(request)
+        return wrapper
+    return decorator
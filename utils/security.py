@@ -14,6 +14,9 @@ from functools import wraps
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
+# Clave Fernet para los secretos que se guardan temporalmente (contraseña de un
+# alta pendiente); si no se define se deriva de SECRET_KEY
+PROVISIONING_SECRET_KEY = os.getenv("PROVISIONING_SECRET_KEY")
 security = HTTPBearer()
 
 # Función para crear un JWT
@@ -42,6 +45,23 @@ def create_jwt_token(
     )
     return token
 
+def _fernet():
+    # cryptography se importa aquí para no cargarlo al importar la app
+    from cryptography.fernet import Fernet
+
+    key = PROVISIONING_SECRET_KEY
+    if not key:
+        digest = hashlib.sha256(f"provisioning:{SECRET_KEY}".encode()).digest()
+        key = base64.urlsafe_b64encode(digest).decode()
+    return Fernet(key)
+
+def encrypt_secret(value: str) -> str:
+    """Cifrar un secreto antes de guardarlo en MongoDB"""
+    return _fernet().encrypt(value.encode()).decode()
+
+def decrypt_secret(token: str) -> str:
+    return _fernet().decrypt(token.encode()).decode()
+
 def validateuser(func):
     @wraps(func)
     async def wrapper( *args, **kwargs ):
@@ -206,4 +226,18 @@ def validate_admin(credentials: HTTPAuthorizationCredentials = Depends(security)
         }
         
     except PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token or expired token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token or expired token")
+
+def decode_user_token(token: str) -> dict | None:
+    """
+    Payload de un JWT válido de usuario activo, o None. Para conexiones que no
+    pueden enviar el header Authorization (WebSocket desde el navegador).
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except PyJWTError:
+        return None
+
+    if payload.get("email") is None or payload.get("id") is None or not payload.get("active"):
+        return None
+    return payload
@@ -0,0 +1,71 @@
+"""
+Contenedor de servicios compartidos (MongoDB, proveedor de identidad).
+Todo se crea en el primer uso para que importar la app sea barato.
+"""
+import threading
+
+from utils.mongodb import get_collection, get_mongo_client, close_mongo_client
+
+
+class LazyCollection:
+    """Referencia a una colección que se resuelve al usarla por primera vez"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._collection = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def resolve(self):
+        if self._collection is None:
+            self._collection = get_collection(self._name)
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def reset(self) -> None:
+        self._collection = None
+
+
+class ServiceContainer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections: dict[str, LazyCollection] = {}
+        self._identity = None
+
+    def collection(self, name: str) -> LazyCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = LazyCollection(name)
+            return self._collections[name]
+
+    @property
+    def client(self):
+        return get_mongo_client()
+
+    @property
+    def identity(self):
+        """Proveedor de identidad; Firebase se inicializa aquí y no al importar"""
+        if self._identity is None:
+            with self._lock:
+                if self._identity is None:
+                    from utils.identity import get_identity_provider
+                    self._identity = get_identity_provider()
+        return self._identity
+
+    def warm_up(self) -> None:
+        """Crear los recursos por adelantado (se llama desde el lifespan en un hilo)"""
+        self.client.admin.command("ping")
+        self.identity
+
+    def close(self) -> None:
+        with self._lock:
+            for lazy in self._collections.values():
+                lazy.reset()
+        close_mongo_client()
+
+
+services = ServiceContainer()
@@ -0,0 +1,134 @@
+"""
+Cola de tareas en proceso para el trabajo que no necesita la respuesta HTTP
+(refrescos de caché, limpiezas, agregados). Los controladores encolan y
+responden de inmediato; un número fijo de workers asyncio las ejecuta con
+reintentos, y al apagar la app se espera a que la cola se vacíe.
+"""
+import os
+import asyncio
+import logging
+import inspect
+
+CONCURRENCY = int(os.getenv("TASK_QUEUE_CONCURRENCY", "4"))
+MAX_SIZE = int(os.getenv("TASK_QUEUE_MAX_SIZE", "1000"))
+MAX_ATTEMPTS = int(os.getenv("TASK_QUEUE_MAX_ATTEMPTS", "3"))
+RETRY_DELAY_SECONDS = float(os.getenv("TASK_QUEUE_RETRY_DELAY", "0.5"))
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("TASK_QUEUE_DRAIN_TIMEOUT", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    def __init__(self, func, args: tuple, kwargs: dict, name: str, max_attempts: int):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name
+        self.max_attempts = max_attempts
+        self.attempts = 0
+
+
+class TaskQueue:
+    def __init__(self, concurrency: int = CONCURRENCY, max_size: int = MAX_SIZE,
+                 max_attempts: int = MAX_ATTEMPTS, retry_delay: float = RETRY_DELAY_SECONDS):
+        self._concurrency = concurrency
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._running = 0
+        self._closed = False
+        self.stats = {
+            "enqueued": 0,
+            "completed": 0,
+            "retried": 0,
+            "failed": 0,
+            "dropped": 0,
+            "last_error": None
+        }
+
+    def enqueue(self, func, *args, name: str = None, max_attempts: int = None, **kwargs) -> bool:
+        """
+        Encolar `func(*args, **kwargs)` desde el event loop. Las funciones
+        síncronas (pymongo) corren en un hilo. False si la cola está llena o
+        cerrada: la tarea se descarta y queda contada en metrics.
+        """
+        task = Task(func, args, kwargs, name or func.__name__, max_attempts or self._max_attempts)
+        if self._closed:
+            self.stats["dropped"] += 1
+            logger.warning(f"Task queue closed, dropping {task.name}")
+            return False
+        try:
+            self._queue.put_nowait(task)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.warning(f"Task queue full, dropping {task.name}")
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _execute(self, task: Task) -> None:
+        if inspect.iscoroutinefunction(task.func):
+            await task.func(*task.args, **task.kwargs)
+        else:
+            await asyncio.to_thread(task.func, *task.args, **task.kwargs)
+
+    async def _process(self, task: Task) -> None:
+        while True:
+            task.attempts += 1
+            try:
+                await self._execute(task)
+                self.stats["completed"] += 1
+                return
+            except Exception as e:
+                self.stats["last_error"] = f"{task.name}: {e}"
+                if task.attempts >= task.max_attempts:
+                    self.stats["failed"] += 1
+                    logger.error(f"Task {task.name} failed after {task.attempts} attempts: {e}")
+                    return
+                self.stats["retried"] += 1
+                logger.warning(f"Task {task.name} attempt {task.attempts} failed: {e}")
+                await asyncio.sleep(self._retry_delay * 2 ** (task.attempts - 1))
+
+    async def _worker(self) -> None:
+        while True:
+            task = await self._queue.get()
+            self._running += 1
+            try:
+                await self._process(task)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+
+    async def run(self) -> None:
+        """Tarea del lifespan: mantiene vivos los workers hasta que se cancele"""
+        workers = [asyncio.create_task(self._worker()) for _ in range(self._concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT_SECONDS) -> bool:
+        """
+        Dejar de aceptar tareas y esperar a que terminen las pendientes
+        (llamar antes de cancelar run). False si se agotó el tiempo.
+        """
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Task queue drain timed out with {self._queue.qsize()} pending tasks")
+            return False
+
+    def metrics(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "running": self._running,
+            "concurrency": self._concurrency,
+            "closed": self._closed,
+            **self.stats
+        }
+
+
+task_queue = TaskQueue()